@@ -1,16 +1,26 @@
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
 import time
 import re
 import io
-import pdfplumber
-import PyPDF2
 from datetime import datetime
 import urllib.parse
 import xml.etree.ElementTree as ET
 import os
-from pathlib import Path
+import threading
+import itertools
+import argparse
+from indice_cfdi import IndiceCFDI
+from concurrencia import LimitadorPorHost, procesar_en_paralelo
+from cache_descargas import CacheDescargas
+from plantillas_descarga import EstadisticasPlantillas
+from bitacora_avance import BitacoraAvance
+from enlaces_html import PATRON_PDF, PATRON_PDF_S3, PATRON_XML, PaginaHTML
+from cliente_http import ClienteHTTP, borrar_pdf_temporal, tamano_pdf
+from pipeline_async import CONCURRENCIA_PIPELINE, aiohttp, procesar_en_pipeline
+from pool_pdf import (MAX_PAGINAS_PDF, NIVEL_INCOMPLETO, NIVEL_TABLAS, NIVEL_TEXTO, NIVEL_TIEMPO_EXCEDIDO,
+                      NIVEL_XML, EstadisticasNivelesPDF, LecturaLocalPDF, PoolPDF, TiempoExcedidoPDF,
+                      es_xml_cfdi, extraer_texto_pypdf2, xmls_adjuntos_pdf)
 
 
 class ExtractorFacturasRindeGastosV7:
@@ -18,9 +28,28 @@ class ExtractorFacturasRindeGastosV7:
     Versión 7 con búsqueda adicional en carpeta local de XMLs
     """
 
-    def __init__(self, carpeta_cfdi=None):
-        self.session = requests.Session()
+    def __init__(self, carpeta_cfdi=None, max_workers=4, limitador=None, cache=None,
+                 procesos_pdf=2, timeout_pdf=60, max_paginas_pdf=MAX_PAGINAS_PDF):
         self.carpeta_cfdi = carpeta_cfdi
+        self.indice_cfdi = None
+        self._lock_indice = threading.Lock()
+
+        # Facturas procesadas en paralelo y límite de solicitudes por servidor
+        self.max_workers = max_workers
+        self.limitador = limitador or LimitadorPorHost()
+
+        # Caché local de páginas y PDFs (las corridas repetidas no vuelven a descargar; cache=False la desactiva)
+        self.cache = cache if cache is not None else CacheDescargas()
+
+        # Pool de procesos para leer los PDFs (procesos_pdf <= 0 los lee en el hilo de descarga)
+        self.pool_pdf = PoolPDF(procesos_pdf, timeout_pdf) if procesos_pdf > 0 else None
+        self.max_paginas_pdf = max_paginas_pdf
+
+        # Cuántos PDFs resuelve cada nivel de lectura (capa de texto o tablas)
+        self.niveles_pdf = EstadisticasNivelesPDF()
+
+        # Estadísticas de plantillas de descarga (las que más funcionan se prueban primero)
+        self.plantillas = EstadisticasPlantillas()
 
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -30,7 +59,9 @@ class ExtractorFacturasRindeGastosV7:
             'Connection': 'keep-alive',
         }
 
-        self.session.headers.update(self.headers)
+        # Sesión compartida por los hilos: conexiones reutilizadas y reintentos con backoff
+        self.cliente = ClienteHTTP(max_workers=max_workers, limitador=self.limitador, headers=self.headers)
+        self.session = self.cliente.session
 
         # Palabras que NO son productos (filtros mejorados)
         self.palabras_excluir = [
@@ -43,6 +74,12 @@ class ExtractorFacturasRindeGastosV7:
             'NO ENCONTRADA', 'MÉTODO DE PAGO', 'FORMA DE PAGO', 'USO CFDI'
         ]
 
+    def cerrar(self):
+        """Libera el pool de procesos de PDFs y el cliente HTTP"""
+        if self.pool_pdf is not None:
+            self.pool_pdf.cerrar()
+        self.cliente.cerrar()
+
     def buscar_xml_local(self, comercio, fecha, total):
         """
         Busca el XML correspondiente en la carpeta local
@@ -61,79 +98,13 @@ class ExtractorFacturasRindeGastosV7:
         except:
             fecha_factura = None
 
-        archivos_xml = []
-
-        # Buscar todos los XMLs en la carpeta
-        for archivo in Path(self.carpeta_cfdi).glob("*.xml"):
-            try:
-                tree = ET.parse(archivo)
-                root = tree.getroot()
-
-                # Namespaces comunes en CFDI
-                ns = {
-                    'cfdi': 'http://www.sat.gob.mx/cfd/4',
-                    'cfdi3': 'http://www.sat.gob.mx/cfd/3',
-                    'tfd': 'http://www.sat.gob.mx/TimbreFiscalDigital'
-                }
-
-                # Intentar con CFDI 4.0
-                comprobante = root.find('.', ns)
-                if comprobante is None:
-                    # Intentar con CFDI 3.3
-                    ns['cfdi'] = ns['cfdi3']
-                    comprobante = root
-
-                # Extraer datos del XML
-                total_xml = float(comprobante.get('Total', '0'))
-                fecha_xml = comprobante.get('Fecha', '')
-
-                # Nombre del emisor
-                emisor = root.find('.//cfdi:Emisor', ns)
-                if emisor is not None:
-                    nombre_emisor = emisor.get('Nombre', '')
-                else:
-                    nombre_emisor = ''
-
-                # Comparar por total (con tolerancia de centavos)
-                if abs(total_xml - total) < 0.10:
-                    archivos_xml.append({
-                        'archivo': archivo,
-                        'total': total_xml,
-                        'fecha': fecha_xml,
-                        'emisor': nombre_emisor,
-                        'coincidencia_total': True
-                    })
-                    print(f"      ✅ Coincidencia por total encontrada: {archivo.name}")
-
-                # Si no hay coincidencia por total, buscar por fecha y nombre similar
-                elif fecha_factura and fecha_xml:
-                    try:
-                        fecha_xml_dt = datetime.strptime(fecha_xml[:10], "%Y-%m-%d")
-                        # Si la fecha coincide y el nombre es similar
-                        if fecha_xml_dt.date() == fecha_factura.date():
-                            if comercio.upper() in nombre_emisor.upper() or nombre_emisor.upper() in comercio.upper():
-                                archivos_xml.append({
-                                    'archivo': archivo,
-                                    'total': total_xml,
-                                    'fecha': fecha_xml,
-                                    'emisor': nombre_emisor,
-                                    'coincidencia_total': False
-                                })
-                                print(f"      ⚠️ Posible coincidencia por fecha/nombre: {archivo.name}")
-                    except:
-                        pass
+        # El índice se construye una sola vez y se reutiliza en cada búsqueda
+        with self._lock_indice:
+            if self.indice_cfdi is None:
+                print("   📇 Construyendo índice de XMLs locales...")
+                self.indice_cfdi = IndiceCFDI(self.carpeta_cfdi)
 
-            except Exception as e:
-                print(f"      ❌ Error leyendo {archivo.name}: {str(e)[:50]}")
-                continue
-
-        # Si encontramos archivos, retornar el mejor match
-        if archivos_xml:
-            # Priorizar coincidencias por total
-            archivos_xml.sort(key=lambda x: (x['coincidencia_total'], -x['total']), reverse=True)
-            return archivos_xml[0]['archivo']
-
-        return None
+        return self.indice_cfdi.buscar(comercio, fecha_factura, total)
 
     def procesar_xml_cfdi(self, archivo_xml):
         """
@@ -194,88 +165,144 @@ class ExtractorFacturasRindeGastosV7:
         try:
             print(f"🔍 Accediendo a: {url}")
 
-            # Obtener página
-            response = self.session.get(url, headers=self.headers, timeout=20)
-            response.raise_for_status()
+            # Obtener página (primero desde la caché local)
+            en_cache = self.cache.obtener(url) if self.cache else None
 
-            soup = BeautifulSoup(response.content, 'html.parser')
+            if en_cache:
+                contenido_html = en_cache[0]
+                print("   💾 Página desde caché")
+            else:
+                # Si la página caducó en la caché, solo se revalida (ETag / Last-Modified)
+                status_code, _, contenido_html = self.cliente.get_con_cache(url, self.cache, self.headers, 20)
+                if status_code != 200:
+                    raise requests.HTTPError(f"{status_code} Error al obtener la página: {url}")
 
             resultado = {
                 'descripcion': "No encontrada",
                 'folio_fiscal': "No encontrado"
             }
 
-            # Buscar enlaces PDF mejorado
-            enlaces_pdf = self.buscar_enlaces_pdf_mejorado(soup, url)
-
-            # Si no hay enlaces directos, construir URLs
-            if not enlaces_pdf:
-                enlaces_pdf = self.construir_urls_descarga(url)
+            enlaces_pdf, enlaces_xml, texto_html = self.analizar_pagina(contenido_html, url)
 
-            # Procesar PDFs
+            # Un XML enlazado es exacto y evita descargar y analizar el PDF
             pdf_procesado = False
 
-            for enlace in enlaces_pdf:
+            for enlace in enlaces_xml:
+                xml_content = self.descargar_xml(enlace, url)
+
+                if xml_content:
+                    resultado_xml = self.procesar_xml_cfdi(io.BytesIO(xml_content))
+                    if self.xml_con_folio(resultado_xml):
+                        resultado = resultado_xml
+                        pdf_procesado = True
+                        break
+
+            # Procesar PDFs: solo se descargan los candidatos confirmados como PDF
+            for enlace in ([] if pdf_procesado else self.enlaces_pdf_confirmados(enlaces_pdf, url)):
                 pdf_content = self.descargar_pdf(enlace, url)
 
                 if pdf_content:
-                    resultado = self.procesar_pdf_mejorado(pdf_content)
+                    try:
+                        resultado = self.procesar_pdf_mejorado(pdf_content)
+                    finally:
+                        borrar_pdf_temporal(pdf_content)
                     pdf_procesado = True
                     break
 
             # Si no se pudo procesar PDF, intentar HTML
             if not pdf_procesado:
                 print("   ⚠️ No se pudo procesar PDF, extrayendo del HTML...")
-                texto_html = soup.get_text()
                 resultado = self.procesar_texto_factura_mejorado(texto_html)
 
-            # Si no encontramos nada útil, buscar en carpeta local
-            if (resultado['descripcion'] in ["No encontrada", "Númerodepedimento", "P. Unitario"] or
-                    resultado['folio_fiscal'] == "No encontrado"):
+            return self.completar_con_xml_local(resultado, comercio, fecha, total)
 
-                if self.carpeta_cfdi and comercio and total:
-                    print("   📂 Buscando en carpeta local de XMLs...")
-                    xml_local = self.buscar_xml_local(comercio, fecha, total)
+        except Exception as e:
+            return self.resultado_por_error(e, comercio, fecha, total)
 
-                    if xml_local:
-                        print(f"   ✅ XML encontrado localmente: {xml_local.name}")
-                        resultado_xml = self.procesar_xml_cfdi(xml_local)
+    def analizar_pagina(self, contenido_html, url):
+        """
+        Enlaces de la página del comprobante y su texto (para extraer del HTML si no hay documento)
+        Si no hay enlaces directos a PDFs se construyen las URLs de descarga
+        Devuelve (enlaces_pdf, enlaces_xml, texto_html)
+        """
+        # Una sola pasada sobre el HTML: enlaces, iframes y texto, sin construir el árbol
+        pagina = PaginaHTML(contenido_html)
 
-                        # Actualizar solo si encontramos mejores datos
-                        if resultado_xml['descripcion'] != "No encontrada":
-                            resultado['descripcion'] = resultado_xml['descripcion'] + " (XML local)"
-                        if resultado_xml['folio_fiscal'] != "No encontrado":
-                            resultado['folio_fiscal'] = resultado_xml['folio_fiscal']
+        # Buscar enlaces PDF mejorado (y XMLs enlazados desde la página)
+        enlaces_pdf, enlaces_xml = self.buscar_enlaces_pdf_mejorado(pagina, url)
 
-            return resultado
+        # Si no hay enlaces directos, construir URLs
+        if not enlaces_pdf:
+            enlaces_pdf = self.construir_urls_descarga(url)
 
-        except Exception as e:
-            print(f"   ❌ Error general: {str(e)[:100]}")
+        return enlaces_pdf, enlaces_xml, pagina.texto
+
+    def completar_con_xml_local(self, resultado, comercio, fecha, total):
+        """
+        Si no encontramos nada útil, busca el XML en la carpeta local y completa el resultado
+        """
+        if (resultado['descripcion'] in ["No encontrada", "Númerodepedimento", "P. Unitario"] or
+                resultado['folio_fiscal'] == "No encontrado"):
 
-            # Intentar búsqueda local como último recurso
             if self.carpeta_cfdi and comercio and total:
-                print("   📂 Intentando búsqueda local como último recurso...")
+                print("   📂 Buscando en carpeta local de XMLs...")
                 xml_local = self.buscar_xml_local(comercio, fecha, total)
 
                 if xml_local:
                     print(f"   ✅ XML encontrado localmente: {xml_local.name}")
-                    return self.procesar_xml_cfdi(xml_local)
+                    resultado_xml = self.procesar_xml_cfdi(xml_local)
 
-            return {
-                'descripcion': f"Error: {str(e)[:50]}",
-                'folio_fiscal': f"Error: {str(e)[:50]}"
-            }
+                    # Actualizar solo si encontramos mejores datos
+                    if resultado_xml['descripcion'] != "No encontrada":
+                        resultado['descripcion'] = resultado_xml['descripcion'] + " (XML local)"
+                    if resultado_xml['folio_fiscal'] != "No encontrado":
+                        resultado['folio_fiscal'] = resultado_xml['folio_fiscal']
+
+        return resultado
 
-    def buscar_enlaces_pdf_mejorado(self, soup, url_original):
+    def resultado_por_error(self, error, comercio, fecha, total):
         """
-        Busca enlaces a PDFs con estrategia mejorada
+        Resultado de una factura que falló: el XML local como último recurso o el error
+        """
+        print(f"   ❌ Error general: {str(error)[:100]}")
+
+        # Intentar búsqueda local como último recurso
+        if self.carpeta_cfdi and comercio and total:
+            print("   📂 Intentando búsqueda local como último recurso...")
+            xml_local = self.buscar_xml_local(comercio, fecha, total)
+
+            if xml_local:
+                print(f"   ✅ XML encontrado localmente: {xml_local.name}")
+                return self.procesar_xml_cfdi(xml_local)
+
+        return {
+            'descripcion': f"Error: {str(error)[:50]}",
+            'folio_fiscal': f"Error: {str(error)[:50]}"
+        }
+
+    def buscar_enlaces_pdf_mejorado(self, pagina, url_original):
+        """
+        Busca enlaces a PDFs con estrategia mejorada en una PaginaHTML
+        Devuelve (enlaces_pdf, enlaces_xml): los enlaces a XML de CFDI se separan de los PDFs
         """
         enlaces_pdf = []
+        enlaces_xml = []
 
         # Buscar en todos los enlaces
-        for link in soup.find_all('a'):
-            href = link.get('href', '')
-            texto = link.get_text(strip=True).lower()
+        for href, texto in pagina.anclas:
+            texto = texto.lower()
+
+            # Enlaces al XML del CFDI (p. ej. "Descargar XML")
+            ruta = urllib.parse.urlparse(href).path.lower()
+            es_xml = (ruta.endswith('.xml') or re.search(r'[?&](?:format|tipo)=xml\b', href, re.I) or
+                      ('xml' in texto and 'pdf' not in texto and not ruta.endswith('.pdf')))
+            if href and es_xml:
+                if href.startswith('/'):
+                    href = '/'.join(url_original.split('/')[:3]) + href
+                if href.startswith('http') and href not in enlaces_xml:
+                    enlaces_xml.append(href)
+                    print(f"   🎯 XML encontrado: {href[:60]}...")
+                continue
 
             # Condiciones mejoradas
             if href and (
@@ -294,9 +321,7 @@ class ExtractorFacturasRindeGastosV7:
                     enlaces_pdf.append(enlace_completo)
 
         # Buscar en iframes
-        for iframe in soup.find_all('iframe'):
-            src = iframe.get('src', '')
-
+        for src in pagina.iframes:
             if src and ('pdf' in src.lower() or 'viewer' in src.lower()):
                 # Extraer URL del PDF del parámetro file
                 if 'file=' in src:
@@ -310,24 +335,26 @@ class ExtractorFacturasRindeGastosV7:
                     except:
                         pass
 
-        # Buscar en el texto/scripts de la página
-        page_text = str(soup)
-        # Buscar URLs de S3 o PDFs en el código
-        s3_pattern = r'https?://[^\s\'"]+\.s3\.amazonaws\.com/[^\s\'"]+\.pdf'
-        pdf_pattern = r'https?://[^\s\'"]+\.pdf'
+        # Buscar URLs de S3 o PDFs en el código de la página (el HTML tal como llegó, sin reserializarlo)
+        page_text = pagina.fuente
 
-        for pattern in [s3_pattern, pdf_pattern]:
-            matches = re.findall(pattern, page_text, re.IGNORECASE)
-            for match in matches:
+        for pattern in [PATRON_PDF_S3, PATRON_PDF]:
+            for match in pattern.findall(page_text):
                 if match not in enlaces_pdf:
                     enlaces_pdf.append(match)
                     print(f"   🎯 PDF en código: {match[:60]}...")
 
-        return enlaces_pdf
+        # XMLs en el código de la página
+        for match in PATRON_XML.findall(page_text):
+            if match not in enlaces_xml:
+                enlaces_xml.append(match)
+                print(f"   🎯 XML en código: {match[:60]}...")
+
+        return enlaces_pdf, enlaces_xml
 
     def construir_urls_descarga(self, url):
         """
-        Construye URLs de descarga posibles
+        Construye URLs de descarga posibles, ordenadas por tasa de éxito histórica
         """
         enlaces = []
 
@@ -339,59 +366,233 @@ class ExtractorFacturasRindeGastosV7:
             key = key_match.group(1)
 
             # URLs comunes
-            enlaces.extend([
-                f"{url}&download=1",
-                f"{url}&format=pdf",
-                f"{url}&tipo=pdf",
-                f"https://www.rindegastos.com/document/download/{receipt_id}?key={key}",
-                f"https://web.rindegastos.com/document/download/{receipt_id}?key={key}",
-                url.replace('/receipt', '/download')
-            ])
+            enlaces = self.plantillas.construir([
+                'receipt_download',
+                'receipt_format_pdf',
+                'receipt_tipo_pdf',
+                'www_document_download',
+                'web_document_download',
+                'ruta_download'
+            ], url, receipt_id, key)
 
         return enlaces
 
+    def headers_pdf(self, referer):
+        """Encabezados para pedir un PDF"""
+        pdf_headers = self.headers.copy()
+        pdf_headers.update({
+            'Accept': 'application/pdf,application/octet-stream,*/*',
+            'Referer': referer
+        })
+        return pdf_headers
+
+    def enlaces_pdf_confirmados(self, enlaces_pdf, referer):
+        """
+        Genera los candidatos a descargar: primero los que ya están vigentes en la caché; el resto
+        se sondea en paralelo (solo el primer KB) y se generan únicamente los que responden con un PDF
+        El sondeo ocurre solo si ningún candidato de la caché sirvió
+        """
+        pendientes = []
+        for enlace in enlaces_pdf:
+            if self.cache and self.cache.vigente(enlace):
+                yield enlace
+            else:
+                pendientes.append(enlace)
+
+        if not pendientes:
+            return
+
+        print(f"   🔎 Sondeando {len(pendientes)} candidato(s) de descarga...")
+        confirmadas, descartadas = self.cliente.resolver_pdfs(pendientes, headers=self.headers_pdf(referer))
+
+        self.plantillas.registrar_sondeo(confirmadas, descartadas)
+        if not confirmadas:
+            print(f"   ⚠️ Ningún candidato respondió con un PDF")
+
+        yield from confirmadas
+
     def descargar_pdf(self, url_pdf, referer):
         """
-        Descarga el PDF con reintentos
+        Descarga el PDF (los PDFs válidos se guardan en la caché local)
+        Devuelve bytes, la Path de un archivo temporal (PDFs grandes) o None
         """
-        for intento in range(3):
-            try:
-                print(f"   📥 Descargando (intento {intento + 1}): {url_pdf[:80]}...")
+        en_cache = self.cache.obtener(url_pdf) if self.cache else None
+        if en_cache:
+            content = en_cache[0]
+            if len(content) > 1000 and (content.startswith(b'%PDF') or b'%PDF' in content[:1024]):
+                print(f"   💾 PDF desde caché: {len(content):,} bytes")
+                self.plantillas.registrar(url_pdf, True)
+                return content
+
+            print(f"   💾 En caché: no es un PDF válido")
+            self.plantillas.registrar(url_pdf, False)
+            return None
+
+        try:
+            print(f"   📥 Descargando: {url_pdf[:80]}...")
+
+            # Los reintentos (5xx, 429, timeouts) y el backoff los maneja el cliente HTTP; la respuesta
+            # se lee por bloques y se descarta en cuanto el primer KB no es de un PDF. Si el PDF
+            # caducó en la caché, solo se revalida (ETag / Last-Modified)
+            status_code, content_type, pdf = self.cliente.descargar_pdf(
+                url_pdf, headers=self.headers_pdf(referer), timeout=30, cache=self.cache)
+            self.plantillas.registrar_descarga(url_pdf, status_code, pdf)
+
+            if pdf is not None:
+                print(f"   ✅ PDF descargado: {tamano_pdf(pdf):,} bytes")
+                return pdf
+            elif status_code != 200:
+                print(f"   ❌ Error HTTP: {status_code}")
+
+        except Exception as e:
+            print(f"   ❌ Error descarga: {str(e)[:50]}")
+
+        return None
+
+    def descargar_xml(self, url_xml, referer):
+        """
+        Descarga el XML de un CFDI enlazado desde la página (un intento; se guarda en la caché local)
+        Devuelve los bytes solo si parecen un CFDI
+        """
+        en_cache = self.cache.obtener(url_xml) if self.cache else None
+
+        try:
+            if en_cache:
+                content = en_cache[0]
+                print(f"   💾 XML desde caché: {len(content):,} bytes")
+            else:
+                print(f"   📥 Descargando XML: {url_xml[:80]}...")
 
-                pdf_headers = self.headers.copy()
-                pdf_headers.update({
-                    'Accept': 'application/pdf,application/octet-stream,*/*',
+                xml_headers = self.headers.copy()
+                xml_headers.update({
+                    'Accept': 'application/xml,text/xml,*/*',
                     'Referer': referer
                 })
 
-                response = self.session.get(url_pdf, headers=pdf_headers, timeout=30, stream=True)
+                status_code, _, content = self.cliente.get_con_cache(url_xml, self.cache, xml_headers, 30)
+
+                if status_code != 200:
+                    print(f"   ❌ Error HTTP: {status_code}")
+                    return None
+
+        except Exception as e:
+            print(f"   ❌ Error descarga: {str(e)[:50]}")
+            return None
+
+        if not es_xml_cfdi(content):
+            print(f"   ⚠️ No es un XML de CFDI")
+            return None
+
+        print(f"   ✅ XML de CFDI descargado")
+        return content
+
+    @staticmethod
+    def xml_con_folio(resultado):
+        """True si el XML se leyó y trae el UUID del timbre"""
+        return resultado['folio_fiscal'] not in ("No encontrado", "Error al procesar XML")
 
-                if response.status_code == 200:
-                    content = response.content
+    def documento_pdf(self):
+        """
+        Contexto para leer un PDF en el pool de procesos (o en este hilo si procesos_pdf <= 0)
+        Todos los niveles del documento comparten un solo tiempo máximo
+        """
+        if self.pool_pdf is None:
+            return LecturaLocalPDF(self.max_paginas_pdf)
+        return self.pool_pdf.documento(self.max_paginas_pdf)
 
-                    # Verificar que sea PDF
-                    if len(content) > 1000 and (
-                            content.startswith(b'%PDF') or
-                            b'%PDF' in content[:1024]
-                    ):
-                        print(f"   ✅ PDF descargado: {len(content):,} bytes")
-                        return content
-                    else:
-                        print(f"   ⚠️ No es un PDF válido")
+    def procesar_pdf_mejorado(self, pdf_content):
+        """
+        Procesa el PDF por niveles, del más barato al más caro:
+        0. XML del CFDI adjunto al PDF: exacto y sin analizar las páginas
+        1. Capa de texto con PyPDF2: basta en los CFDI impresos por sistema
+        2. Texto y tablas con pdfplumber, solo si al nivel 1 le faltó descripción o folio
+        La lectura corre en el pool de procesos, así los hilos siguen descargando, con un solo
+        tiempo máximo para los tres niveles
+        """
+        inicio = time.perf_counter()
+
+        try:
+            with self.documento_pdf() as documento:
+                resultado = self.procesar_pdf_xml(documento, pdf_content)
+
+                if resultado is not None:
+                    nivel = NIVEL_XML
                 else:
-                    print(f"   ❌ Error HTTP: {response.status_code}")
+                    resultado = self.procesar_pdf_texto(documento, pdf_content)
+                    nivel = NIVEL_TEXTO
+
+                if nivel == NIVEL_TEXTO and not self.resultado_completo(resultado):
+                    resultado_tablas = self.procesar_pdf_tablas(documento, pdf_content)
 
-            except Exception as e:
-                print(f"   ❌ Error descarga: {str(e)[:50]}")
+                    # Lo que encuentre pdfplumber tiene prioridad; lo demás queda del nivel 1
+                    if resultado_tablas['descripcion'] != "No encontrada":
+                        resultado['descripcion'] = resultado_tablas['descripcion']
+                    if resultado_tablas['folio_fiscal'] != "No encontrado":
+                        resultado['folio_fiscal'] = resultado_tablas['folio_fiscal']
 
-            if intento < 2:
-                time.sleep(1)
+                    nivel = NIVEL_TABLAS if self.resultado_completo(resultado) else NIVEL_INCOMPLETO
+
+        except TiempoExcedidoPDF as e:
+            print(f"   ⏱️ PDF descartado, tiempo excedido ({e})")
+            resultado = {
+                'descripcion': "No encontrada",
+                'folio_fiscal': "No encontrado"
+            }
+            nivel = NIVEL_TIEMPO_EXCEDIDO
+
+        self.niveles_pdf.registrar(nivel, time.perf_counter() - inicio)
+        return resultado
+
+    @staticmethod
+    def resultado_completo(resultado):
+        """True si ya se tienen descripción y folio fiscal"""
+        return resultado['descripcion'] != "No encontrada" and resultado['folio_fiscal'] != "No encontrado"
+
+    def procesar_pdf_xml(self, documento, pdf_content):
+        """
+        Nivel 0: XML del CFDI adjunto al PDF (EmbeddedFiles), leído con procesar_xml_cfdi
+        Devuelve None si el PDF no trae un XML con timbre
+        """
+        try:
+            adjuntos = documento.ejecutar(xmls_adjuntos_pdf, pdf_content)
+        except TiempoExcedidoPDF:
+            raise
+        except Exception as e:
+            print(f"   ⚠️ Error buscando XML adjunto: {str(e)[:50]}")
+            return None
+
+        for nombre, xml_content in adjuntos:
+            print(f"   📎 XML adjunto al PDF: {nombre}")
+            resultado = self.procesar_xml_cfdi(io.BytesIO(xml_content))
+            if self.xml_con_folio(resultado):
+                return resultado
 
         return None
 
-    def procesar_pdf_mejorado(self, pdf_content):
+    def procesar_pdf_texto(self, documento, pdf_content):
         """
-        Procesa el PDF con estrategias mejoradas
+        Nivel 1: descripción y folio desde la capa de texto del PDF (PyPDF2, sin analizar tablas)
+        """
+        try:
+            texto_completo = documento.ejecutar(extraer_texto_pypdf2, pdf_content, self.max_paginas_pdf)
+
+            if texto_completo:
+                return self.procesar_texto_factura_mejorado(texto_completo)
+
+        except TiempoExcedidoPDF:
+            raise
+        except Exception as e:
+            print(f"   ⚠️ Error con PyPDF2: {e}")
+
+        return {
+            'descripcion': "No encontrada",
+            'folio_fiscal': "No encontrado"
+        }
+
+    def procesar_pdf_tablas(self, documento, pdf_content):
+        """
+        Nivel 2: texto y tablas con pdfplumber
+        Las páginas se leen en orden y se deja de leer en cuanto hay descripción y folio fiscal
         """
         resultado = {
             'descripcion': "No encontrada",
@@ -399,63 +600,47 @@ class ExtractorFacturasRindeGastosV7:
         }
 
         try:
-            with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
-                texto_completo = ""
-                productos_encontrados = []
-
-                for page_num, page in enumerate(pdf.pages):
-                    print(f"   📄 Procesando página {page_num + 1}")
-
-                    # Extraer texto
-                    texto = page.extract_text()
-                    if texto:
-                        texto_completo += texto + "\n"
-
-                    # Extraer y procesar tablas
-                    tablas = page.extract_tables()
-                    if tablas:
-                        for tabla in tablas:
-                            productos_tabla = self.extraer_productos_de_tabla(tabla)
-                            productos_encontrados.extend(productos_tabla)
-
-                # Buscar folio fiscal
-                resultado['folio_fiscal'] = self.extraer_folio_fiscal(texto_completo)
+            texto_completo = ""
+            productos_validos = []
 
-                # Si encontramos productos en las tablas
-                if productos_encontrados:
-                    # Filtrar productos válidos
-                    productos_validos = []
-                    for prod in productos_encontrados:
-                        if self.es_producto_valido(prod):
-                            productos_validos.append(prod)
-
-                    if productos_validos:
-                        # Tomar hasta 3 productos
-                        resultado['descripcion'] = ", ".join(productos_validos[:3])
-                        print(f"   ✅ Productos encontrados: {len(productos_validos)}")
-
-                # Si no hay productos en tablas, buscar en texto
-                if resultado['descripcion'] == "No encontrada":
-                    productos_texto = self.buscar_productos_en_texto_mejorado(texto_completo)
-                    if productos_texto:
-                        resultado['descripcion'] = ", ".join(productos_texto[:3])
+            for page_num, (texto, tablas) in enumerate(documento.paginas(pdf_content)):
+                print(f"   📄 Procesando página {page_num + 1}")
 
-        except Exception as e:
-            print(f"   ⚠️ Error procesando PDF: {e}")
+                # Extraer texto
+                if texto:
+                    texto_completo += texto + "\n"
 
-            # Intentar con PyPDF2
-            try:
-                reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-                texto_completo = ""
+                # Extraer y procesar tablas (solo productos válidos)
+                if tablas:
+                    for tabla in tablas:
+                        for prod in self.extraer_productos_de_tabla(tabla):
+                            if self.es_producto_valido(prod):
+                                productos_validos.append(prod)
+
+                # Buscar folio fiscal en lo leído hasta ahora
+                resultado['folio_fiscal'] = self.extraer_folio_fiscal(texto_completo)
+
+                # Con productos y folio ya no hace falta leer las demás páginas
+                if productos_validos and resultado['folio_fiscal'] != "No encontrado":
+                    print(f"   ⏩ Descripción y folio encontrados en {page_num + 1} página(s)")
+                    break
 
-                for page in reader.pages:
-                    texto_completo += page.extract_text() + "\n"
+            # Si encontramos productos en las tablas
+            if productos_validos:
+                # Tomar hasta 3 productos
+                resultado['descripcion'] = ", ".join(productos_validos[:3])
+                print(f"   ✅ Productos encontrados: {len(productos_validos)}")
 
-                if texto_completo:
-                    resultado = self.procesar_texto_factura_mejorado(texto_completo)
+            # Si no hay productos en tablas, buscar en texto
+            if resultado['descripcion'] == "No encontrada":
+                productos_texto = self.buscar_productos_en_texto_mejorado(texto_completo)
+                if productos_texto:
+                    resultado['descripcion'] = ", ".join(productos_texto[:3])
 
-            except Exception as e2:
-                print(f"   ❌ Error con PyPDF2: {e2}")
+        except TiempoExcedidoPDF:
+            raise
+        except Exception as e:
+            print(f"   ⚠️ Error procesando PDF: {e}")
 
         return resultado
 
@@ -598,9 +783,14 @@ class ExtractorFacturasRindeGastosV7:
 
         return resultado
 
-    def procesar_excel(self, archivo_entrada, archivo_salida):
+    def procesar_excel(self, archivo_entrada, archivo_salida, reanudar=False, usar_async=False,
+                       concurrencia=CONCURRENCIA_PIPELINE):
         """
         Procesa el archivo Excel
+        Cada resultado se guarda en una bitácora junto al archivo de salida; con reanudar=True
+        se omiten las facturas que ya terminaron en una corrida anterior
+        Con usar_async=True las facturas pasan por el pipeline asíncrono (pipeline_async), con
+        hasta `concurrencia` en curso, en lugar del pool de hilos
         """
         print("\n" + "=" * 80)
         print("🚀 EXTRACTOR DE FACTURAS RINDEGASTOS V7 - CON BÚSQUEDA LOCAL")
@@ -645,24 +835,65 @@ class ExtractorFacturasRindeGastosV7:
             print(f"📂 Carpeta XMLs: {self.carpeta_cfdi}")
         print(f"{'=' * 80}\n")
 
+        # Bitácora de avance para poder reanudar una corrida interrumpida
+        bitacora = BitacoraAvance(archivo_salida + '.avance.jsonl', reanudar=reanudar)
+
+        # Tareas a procesar (índice de fila -> argumentos) y resultados ya guardados
+        tareas = []
+        reanudadas = []
         for idx in range(len(df_facturas)):
             fila = df_facturas.iloc[idx]
             url = fila['URL']
-            comercio = fila['Comercio']
-            total = fila['Total']
-            fecha = fila['Fecha']
 
             if pd.isna(url) or not url:
                 continue
 
-            print(f"\n{'─' * 70}")
-            print(f"📄 Factura {idx + 1}/{len(df_facturas)}")
-            print(f"🏪 Comercio: {comercio}")
-            print(f"💰 Total: ${total:,.2f}")
-            print(f"📅 Fecha: {fecha}")
+            clave = BitacoraAvance.clave_comprobante(url)
+            if clave in bitacora.completados:
+                reanudadas.append((idx, bitacora.completados[clave], None))
+            else:
+                tareas.append((idx, (url, fila['Comercio'], fila['Fecha'], fila['Total'])))
 
-            # Procesar factura
-            resultado = self.extraer_datos_factura(url, comercio, fecha, total)
+        if reanudadas:
+            print(f"⏩ Reanudando: {len(reanudadas)} facturas ya procesadas en la corrida anterior")
+
+        if usar_async and aiohttp is None:
+            print("⚠️ El pipeline asíncrono requiere aiohttp (pip install aiohttp): se usan hilos")
+            usar_async = False
+
+        # Procesar facturas en paralelo; cada resultado se escribe en su propia fila
+        if usar_async:
+            print(f"⚙️ Procesando {len(tareas)} facturas en un pipeline asíncrono "
+                  f"(hasta {concurrencia} en curso, {self.max_workers} hilos de lectura)\n")
+            pendientes = procesar_en_pipeline(self, tareas, concurrencia)
+        else:
+            print(f"⚙️ Procesando {len(tareas)} facturas con {self.max_workers} hilos en paralelo\n")
+            pendientes = procesar_en_paralelo(tareas, self.extraer_datos_factura, self.max_workers)
+
+        total_tareas = len(reanudadas) + len(tareas)
+        completadas = 0
+        resultados = itertools.chain(reanudadas, pendientes)
+
+        for idx, resultado, error in resultados:
+            fila = df_facturas.iloc[idx]
+            completadas += 1
+
+            if error is not None:
+                resultado = {
+                    'descripcion': f"Error: {str(error)[:50]}",
+                    'folio_fiscal': f"Error: {str(error)[:50]}"
+                }
+
+            # Los errores no se guardan, para reintentarlos al reanudar
+            clave = BitacoraAvance.clave_comprobante(fila['URL'])
+            if clave not in bitacora.completados and "Error" not in resultado['descripcion']:
+                bitacora.registrar(clave, resultado)
+
+            print(f"\n{'─' * 70}")
+            print(f"📄 Factura {idx + 1}/{len(df_facturas)} ({completadas}/{total_tareas} completadas)")
+            print(f"🏪 Comercio: {fila['Comercio']}")
+            print(f"💰 Total: ${fila['Total']:,.2f}")
+            print(f"📅 Fecha: {fila['Fecha']}")
 
             # Guardar resultados
             df_facturas.at[idx, 'Descripción'] = resultado['descripcion']
@@ -692,20 +923,19 @@ class ExtractorFacturasRindeGastosV7:
                 errores += 1
 
             # Progreso cada 5 facturas
-            if (idx + 1) % 5 == 0:
+            if completadas % 5 == 0:
                 print(f"\n{'=' * 50}")
-                print(f"📊 PROGRESO: {idx + 1}/{len(df_facturas)} ({(idx + 1) / len(df_facturas) * 100:.1f}%)")
-                print(f"   ✅ Descripciones válidas: {exitosas_desc}/{idx + 1} ({exitosas_desc / (idx + 1) * 100:.1f}%)")
-                print(f"   ✅ Folios: {exitosas_folio}/{idx + 1} ({exitosas_folio / (idx + 1) * 100:.1f}%)")
+                print(f"📊 PROGRESO: {completadas}/{total_tareas} ({completadas / total_tareas * 100:.1f}%)")
+                print(f"   ✅ Descripciones válidas: {exitosas_desc}/{completadas} ({exitosas_desc / completadas * 100:.1f}%)")
+                print(f"   ✅ Folios: {exitosas_folio}/{completadas} ({exitosas_folio / completadas * 100:.1f}%)")
                 print(f"   📂 Desde XML local: {desde_xml_local}")
                 print(f"{'=' * 50}\n")
 
-            # Pausa entre requests
-            time.sleep(2)
-
         # Guardar resultados
         print(f"\n💾 Guardando resultados...")
         df_facturas.to_excel(archivo_salida, index=False)
+        self.plantillas.guardar()
+        bitacora.cerrar()
 
         # Resumen final
         tiempo_total = time.time() - tiempo_inicio
@@ -721,6 +951,12 @@ class ExtractorFacturasRindeGastosV7:
         print(f"   📂 Encontradas en XML local: {desde_xml_local}")
         print(f"   ❌ Errores: {errores}")
         print(f"   ⏱️ Tiempo total: {tiempo_total / 60:.1f} minutos")
+        if self.cache:
+            print(f"   {self.cache.resumen()}")
+        print(f"\n📥 PLANTILLAS DE DESCARGA:")
+        print(self.plantillas.resumen())
+        print(f"\n📄 NIVELES DE LECTURA DE PDF:")
+        print(self.niveles_pdf.resumen())
 
         # Mostrar facturas problemáticas
         print(f"\n📋 FACTURAS SIN DESCRIPCIÓN VÁLIDA:")
@@ -745,6 +981,21 @@ class ExtractorFacturasRindeGastosV7:
 
 # ========== PROGRAMA PRINCIPAL ==========
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extractor de facturas RindeGastos V7")
+    parser.add_argument('--resume', dest='reanudar', action='store_true',
+                        help="Reanudar una corrida interrumpida omitiendo las facturas ya procesadas")
+    parser.add_argument('--procesos-pdf', dest='procesos_pdf', type=int, default=2,
+                        help="Procesos para leer PDFs (0 = leerlos en los hilos de descarga)")
+    parser.add_argument('--timeout-pdf', dest='timeout_pdf', type=int, default=60,
+                        help="Segundos máximos para leer un PDF antes de descartarlo")
+    parser.add_argument('--max-paginas-pdf', dest='max_paginas_pdf', type=int, default=MAX_PAGINAS_PDF,
+                        help="Páginas que se leen como máximo de cada PDF")
+    parser.add_argument('--async', dest='usar_async', action='store_true',
+                        help="Procesar con el pipeline asíncrono (requiere aiohttp)")
+    parser.add_argument('--concurrencia', type=int, default=CONCURRENCIA_PIPELINE,
+                        help="Facturas en curso a la vez en el pipeline asíncrono")
+    args = parser.parse_args()
+
     print("\n" + "=" * 80)
     print("🚀 EXTRACTOR DE FACTURAS RINDEGASTOS V7 - CON BÚSQUEDA LOCAL")
     print("   • Búsqueda en carpeta local de XMLs como fallback")
@@ -790,18 +1041,24 @@ if __name__ == "__main__":
     respuesta = input("\n¿Iniciar procesamiento? (s/n): ")
 
     if respuesta.lower() == 's':
-        extractor = ExtractorFacturasRindeGastosV7(carpeta_cfdi=carpeta_cfdi)
+        extractor = ExtractorFacturasRindeGastosV7(carpeta_cfdi=carpeta_cfdi, procesos_pdf=args.procesos_pdf,
+                                                   timeout_pdf=args.timeout_pdf,
+                                                   max_paginas_pdf=args.max_paginas_pdf)
 
         try:
-            extractor.procesar_excel(archivo_entrada, archivo_salida)
+            extractor.procesar_excel(archivo_entrada, archivo_salida, reanudar=args.reanudar,
+                                     usar_async=args.usar_async, concurrencia=args.concurrencia)
             print("\n✅ ¡Proceso completado!")
 
         except KeyboardInterrupt:
             print("\n\n⚠️ Proceso interrumpido")
+            print("   Ejecuta de nuevo con --resume para continuar donde se quedó")
         except Exception as e:
             print(f"\n\n❌ Error crítico: {e}")
             import traceback
 
             traceback.print_exc()
+        finally:
+            extractor.cerrar()
     else:
         print("\n❌ Proceso cancelado")
\ No newline at end of file
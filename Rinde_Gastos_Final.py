@@ -1,11 +1,93 @@
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
 import time
 import re
-import io
 import os
+import itertools
+import argparse
 from datetime import datetime
+from concurrencia import LimitadorPorHost, procesar_en_paralelo
+from cache_descargas import CacheDescargas
+from plantillas_descarga import EstadisticasPlantillas
+from bitacora_avance import BitacoraAvance
+from cliente_http import ClienteHTTP, borrar_pdf_temporal, tamano_pdf
+from enlaces_html import PaginaHTML
+from pool_pdf import (MAX_PAGINAS_PDF, NIVEL_INCOMPLETO, NIVEL_TABLAS, NIVEL_TEXTO, EstadisticasNivelesPDF,
+                      iterar_paginas_pdf, extraer_texto_pypdf2)
+
+# Límite de solicitudes por servidor compartido por todos los hilos
+LIMITADOR = LimitadorPorHost()
+
+# Sesión HTTP compartida (conexiones reutilizadas y reintentos con backoff)
+CLIENTE = ClienteHTTP(limitador=LIMITADOR)
+
+# Caché local de páginas y PDFs descargados
+CACHE = CacheDescargas()
+
+# Estadísticas de las plantillas de URL de descarga
+PLANTILLAS = EstadisticasPlantillas()
+
+# Cuántos PDFs resuelve cada nivel de lectura (capa de texto o tablas)
+NIVELES_PDF = EstadisticasNivelesPDF()
+
+
+def descargar_con_cache(url, headers, timeout):
+    """
+    Descarga una URL leyendo primero de la caché local
+    Devuelve (status_code, content_type, contenido); las respuestas 200 se guardan en la caché
+    Las entradas caducadas solo se revalidan (ETag / Last-Modified)
+    """
+    en_cache = CACHE.obtener(url)
+    if en_cache:
+        print(f"   💾 Desde caché: {url[:80]}")
+        return 200, en_cache[1], en_cache[0]
+
+    return CLIENTE.get_con_cache(url, CACHE, headers, timeout)
+
+
+def descargar_pdf_con_cache(url, headers, timeout):
+    """
+    Descarga un PDF candidato leyendo primero de la caché local
+    La respuesta se lee por bloques: se descarta en cuanto el primer KB no es de un PDF y los
+    PDFs grandes van a un archivo temporal
+    Devuelve (status_code, content_type, pdf); pdf es None si no es un PDF válido
+    """
+    en_cache = CACHE.obtener(url)
+    if en_cache:
+        print(f"   💾 Desde caché: {url[:80]}")
+        contenido, content_type = en_cache
+        if len(contenido) > 1000 and b'%PDF' in contenido[:1024]:
+            return 200, content_type, contenido
+        print(f"   ⚠️ No parece ser un PDF válido")
+        return 200, content_type, None
+
+    return CLIENTE.descargar_pdf(url, headers=headers, timeout=timeout, cache=CACHE)
+
+
+def enlaces_pdf_confirmados(enlaces, headers):
+    """
+    Genera los candidatos a descargar: primero los que ya están vigentes en la caché; el resto
+    se sondea en paralelo (solo el primer KB) y se generan únicamente los que responden con un PDF
+    El sondeo ocurre solo si ningún candidato de la caché sirvió
+    """
+    pendientes = []
+    for enlace in enlaces:
+        if CACHE.vigente(enlace):
+            yield enlace
+        else:
+            pendientes.append(enlace)
+
+    if not pendientes:
+        return
+
+    print(f"   🔎 Sondeando {len(pendientes)} candidato(s) de descarga...")
+    confirmadas, descartadas = CLIENTE.resolver_pdfs(pendientes, headers=headers)
+
+    PLANTILLAS.registrar_sondeo(confirmadas, descartadas)
+    if not confirmadas:
+        print(f"   ⚠️ Ningún candidato respondió con un PDF")
+
+    yield from confirmadas
 
 
 def extraer_datos_rindegastos(url):
@@ -23,10 +105,11 @@ def extraer_datos_rindegastos(url):
         print(f"🔍 Accediendo a: {url}")
 
         # Obtener la página principal
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
+        status_code, _, contenido_html = descargar_con_cache(url, headers, 20)
+        if status_code != 200:
+            raise requests.HTTPError(f"{status_code} Error al obtener la página: {url}")
 
-        soup = BeautifulSoup(response.content, 'html.parser')
+        pagina = PaginaHTML(contenido_html)
 
         resultado = {
             'descripcion': "No encontrada",
@@ -38,10 +121,7 @@ def extraer_datos_rindegastos(url):
         enlaces_descarga = []
 
         # Buscar enlaces con texto "Descargar"
-        for link in soup.find_all('a'):
-            texto_link = link.get_text(strip=True)
-            href = link.get('href', '')
-
+        for href, texto_link in pagina.anclas:
             if 'descargar' in texto_link.lower() or 'download' in texto_link.lower():
                 if href:
                     enlaces_descarga.append(href)
@@ -57,120 +137,123 @@ def extraer_datos_rindegastos(url):
             if key_match:
                 key = key_match.group(1)
 
-                # URLs de descarga comunes para RindeGastos
-                enlaces_descarga.extend([
-                    f"https://web.rindegastos.com/document/receipt?i={receipt_id}&key={key}&download=1",
-                    f"https://web.rindegastos.com/document/download/{receipt_id}",
-                    f"https://web.rindegastos.com/download/{receipt_id}?key={key}",
-                    url + "&download=1",
-                    url + "&format=pdf",
-                ])
+                # URLs de descarga comunes para RindeGastos (ordenadas por tasa de éxito histórica)
+                enlaces_descarga.extend(PLANTILLAS.construir([
+                    'web_receipt_download',
+                    'web_document_download_sin_key',
+                    'web_download',
+                    'receipt_download',
+                    'receipt_format_pdf',
+                ], url, receipt_id, key))
 
         # Intentar descargar el PDF
         pdf_procesado = False
 
-        for enlace in enlaces_descarga:
-            if not enlace.startswith('http'):
-                enlace = 'https://web.rindegastos.com' + enlace
+        enlaces_descarga = [enlace if enlace.startswith('http') else 'https://web.rindegastos.com' + enlace
+                            for enlace in enlaces_descarga]
+
+        # Descargar con headers específicos para PDFs
+        pdf_headers = headers.copy()
+        pdf_headers.update({
+            'Accept': 'application/pdf,application/octet-stream,*/*',
+            'Referer': url
+        })
 
+        # Solo se descargan los candidatos confirmados como PDF
+        for enlace in enlaces_pdf_confirmados(enlaces_descarga, pdf_headers):
+            pdf_content = None
             try:
                 print(f"   📥 Intentando descargar: {enlace}")
 
-                # Descargar con headers específicos para PDFs
-                pdf_headers = headers.copy()
-                pdf_headers.update({
-                    'Accept': 'application/pdf,application/octet-stream,*/*',
-                    'Referer': url
-                })
+                status_code, content_type, pdf_content = descargar_pdf_con_cache(enlace, pdf_headers, 30)
+                PLANTILLAS.registrar_descarga(enlace, status_code, pdf_content)
 
-                pdf_response = requests.get(enlace, headers=pdf_headers, timeout=30)
-
-                if pdf_response.status_code == 200:
-                    content_type = pdf_response.headers.get('content-type', '')
-                    content_length = len(pdf_response.content)
-
-                    print(f"   📊 Respuesta: {content_type}, {content_length} bytes")
-
-                    # Verificar si es un PDF válido
-                    if content_length > 1000 and (
-                            'pdf' in content_type.lower() or
-                            pdf_response.content.startswith(b'%PDF')
-                    ):
+                if status_code == 200:
+                    # Verificar si es un PDF válido (las respuestas que no lo son ya se descartaron)
+                    if pdf_content is not None:
+                        print(f"   📊 Respuesta: {content_type}, {tamano_pdf(pdf_content)} bytes")
                         print(f"   ✅ PDF válido encontrado!")
 
-                        # Intentar extraer texto del PDF
+                        # Intentar extraer texto del PDF, del nivel más barato al más caro
                         try:
-                            # Opción 1: pdfplumber (mejor)
-                            try:
-                                import pdfplumber
-
-                                with pdfplumber.open(io.BytesIO(pdf_response.content)) as pdf:
-                                    texto_completo = ""
+                            inicio_pdf = time.perf_counter()
 
-                                    for page_num, page in enumerate(pdf.pages):
-                                        print(f"   📄 Procesando página {page_num + 1}")
+                            # Nivel 1: capa de texto con PyPDF2 (basta en los CFDI impresos por sistema)
+                            texto_rapido = ""
+                            try:
+                                texto_rapido = extraer_texto_pypdf2(pdf_content, MAX_PAGINAS_PDF)
+                            except ImportError:
+                                print(f"   ⚠️ PyPDF2 no disponible, se usa solo pdfplumber...")
+                            except Exception as e:
+                                print(f"   ⚠️ Error con PyPDF2: {str(e)}")
+
+                            if buscar_descripcion(texto_rapido) and buscar_folio(texto_rapido):
+                                resultado = procesar_texto_factura(texto_rapido)
+                                NIVELES_PDF.registrar(NIVEL_TEXTO, time.perf_counter() - inicio_pdf)
+                                pdf_procesado = True
+                                break
+
+                            # Nivel 2: pdfplumber, página por página
+                            texto_completo = ""
+                            try:
+                                paginas = iterar_paginas_pdf(pdf_content, max_paginas=MAX_PAGINAS_PDF)
 
-                                        # Extraer texto normal
-                                        texto_pagina = page.extract_text()
-                                        if texto_pagina:
-                                            texto_completo += texto_pagina + "\n"
+                                for page_num, (texto_pagina, tablas) in enumerate(paginas):
+                                    print(f"   📄 Procesando página {page_num + 1}")
 
-                                        # Extraer tablas
-                                        tablas = page.extract_tables()
-                                        for tabla in tablas:
-                                            for fila in tabla:
-                                                if fila:
-                                                    fila_texto = " | ".join(
-                                                        [str(celda) if celda else "" for celda in fila])
-                                                    texto_completo += fila_texto + "\n"
+                                    # Extraer texto normal
+                                    if texto_pagina:
+                                        texto_completo += texto_pagina + "\n"
 
-                                if texto_completo.strip():
-                                    resultado = procesar_texto_factura(texto_completo)
-                                    pdf_procesado = True
-                                    break
+                                    # Extraer tablas
+                                    for tabla in tablas:
+                                        for fila in tabla:
+                                            if fila:
+                                                fila_texto = " | ".join(
+                                                    [str(celda) if celda else "" for celda in fila])
+                                                texto_completo += fila_texto + "\n"
+
+                                    # Con descripción y folio ya no hace falta leer las demás páginas
+                                    if buscar_descripcion(texto_completo) and buscar_folio(texto_completo):
+                                        print(f"   ⏩ Descripción y folio encontrados en {page_num + 1} página(s)")
+                                        break
 
                             except ImportError:
-                                print(f"   ⚠️ pdfplumber no disponible, intentando PyPDF2...")
-
-                                # Opción 2: PyPDF2 (fallback)
-                                try:
-                                    import PyPDF2
-
-                                    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_response.content))
-                                    texto_completo = ""
+                                print(f"   ⚠️ pdfplumber no disponible, se usa la capa de texto...")
 
-                                    for page_num, page in enumerate(pdf_reader.pages):
-                                        print(f"   📄 Procesando página {page_num + 1}")
-                                        texto_pagina = page.extract_text()
-                                        texto_completo += texto_pagina + "\n"
+                            # Sin texto de pdfplumber queda el de PyPDF2
+                            texto_completo = texto_completo if texto_completo.strip() else texto_rapido
 
-                                    if texto_completo.strip():
-                                        resultado = procesar_texto_factura(texto_completo)
-                                        pdf_procesado = True
-                                        break
+                            if texto_completo.strip():
+                                resultado = procesar_texto_factura(texto_completo)
+                                completo = (resultado['descripcion'] != "No encontrada" and
+                                            resultado['folio_fiscal'] != "No encontrado")
+                                NIVELES_PDF.registrar(NIVEL_TABLAS if completo else NIVEL_INCOMPLETO,
+                                                      time.perf_counter() - inicio_pdf)
+                                pdf_procesado = True
+                                break
 
-                                except ImportError:
-                                    print(f"   ❌ No hay librerías de PDF disponibles")
+                            print(f"   ❌ El PDF no tiene texto legible")
 
                         except Exception as pdf_error:
                             print(f"   ❌ Error procesando PDF: {str(pdf_error)}")
                             continue
 
-                    else:
-                        print(f"   ⚠️ No parece ser un PDF válido")
-
                 else:
-                    print(f"   ❌ Error HTTP: {pdf_response.status_code}")
+                    print(f"   ❌ Error HTTP: {status_code}")
 
             except Exception as e:
                 print(f"   ❌ Error con enlace {enlace}: {str(e)}")
                 continue
 
+            finally:
+                borrar_pdf_temporal(pdf_content)
+
         if not pdf_procesado:
             print(f"   ⚠️ No se pudo procesar ningún PDF, intentando extraer de la página HTML...")
 
             # MÉTODO 2: Intentar extraer datos de la página HTML directamente
-            texto_html = soup.get_text()
+            texto_html = pagina.texto
             resultado = procesar_texto_factura(texto_html)
 
         return resultado
@@ -183,9 +266,107 @@ def extraer_datos_rindegastos(url):
         }
 
 
+# ========== PATRONES PRECOMPILADOS PARA EL TEXTO DE LAS FACTURAS ==========
+# Se compilan una sola vez al importar el módulo; el orden de cada lista es su prioridad
+
+PATRONES_DESCRIPCION = [re.compile(patron, re.IGNORECASE | re.MULTILINE) for patron in [
+    # Patrones específicos para tu caso
+    r'TERMOPILA[^,\n\r]*(?:MINIVOLTS|HONEYWELL|EN\s*BOLSA)?[^,\n\r]*',
+    r'TERMOSTATO[^,\n\r]*(?:RX-\d+|DE\s*\d+.*?FREIDOR)?[^,\n\r]*',
+
+    # Patrones generales
+    r'(?:Descripción|Concepto|Producto)[:\s]*([^\n\r]{10,150})',
+    r'([A-Z]{4,}[^,\n\r]*(?:HONEYWELL|MINIVOLTS|BOLSA|FREIDOR|TERMOPILA|TERMOSTATO)[^,\n\r]*)',
+
+    # Buscar líneas que parezcan descripciones de productos
+    r'^([A-Z][A-Z0-9\s\-\.,/]{15,100}[A-Z0-9])$',
+]]
+
+PATRONES_FOLIO = [re.compile(patron, re.IGNORECASE) for patron in [
+    # Formato UUID completo
+    r'([A-F0-9]{8}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{12})',
+
+    # Folio fiscal con texto
+    r'(?:Folio\s*Fiscal)[:\s]*([A-F0-9-]{20,50})',
+    r'(?:UUID)[:\s]*([A-F0-9-]{20,50})',
+
+    # Serie del certificado (alternativo)
+    r'(?:Serie\s*del\s*Certificado)[:\s]*([A-Z0-9]{15,})',
+
+    # Número de serie del SAT
+    r'(?:No\.\s*de\s*serie)[:\s]*([A-Z0-9]{15,})',
+]]
+
+PATRONES_FECHA = [re.compile(patron, re.IGNORECASE | re.MULTILINE) for patron in [
+    # Patrones más específicos primero (con etiquetas)
+    r'(?:Fecha\s*y\s*hora\s*de\s*(?:emisión|expedición|certificación))[:\s]*(\d{4}-\d{2}-\d{2})',
+    r'(?:Fecha\s*de\s*(?:emisión|expedición|factura|comprobante|certificación))[:\s]*(\d{4}-\d{2}-\d{2})',
+    r'(?:Fecha\s*de\s*(?:emisión|expedición|factura|comprobante))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    r'(?:Fecha\s*y\s*hora\s*de\s*(?:emisión|expedición))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+
+    # Formato ISO con T (fecha y hora)
+    r'(?:Fecha)[:\s]*(\d{4}-\d{2}-\d{2})T\d{2}:\d{2}:\d{2}',
+    r'(\d{4}-\d{2}-\d{2})T\d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}',  # Con timezone
+
+    # Buscar "Fecha:" con diferentes formatos
+    r'(?:Fecha)[:\s]*(\d{4}-\d{2}-\d{2})',
+    r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+\d{1,2}:\d{2}',
+
+    # Fechas en el contexto de certificación SAT
+    r'(?:Fecha\s*de\s*certificación\s*SAT)[:\s]*(\d{4}-\d{2}-\d{2})',
+    r'(?:FechaTimbrado)[:\s]*(\d{4}-\d{2}-\d{2})',
+    r'(?:Fecha\s*timbrado)[:\s]*(\d{4}-\d{2}-\d{2})',
+
+    # Formatos de fecha con texto en español
+    r'(\d{1,2})\s*de\s*(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s*de\s*(\d{2,4})',
+    r'(\d{1,2})\s*de\s*(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s*del\s*(\d{2,4})',
+
+    # Buscar en contextos específicos de facturas mexicanas
+    r'Lugar\s*y\s*fecha\s*de\s*expedición[:\s]*[^,\n]*,\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    r'Expedido\s*en[:\s]*[^,\n]*,\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+
+    # Patrones más generales (al final para no interferir con los específicos)
+    r'\b(\d{4}-\d{2}-\d{2})\b(?!T\d)',  # ISO sin hora
+    r'\b(\d{1,2}/\d{1,2}/\d{4})\b',  # DD/MM/YYYY
+    r'\b(\d{1,2}-\d{1,2}-\d{4})\b',  # DD-MM-YYYY
+    r'\b(\d{4}/\d{1,2}/\d{1,2})\b',  # YYYY/MM/DD
+    r'\b(\d{1,2}/\d{1,2}/\d{2})\b',  # DD/MM/YY
+
+    # Patrones adicionales para facturas
+    r'Emitida\s*el[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    r'Generada\s*el[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+]]
+
+MESES_ESPANOL = {
+    'enero': '01', 'febrero': '02', 'marzo': '03', 'abril': '04',
+    'mayo': '05', 'junio': '06', 'julio': '07', 'agosto': '08',
+    'septiembre': '09', 'octubre': '10', 'noviembre': '11', 'diciembre': '12'
+}
+
+PALABRAS_NO_DESCRIPCION = ('folio', 'fiscal', 'certificado', 'serie', 'fecha', 'total', 'subtotal', 'iva')
+
+ESPACIOS = re.compile(r'\s+')
+
+
+def valor_coincidencia(match):
+    """
+    Devuelve lo mismo que re.findall para una coincidencia: el texto completo si el patrón
+    no tiene grupos, el grupo si tiene uno, o la tupla de grupos si tiene varios
+    """
+    grupos = match.groups('')
+    if not grupos:
+        return match.group(0)
+    if len(grupos) == 1:
+        return grupos[0]
+    return grupos
+
+
 def procesar_texto_factura(texto):
     """
     Procesa el texto extraído de una factura para encontrar descripción, folio fiscal y fecha
+    Recorre los patrones precompilados en orden de prioridad y se detiene en la primera
+    coincidencia válida de cada campo
     """
     print(f"   📝 Texto extraído (primeros 300 chars):")
     print(f"   {texto[:300]}...")
@@ -198,160 +379,87 @@ def procesar_texto_factura(texto):
     }
 
     # BUSCAR DESCRIPCIÓN
-    patrones_descripcion = [
-        # Patrones específicos para tu caso
-        r'TERMOPILA[^,\n\r]*(?:MINIVOLTS|HONEYWELL|EN\s*BOLSA)?[^,\n\r]*',
-        r'TERMOSTATO[^,\n\r]*(?:RX-\d+|DE\s*\d+.*?FREIDOR)?[^,\n\r]*',
+    resultado['descripcion'] = buscar_descripcion(texto) or resultado['descripcion']
 
-        # Patrones generales
-        r'(?:Descripción|Concepto|Producto)[:\s]*([^\n\r]{10,150})',
-        r'([A-Z]{4,}[^,\n\r]*(?:HONEYWELL|MINIVOLTS|BOLSA|FREIDOR|TERMOPILA|TERMOSTATO)[^,\n\r]*)',
+    # BUSCAR FOLIO FISCAL
+    resultado['folio_fiscal'] = buscar_folio(texto) or resultado['folio_fiscal']
 
-        # Buscar líneas que parezcan descripciones de productos
-        r'^([A-Z][A-Z0-9\s\-\.,/]{15,100}[A-Z0-9])$',
-    ]
+    # BUSCAR FECHA DE LA FACTURA
+    resultado['fecha_factura'] = buscar_fecha(texto) or resultado['fecha_factura']
 
-    for patron in patrones_descripcion:
-        matches = re.findall(patron, texto, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            for match in matches:
-                match_limpio = re.sub(r'\s+', ' ', str(match).strip())
-                # Verificar que sea una descripción válida
-                if (10 <= len(match_limpio) <= 200 and
-                        not any(palabra in match_limpio.lower() for palabra in
-                                ['folio', 'fiscal', 'certificado', 'serie', 'fecha', 'total', 'subtotal', 'iva'])):
-                    resultado['descripcion'] = match_limpio
-                    break
-            if resultado['descripcion'] != "No encontrada":
-                break
+    return resultado
 
-    # BUSCAR FOLIO FISCAL
-    patrones_folio = [
-        # Formato UUID completo
-        r'([A-F0-9]{8}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{12})',
 
-        # Folio fiscal con texto
-        r'(?:Folio\s*Fiscal)[:\s]*([A-F0-9-]{20,50})',
-        r'(?:UUID)[:\s]*([A-F0-9-]{20,50})',
+def buscar_descripcion(texto):
+    """Primera descripción válida según el orden de los patrones"""
+    for patron in PATRONES_DESCRIPCION:
+        for match in patron.finditer(texto):
+            match_limpio = ESPACIOS.sub(' ', str(valor_coincidencia(match)).strip())
+            # Verificar que sea una descripción válida
+            if (10 <= len(match_limpio) <= 200 and
+                    not any(palabra in match_limpio.lower() for palabra in PALABRAS_NO_DESCRIPCION)):
+                return match_limpio
 
-        # Serie del certificado (alternativo)
-        r'(?:Serie\s*del\s*Certificado)[:\s]*([A-Z0-9]{15,})',
+    return None
 
-        # Número de serie del SAT
-        r'(?:No\.\s*de\s*serie)[:\s]*([A-Z0-9]{15,})',
-    ]
 
-    for patron in patrones_folio:
-        matches = re.findall(patron, texto, re.IGNORECASE)
-        if matches:
-            for match in matches:
-                match_limpio = str(match).strip()
-                if len(match_limpio) >= 15:  # Los folios fiscales son largos
-                    resultado['folio_fiscal'] = match_limpio
-                    break
-            if resultado['folio_fiscal'] != "No encontrado":
-                break
+def buscar_folio(texto):
+    """Primer folio fiscal según el orden de los patrones"""
+    for patron in PATRONES_FOLIO:
+        for match in patron.finditer(texto):
+            match_limpio = str(valor_coincidencia(match)).strip()
+            if len(match_limpio) >= 15:  # Los folios fiscales son largos
+                return match_limpio
 
-    # BUSCAR FECHA DE LA FACTURA
-    patrones_fecha = [
-        # Patrones más específicos primero (con etiquetas)
-        r'(?:Fecha\s*y\s*hora\s*de\s*(?:emisión|expedición|certificación))[:\s]*(\d{4}-\d{2}-\d{2})',
-        r'(?:Fecha\s*de\s*(?:emisión|expedición|factura|comprobante|certificación))[:\s]*(\d{4}-\d{2}-\d{2})',
-        r'(?:Fecha\s*de\s*(?:emisión|expedición|factura|comprobante))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        r'(?:Fecha\s*y\s*hora\s*de\s*(?:emisión|expedición))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-
-        # Formato ISO con T (fecha y hora)
-        r'(?:Fecha)[:\s]*(\d{4}-\d{2}-\d{2})T\d{2}:\d{2}:\d{2}',
-        r'(\d{4}-\d{2}-\d{2})T\d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}',  # Con timezone
-
-        # Buscar "Fecha:" con diferentes formatos
-        r'(?:Fecha)[:\s]*(\d{4}-\d{2}-\d{2})',
-        r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+\d{1,2}:\d{2}',
-
-        # Fechas en el contexto de certificación SAT
-        r'(?:Fecha\s*de\s*certificación\s*SAT)[:\s]*(\d{4}-\d{2}-\d{2})',
-        r'(?:FechaTimbrado)[:\s]*(\d{4}-\d{2}-\d{2})',
-        r'(?:Fecha\s*timbrado)[:\s]*(\d{4}-\d{2}-\d{2})',
-
-        # Formatos de fecha con texto en español
-        r'(\d{1,2})\s*de\s*(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s*de\s*(\d{2,4})',
-        r'(\d{1,2})\s*de\s*(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s*del\s*(\d{2,4})',
-
-        # Buscar en contextos específicos de facturas mexicanas
-        r'Lugar\s*y\s*fecha\s*de\s*expedición[:\s]*[^,\n]*,\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        r'Expedido\s*en[:\s]*[^,\n]*,\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-
-        # Patrones más generales (al final para no interferir con los específicos)
-        r'\b(\d{4}-\d{2}-\d{2})\b(?!T\d)',  # ISO sin hora
-        r'\b(\d{1,2}/\d{1,2}/\d{4})\b',  # DD/MM/YYYY
-        r'\b(\d{1,2}-\d{1,2}-\d{4})\b',  # DD-MM-YYYY
-        r'\b(\d{4}/\d{1,2}/\d{1,2})\b',  # YYYY/MM/DD
-        r'\b(\d{1,2}/\d{1,2}/\d{2})\b',  # DD/MM/YY
-
-        # Patrones adicionales para facturas
-        r'Emitida\s*el[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        r'Generada\s*el[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-    ]
+    return None
 
-    meses_espanol = {
-        'enero': '01', 'febrero': '02', 'marzo': '03', 'abril': '04',
-        'mayo': '05', 'junio': '06', 'julio': '07', 'agosto': '08',
-        'septiembre': '09', 'octubre': '10', 'noviembre': '11', 'diciembre': '12'
-    }
 
-    # Almacenar todas las fechas encontradas para depuración
-    fechas_encontradas = []
-
-    for patron in patrones_fecha:
-        matches = re.findall(patron, texto, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            for match in matches:
-                try:
-                    if isinstance(match, tuple):  # Para fechas con mes en español
-                        dia = match[0].zfill(2)
-                        mes = meses_espanol.get(match[1].lower(), match[1])
-                        año = match[2]
-                        if len(año) == 2:
-                            año = '20' + año
-                        fecha_str = f"{dia}/{mes}/{año}"
-                    else:
-                        fecha_str = str(match).strip()
-
-                    # Normalizar el formato de fecha
-                    fecha_normalizada = normalizar_fecha(fecha_str)
-
-                    if fecha_normalizada:
-                        fechas_encontradas.append(fecha_normalizada)
-
-                except Exception as e:
-                    continue
-
-    # Si encontramos fechas, tomar la primera que parezca más relevante
-    if fechas_encontradas:
-        # Priorizar fechas del año actual o recientes
-        año_actual = datetime.now().year
-
-        # Filtrar fechas válidas (no muy antiguas ni futuras)
-        fechas_validas = []
-        for fecha in fechas_encontradas:
+def buscar_fecha(texto):
+    """
+    Primera fecha entre 2020 y el año próximo según el orden de los patrones;
+    si ninguna está en ese rango, la primera fecha reconocida
+    """
+    año_actual = datetime.now().year
+    primera_fecha = None
+
+    for patron in PATRONES_FECHA:
+        for match in patron.finditer(texto):
             try:
-                fecha_obj = datetime.strptime(fecha, '%d/%m/%Y')
-                año_fecha = fecha_obj.year
-                # Considerar fechas entre 2020 y el año actual + 1
-                if 2020 <= año_fecha <= año_actual + 1:
-                    fechas_validas.append(fecha)
-            except:
+                valor = valor_coincidencia(match)
+                if isinstance(valor, tuple):  # Para fechas con mes en español
+                    dia = valor[0].zfill(2)
+                    mes = MESES_ESPANOL.get(valor[1].lower(), valor[1])
+                    año = valor[2]
+                    if len(año) == 2:
+                        año = '20' + año
+                    fecha_str = f"{dia}/{mes}/{año}"
+                else:
+                    fecha_str = str(valor).strip()
+
+                # Normalizar el formato de fecha
+                fecha_normalizada = normalizar_fecha(fecha_str)
+
+            except Exception:
                 continue
 
-        if fechas_validas:
-            resultado['fecha_factura'] = fechas_validas[0]
-            print(f"   📅 Fechas encontradas: {fechas_validas[:3]}")  # Mostrar las primeras 3 para debug
-        elif fechas_encontradas:
-            resultado['fecha_factura'] = fechas_encontradas[0]
-            print(f"   📅 Fecha seleccionada: {fechas_encontradas[0]}")
+            if not fecha_normalizada:
+                continue
 
-    return resultado
+            # Priorizar fechas recientes: la primera en el rango termina la búsqueda
+            try:
+                if 2020 <= datetime.strptime(fecha_normalizada, '%d/%m/%Y').year <= año_actual + 1:
+                    print(f"   📅 Fecha encontrada: {fecha_normalizada}")
+                    return fecha_normalizada
+            except ValueError:
+                pass
+
+            if primera_fecha is None:
+                primera_fecha = fecha_normalizada
+
+    if primera_fecha:
+        print(f"   📅 Fecha seleccionada: {primera_fecha}")
+
+    return primera_fecha
 
 
 def normalizar_fecha(fecha_str):
@@ -442,11 +550,16 @@ def normalizar_fecha(fecha_str):
     return None  # No se pudo normalizar
 
 
-def procesar_facturas_completo(archivo_entrada, archivo_salida):
+def procesar_facturas_completo(archivo_entrada, archivo_salida, max_workers=4, reanudar=False):
     """
     Procesa todas las facturas del archivo Excel
+    Las facturas se descargan en paralelo (max_workers hilos) respetando el límite por servidor
+    Cada resultado se guarda en una bitácora; con reanudar=True se omiten las ya procesadas
     """
     try:
+        # Una conexión reutilizable por hilo y servidor
+        CLIENTE.dimensionar(max_workers)
+
         print("📊 Cargando archivo Excel...")
         df = pd.read_excel(archivo_entrada)
 
@@ -470,24 +583,55 @@ def procesar_facturas_completo(archivo_entrada, archivo_salida):
         exitosas = 0
         errores = 0
 
-        for idx, (_, fila) in enumerate(facturas.iterrows()):
-            url = fila['URL']  # Primera columna URL
+        # Bitácora de avance para poder reanudar una corrida interrumpida
+        bitacora = BitacoraAvance(archivo_salida + '.avance.jsonl', reanudar=reanudar)
 
+        tareas = []
+        reanudadas = []
+        for indice, url in facturas['URL'].items():
             if pd.isna(url):
                 continue
 
+            clave = BitacoraAvance.clave_comprobante(url)
+            if clave in bitacora.completados:
+                reanudadas.append((indice, bitacora.completados[clave], None))
+            else:
+                tareas.append((indice, (url,)))
+
+        if reanudadas:
+            print(f"⏩ Reanudando: {len(reanudadas)} facturas ya procesadas en la corrida anterior")
+        print(f"⚙️ Procesando {len(tareas)} facturas con {max_workers} hilos en paralelo")
+
+        total_tareas = len(reanudadas) + len(tareas)
+        resultados = itertools.chain(
+            reanudadas,
+            procesar_en_paralelo(tareas, extraer_datos_rindegastos, max_workers)
+        )
+
+        for idx, (indice, datos, error) in enumerate(resultados):
+            fila = facturas.loc[indice]
+
+            if error is not None:
+                datos = {
+                    'descripcion': f"Error: {str(error)}",
+                    'folio_fiscal': f"Error: {str(error)}",
+                    'fecha_factura': f"Error: {str(error)}"
+                }
+
+            # Los errores no se guardan, para reintentarlos al reanudar
+            clave = BitacoraAvance.clave_comprobante(fila['URL'])
+            if clave not in bitacora.completados and "Error" not in datos['descripcion']:
+                bitacora.registrar(clave, datos)
+
             print(f"\n{'=' * 60}")
-            print(f"📦 Procesando {idx + 1}/{len(facturas)}")
+            print(f"📦 Procesada {idx + 1}/{total_tareas}")
             print(f"🏪 Comercio: {fila['Comercio']}")
             print(f"💰 Total: ${fila['Total']}")
 
-            # Extraer datos
-            datos = extraer_datos_rindegastos(url)
-
             # Guardar resultados
-            facturas.at[fila.name, 'Descripción'] = datos['descripcion']
-            facturas.at[fila.name, 'Folio Fiscal Extraído'] = datos['folio_fiscal']
-            facturas.at[fila.name, 'Fecha_factura'] = datos['fecha_factura']
+            facturas.at[indice, 'Descripción'] = datos['descripcion']
+            facturas.at[indice, 'Folio Fiscal Extraído'] = datos['folio_fiscal']
+            facturas.at[indice, 'Fecha_factura'] = datos['fecha_factura']
 
             if "Error" not in datos['descripcion'] and datos['descripcion'] != "No encontrada":
                 exitosas += 1
@@ -500,10 +644,6 @@ def procesar_facturas_completo(archivo_entrada, archivo_salida):
                 print(f"❌ Folio: {datos['folio_fiscal']}")
                 print(f"❌ Fecha: {datos['fecha_factura']}")
 
-            # Pausa
-            print("⏳ Esperando 3 segundos...")
-            time.sleep(3)
-
         # Actualizar DataFrame original con los datos extraídos
         df_final = df.copy()
 
@@ -523,12 +663,19 @@ def procesar_facturas_completo(archivo_entrada, archivo_salida):
 
         # Guardar archivo
         df_final.to_excel(archivo_salida, index=False)
+        PLANTILLAS.guardar()
+        bitacora.cerrar()
 
         print(f"\n{'=' * 60}")
         print(f"🎉 PROCESO COMPLETADO")
         print(f"📁 Archivo guardado: {archivo_salida}")
         print(f"✅ Exitosas: {exitosas}")
         print(f"❌ Errores: {errores}")
+        print(CACHE.resumen())
+        print(f"📥 Plantillas de descarga:")
+        print(PLANTILLAS.resumen())
+        print(f"📄 Niveles de lectura de PDF:")
+        print(NIVELES_PDF.resumen())
         if len(facturas) > 0:
             print(f"📊 Tasa de éxito: {(exitosas / len(facturas) * 100):.1f}%")
 
@@ -551,6 +698,11 @@ def procesar_facturas_completo(archivo_entrada, archivo_salida):
 
 # PROGRAMA PRINCIPAL
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extractor de facturas RindeGastos")
+    parser.add_argument('--resume', dest='reanudar', action='store_true',
+                        help="Reanudar una corrida interrumpida omitiendo las facturas ya procesadas")
+    args = parser.parse_args()
+
     print("🚀 EXTRACTOR DE FACTURAS RINDEGASTOS - VERSIÓN COMPLETA")
     print("=" * 50)
 
@@ -607,7 +759,7 @@ if __name__ == "__main__":
         print(f"\n🚀 Iniciando procesamiento...")
         start_time = time.time()
 
-        procesar_facturas_completo(archivo_entrada, archivo_salida)
+        procesar_facturas_completo(archivo_entrada, archivo_salida, reanudar=args.reanudar)
 
         end_time = time.time()
         tiempo_total = end_time - start_time
@@ -1,11 +1,14 @@
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 import time
 import re
 import io
 import os
 from datetime import datetime
+from cliente_http import MAX_BYTES_PDF, ClienteHTTP
+from enlaces_html import PaginaHTML
+
+# Sesión HTTP compartida (conexiones reutilizadas y reintentos con backoff)
+CLIENTE = ClienteHTTP(max_workers=1)
 
 
 def extraer_datos_rindegastos(url):
@@ -23,10 +26,10 @@ def extraer_datos_rindegastos(url):
         print(f"🔍 Accediendo a: {url}")
 
         # Obtener la página principal
-        response = requests.get(url, headers=headers, timeout=20)
+        response = CLIENTE.get(url, headers=headers, timeout=20)
         response.raise_for_status()
 
-        soup = BeautifulSoup(response.content, 'html.parser')
+        pagina = PaginaHTML(response.content)
 
         resultado = {
             'descripcion': "No encontrada",
@@ -39,10 +42,7 @@ def extraer_datos_rindegastos(url):
         enlaces_descarga = []
 
         # Buscar enlaces con texto "Descargar"
-        for link in soup.find_all('a'):
-            texto_link = link.get_text(strip=True)
-            href = link.get('href', '')
-
+        for href, texto_link in pagina.anclas:
             if 'descargar' in texto_link.lower() or 'download' in texto_link.lower():
                 if href:
                     enlaces_descarga.append(href)
@@ -70,9 +70,16 @@ def extraer_datos_rindegastos(url):
         # Intentar descargar el PDF
         pdf_procesado = False
 
+        # Solo se descargan los candidatos confirmados como PDF (se sondea el primer KB en paralelo)
+        enlaces_descarga = [enlace if enlace.startswith('http') else 'https://web.rindegastos.com' + enlace
+                            for enlace in enlaces_descarga]
+        enlaces_descarga, _ = CLIENTE.resolver_pdfs(enlaces_descarga, headers={
+            **headers,
+            'Accept': 'application/pdf,application/octet-stream,*/*',
+            'Referer': url
+        })
+
         for enlace in enlaces_descarga:
-            if not enlace.startswith('http'):
-                enlace = 'https://web.rindegastos.com' + enlace
 
             try:
                 print(f"   📥 Intentando descargar: {enlace}")
@@ -84,19 +91,14 @@ def extraer_datos_rindegastos(url):
                     'Referer': url
                 })
 
-                pdf_response = requests.get(enlace, headers=pdf_headers, timeout=30)
-
-                if pdf_response.status_code == 200:
-                    content_type = pdf_response.headers.get('content-type', '')
-                    content_length = len(pdf_response.content)
-
-                    print(f"   📊 Respuesta: {content_type}, {content_length} bytes")
+                # Se lee por bloques: lo que no empieza como PDF se descarta sin leer el resto
+                status_code, content_type, pdf_content = CLIENTE.descargar_pdf(
+                    enlace, headers=pdf_headers, timeout=30, max_bytes_memoria=MAX_BYTES_PDF)
 
+                if status_code == 200:
                     # Verificar si es un PDF válido
-                    if content_length > 1000 and (
-                            'pdf' in content_type.lower() or
-                            pdf_response.content.startswith(b'%PDF')
-                    ):
+                    if pdf_content is not None:
+                        print(f"   📊 Respuesta: {content_type}, {len(pdf_content)} bytes")
                         print(f"   ✅ PDF válido encontrado!")
 
                         # Intentar extraer texto del PDF
@@ -105,7 +107,7 @@ def extraer_datos_rindegastos(url):
                             try:
                                 import pdfplumber
 
-                                with pdfplumber.open(io.BytesIO(pdf_response.content)) as pdf:
+                                with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
                                     texto_completo = ""
 
                                     for page_num, page in enumerate(pdf.pages):
@@ -137,7 +139,7 @@ def extraer_datos_rindegastos(url):
                                 try:
                                     import PyPDF2
 
-                                    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_response.content))
+                                    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
                                     texto_completo = ""
 
                                     for page_num, page in enumerate(pdf_reader.pages):
@@ -157,11 +159,8 @@ def extraer_datos_rindegastos(url):
                             print(f"   ❌ Error procesando PDF: {str(pdf_error)}")
                             continue
 
-                    else:
-                        print(f"   ⚠️ No parece ser un PDF válido")
-
                 else:
-                    print(f"   ❌ Error HTTP: {pdf_response.status_code}")
+                    print(f"   ❌ Error HTTP: {status_code}")
 
             except Exception as e:
                 print(f"   ❌ Error con enlace {enlace}: {str(e)}")
@@ -171,7 +170,7 @@ def extraer_datos_rindegastos(url):
             print(f"   ⚠️ No se pudo procesar ningún PDF, intentando extraer de la página HTML...")
 
             # MÉTODO 2: Intentar extraer datos de la página HTML directamente
-            texto_html = soup.get_text()
+            texto_html = pagina.texto
             resultado = procesar_texto_factura(texto_html)
 
         return resultado
@@ -184,9 +183,89 @@ def extraer_datos_rindegastos(url):
         }
 
 
+# ========== PATRONES PRECOMPILADOS PARA EL TEXTO DE LAS FACTURAS ==========
+# Se compilan una sola vez al importar el módulo; el orden de cada lista es su prioridad
+
+# Basado en tu imagen, buscar patrones específicos de productos
+PATRONES_DESCRIPCION = [re.compile(patron, re.IGNORECASE | re.MULTILINE) for patron in [
+    # Patrones específicos para tu caso
+    r'TERMOPILA[^,\n\r]*(?:MINIVOLTS|HONEYWELL|EN\s*BOLSA)?[^,\n\r]*',
+    r'TERMOSTATO[^,\n\r]*(?:RX-\d+|DE\s*\d+.*?FREIDOR)?[^,\n\r]*',
+
+    # Patrones generales
+    r'(?:Descripción|Concepto|Producto)[:\s]*([^\n\r]{10,150})',
+    r'([A-Z]{4,}[^,\n\r]*(?:HONEYWELL|MINIVOLTS|BOLSA|FREIDOR|TERMOPILA|TERMOSTATO)[^,\n\r]*)',
+
+    # Buscar líneas que parezcan descripciones de productos
+    r'^([A-Z][A-Z0-9\s\-\.,/]{15,100}[A-Z0-9])$',
+]]
+
+# Basado en tu imagen, buscar el folio fiscal específico
+PATRONES_FOLIO = [re.compile(patron, re.IGNORECASE) for patron in [
+    # Formato UUID completo (como se ve en tu imagen)
+    r'([A-F0-9]{8}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{12})',
+
+    # Folio fiscal con texto
+    r'(?:Folio\s*Fiscal)[:\s]*([A-F0-9-]{20,50})',
+    r'(?:UUID)[:\s]*([A-F0-9-]{20,50})',
+
+    # Serie del certificado (alternativo)
+    r'(?:Serie\s*del\s*Certificado)[:\s]*([A-Z0-9]{15,})',
+
+    # Número de serie del SAT
+    r'(?:No\.\s*de\s*serie)[:\s]*([A-Z0-9]{15,})',
+]]
+
+# Múltiples patrones para capturar diferentes formatos de fecha
+PATRONES_FECHA = [re.compile(patron, re.IGNORECASE) for patron in [
+    # Fecha con etiquetas específicas de factura
+    r'(?:Fecha\s*de\s*(?:emisión|expedición|factura|comprobante))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    r'(?:Fecha\s*y\s*hora\s*de\s*(?:emisión|expedición))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+
+    # Formato ISO
+    r'(?:Fecha)[:\s]*(\d{4}-\d{2}-\d{2})',
+
+    # Fecha con hora completa (tomar solo la fecha)
+    r'(?:Fecha\s*de\s*emisión)[:\s]*(\d{4}-\d{2}-\d{2})T\d{2}:\d{2}:\d{2}',
+    r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+\d{1,2}:\d{2}',
+
+    # Formatos de fecha con texto en español
+    r'(\d{1,2})\s*de\s*(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s*de\s*(\d{2,4})',
+
+    # Formatos generales de fecha (más amplios)
+    r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b',
+    r'\b(\d{4}[/-]\d{1,2}[/-]\d{1,2})\b',
+]]
+
+MESES_ESPANOL = {
+    'enero': '01', 'febrero': '02', 'marzo': '03', 'abril': '04',
+    'mayo': '05', 'junio': '06', 'julio': '07', 'agosto': '08',
+    'septiembre': '09', 'octubre': '10', 'noviembre': '11', 'diciembre': '12'
+}
+
+PALABRAS_NO_DESCRIPCION = ('folio', 'fiscal', 'certificado', 'serie', 'fecha', 'total', 'subtotal', 'iva')
+
+ESPACIOS = re.compile(r'\s+')
+
+
+def valor_coincidencia(match):
+    """
+    Devuelve lo mismo que re.findall para una coincidencia: el texto completo si el patrón
+    no tiene grupos, el grupo si tiene uno, o la tupla de grupos si tiene varios
+    """
+    grupos = match.groups('')
+    if not grupos:
+        return match.group(0)
+    if len(grupos) == 1:
+        return grupos[0]
+    return grupos
+
+
 def procesar_texto_factura(texto):
     """
     Procesa el texto extraído de una factura para encontrar descripción, folio fiscal y fecha
+    Recorre los patrones precompilados en orden y se detiene en la primera coincidencia válida
     """
     print(f"   📝 Texto extraído (primeros 300 chars):")
     print(f"   {texto[:300]}...")
@@ -199,121 +278,68 @@ def procesar_texto_factura(texto):
     }
 
     # BUSCAR DESCRIPCIÓN
-    # Basado en tu imagen, buscar patrones específicos de productos
-    patrones_descripcion = [
-        # Patrones específicos para tu caso
-        r'TERMOPILA[^,\n\r]*(?:MINIVOLTS|HONEYWELL|EN\s*BOLSA)?[^,\n\r]*',
-        r'TERMOSTATO[^,\n\r]*(?:RX-\d+|DE\s*\d+.*?FREIDOR)?[^,\n\r]*',
-
-        # Patrones generales
-        r'(?:Descripción|Concepto|Producto)[:\s]*([^\n\r]{10,150})',
-        r'([A-Z]{4,}[^,\n\r]*(?:HONEYWELL|MINIVOLTS|BOLSA|FREIDOR|TERMOPILA|TERMOSTATO)[^,\n\r]*)',
-
-        # Buscar líneas que parezcan descripciones de productos
-        r'^([A-Z][A-Z0-9\s\-\.,/]{15,100}[A-Z0-9])$',
-    ]
-
-    for patron in patrones_descripcion:
-        matches = re.findall(patron, texto, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            for match in matches:
-                match_limpio = re.sub(r'\s+', ' ', str(match).strip())
-                # Verificar que sea una descripción válida
-                if (10 <= len(match_limpio) <= 200 and
-                        not any(palabra in match_limpio.lower() for palabra in
-                                ['folio', 'fiscal', 'certificado', 'serie', 'fecha', 'total', 'subtotal', 'iva'])):
-                    resultado['descripcion'] = match_limpio
-                    break
-            if resultado['descripcion'] != "No encontrada":
-                break
+    resultado['descripcion'] = buscar_descripcion(texto) or resultado['descripcion']
 
     # BUSCAR FOLIO FISCAL
-    # Basado en tu imagen, buscar el folio fiscal específico
-    patrones_folio = [
-        # Formato UUID completo (como se ve en tu imagen)
-        r'([A-F0-9]{8}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{12})',
+    resultado['folio_fiscal'] = buscar_folio(texto) or resultado['folio_fiscal']
 
-        # Folio fiscal con texto
-        r'(?:Folio\s*Fiscal)[:\s]*([A-F0-9-]{20,50})',
-        r'(?:UUID)[:\s]*([A-F0-9-]{20,50})',
+    # BUSCAR FECHA DE LA FACTURA
+    resultado['fecha_factura'] = buscar_fecha(texto) or resultado['fecha_factura']
 
-        # Serie del certificado (alternativo)
-        r'(?:Serie\s*del\s*Certificado)[:\s]*([A-Z0-9]{15,})',
+    return resultado
 
-        # Número de serie del SAT
-        r'(?:No\.\s*de\s*serie)[:\s]*([A-Z0-9]{15,})',
-    ]
 
-    for patron in patrones_folio:
-        matches = re.findall(patron, texto, re.IGNORECASE)
-        if matches:
-            for match in matches:
-                match_limpio = str(match).strip()
-                if len(match_limpio) >= 15:  # Los folios fiscales son largos
-                    resultado['folio_fiscal'] = match_limpio
-                    break
-            if resultado['folio_fiscal'] != "No encontrado":
-                break
+def buscar_descripcion(texto):
+    """Primera descripción válida según el orden de los patrones"""
+    for patron in PATRONES_DESCRIPCION:
+        for match in patron.finditer(texto):
+            match_limpio = ESPACIOS.sub(' ', str(valor_coincidencia(match)).strip())
+            # Verificar que sea una descripción válida
+            if (10 <= len(match_limpio) <= 200 and
+                    not any(palabra in match_limpio.lower() for palabra in PALABRAS_NO_DESCRIPCION)):
+                return match_limpio
 
-    # BUSCAR FECHA DE LA FACTURA
-    # Múltiples patrones para capturar diferentes formatos de fecha
-    patrones_fecha = [
-        # Fecha con etiquetas específicas de factura
-        r'(?:Fecha\s*de\s*(?:emisión|expedición|factura|comprobante))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        r'(?:Fecha\s*y\s*hora\s*de\s*(?:emisión|expedición))[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-
-        # Formato ISO
-        r'(?:Fecha)[:\s]*(\d{4}-\d{2}-\d{2})',
-
-        # Fecha con hora completa (tomar solo la fecha)
-        r'(?:Fecha\s*de\s*emisión)[:\s]*(\d{4}-\d{2}-\d{2})T\d{2}:\d{2}:\d{2}',
-        r'(?:Fecha)[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+\d{1,2}:\d{2}',
-
-        # Formatos de fecha con texto en español
-        r'(\d{1,2})\s*de\s*(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s*de\s*(\d{2,4})',
-
-        # Formatos generales de fecha (más amplios)
-        r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b',
-        r'\b(\d{4}[/-]\d{1,2}[/-]\d{1,2})\b',
-    ]
+    return None
 
-    meses_espanol = {
-        'enero': '01', 'febrero': '02', 'marzo': '03', 'abril': '04',
-        'mayo': '05', 'junio': '06', 'julio': '07', 'agosto': '08',
-        'septiembre': '09', 'octubre': '10', 'noviembre': '11', 'diciembre': '12'
-    }
 
-    for patron in patrones_fecha:
-        matches = re.findall(patron, texto, re.IGNORECASE)
-        if matches:
-            for match in matches:
-                try:
-                    if isinstance(match, tuple):  # Para fechas con mes en español
-                        dia = match[0].zfill(2)
-                        mes = meses_espanol.get(match[1].lower(), match[1])
-                        año = match[2]
-                        if len(año) == 2:
-                            año = '20' + año
-                        fecha_str = f"{dia}/{mes}/{año}"
-                    else:
-                        fecha_str = str(match).strip()
-
-                    # Normalizar el formato de fecha
-                    fecha_normalizada = normalizar_fecha(fecha_str)
-
-                    if fecha_normalizada:
-                        resultado['fecha_factura'] = fecha_normalizada
-                        break
-
-                except Exception as e:
-                    print(f"   ⚠️ Error procesando fecha {match}: {str(e)}")
-                    continue
-
-            if resultado['fecha_factura'] != "No encontrada":
-                break
+def buscar_folio(texto):
+    """Primer folio fiscal según el orden de los patrones"""
+    for patron in PATRONES_FOLIO:
+        for match in patron.finditer(texto):
+            match_limpio = str(valor_coincidencia(match)).strip()
+            if len(match_limpio) >= 15:  # Los folios fiscales son largos
+                return match_limpio
 
-    return resultado
+    return None
+
+
+def buscar_fecha(texto):
+    """Primera fecha que se pueda normalizar según el orden de los patrones"""
+    for patron in PATRONES_FECHA:
+        for match in patron.finditer(texto):
+            valor = valor_coincidencia(match)
+            try:
+                if isinstance(valor, tuple):  # Para fechas con mes en español
+                    dia = valor[0].zfill(2)
+                    mes = MESES_ESPANOL.get(valor[1].lower(), valor[1])
+                    año = valor[2]
+                    if len(año) == 2:
+                        año = '20' + año
+                    fecha_str = f"{dia}/{mes}/{año}"
+                else:
+                    fecha_str = str(valor).strip()
+
+                # Normalizar el formato de fecha
+                fecha_normalizada = normalizar_fecha(fecha_str)
+
+                if fecha_normalizada:
+                    return fecha_normalizada
+
+            except Exception as e:
+                print(f"   ⚠️ Error procesando fecha {valor}: {str(e)}")
+                continue
+
+    return None
 
 
 def normalizar_fecha(fecha_str):
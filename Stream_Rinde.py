@@ -1,12 +1,12 @@
 import streamlit as st
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import time
 import re
 import io
 from datetime import datetime
 import base64
+from concurrencia import LimitadorPorHost, TASAS_POR_HOST, procesar_en_paralelo
+from cliente_http import MAX_BYTES_PDF, ClienteHTTP
+from enlaces_html import PaginaHTML
 
 # Configuración de la página
 st.set_page_config(
@@ -50,10 +50,17 @@ st.markdown("---")
 
 # Funciones de procesamiento
 @st.cache_data
-def extraer_datos_rindegastos(url, progress_callback=None):
+def extraer_datos_rindegastos(url, progress_callback=None, _cliente=None):
     """
     Extrae datos de RindeGastos manejando correctamente el PDF
+    _cliente (no forma parte de la llave de caché) es la sesión HTTP compartida, con el límite
+    de solicitudes por servidor y los reintentos
     """
+    # Un cliente creado aquí se cierra al terminar (sesión y executor de sondeos)
+    cliente_propio = _cliente is None
+    if cliente_propio:
+        _cliente = ClienteHTTP()
+
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
@@ -62,9 +69,9 @@ def extraer_datos_rindegastos(url, progress_callback=None):
             'Connection': 'keep-alive',
         }
 
-        response = requests.get(url, headers=headers, timeout=20)
+        response = _cliente.get(url, headers=headers, timeout=20)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        pagina = PaginaHTML(response.content)
 
         resultado = {
             'descripcion': "No encontrada",
@@ -75,10 +82,7 @@ def extraer_datos_rindegastos(url, progress_callback=None):
         # Buscar enlaces de descarga
         enlaces_descarga = []
 
-        for link in soup.find_all('a'):
-            texto_link = link.get_text(strip=True)
-            href = link.get('href', '')
-
+        for href, texto_link in pagina.anclas:
             if 'descargar' in texto_link.lower() or 'download' in texto_link.lower():
                 if href:
                     enlaces_descarga.append(href)
@@ -102,9 +106,16 @@ def extraer_datos_rindegastos(url, progress_callback=None):
         # Intentar descargar el PDF
         pdf_procesado = False
 
+        # Solo se descargan los candidatos confirmados como PDF (se sondea el primer KB en paralelo)
+        enlaces_descarga = [enlace if enlace.startswith('http') else 'https://web.rindegastos.com' + enlace
+                            for enlace in enlaces_descarga]
+        enlaces_descarga, _ = _cliente.resolver_pdfs(enlaces_descarga, headers={
+            **headers,
+            'Accept': 'application/pdf,application/octet-stream,*/*',
+            'Referer': url
+        })
+
         for enlace in enlaces_descarga:
-            if not enlace.startswith('http'):
-                enlace = 'https://web.rindegastos.com' + enlace
 
             try:
                 pdf_headers = headers.copy()
@@ -113,15 +124,15 @@ def extraer_datos_rindegastos(url, progress_callback=None):
                     'Referer': url
                 })
 
-                pdf_response = requests.get(enlace, headers=pdf_headers, timeout=30)
-
-                if pdf_response.status_code == 200:
-                    content_length = len(pdf_response.content)
+                # Se lee por bloques: lo que no empieza como PDF se descarta sin leer el resto
+                status_code, _, pdf_content = _cliente.descargar_pdf(
+                    enlace, headers=pdf_headers, timeout=30, max_bytes_memoria=MAX_BYTES_PDF)
 
-                    if content_length > 1000 and pdf_response.content.startswith(b'%PDF'):
+                if status_code == 200:
+                    if pdf_content is not None:
                         try:
                             import pdfplumber
-                            with pdfplumber.open(io.BytesIO(pdf_response.content)) as pdf:
+                            with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
                                 texto_completo = ""
                                 for page in pdf.pages:
                                     texto_pagina = page.extract_text()
@@ -142,7 +153,7 @@ def extraer_datos_rindegastos(url, progress_callback=None):
                         except ImportError:
                             try:
                                 import PyPDF2
-                                pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_response.content))
+                                pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
                                 texto_completo = ""
                                 for page in pdf_reader.pages:
                                     texto_pagina = page.extract_text()
@@ -160,7 +171,7 @@ def extraer_datos_rindegastos(url, progress_callback=None):
                 continue
 
         if not pdf_procesado:
-            texto_html = soup.get_text()
+            texto_html = pagina.texto
             resultado = procesar_texto_factura(texto_html)
 
         return resultado
@@ -172,6 +183,10 @@ def extraer_datos_rindegastos(url, progress_callback=None):
             'fecha_factura': f"Error: {str(e)}"
         }
 
+    finally:
+        if cliente_propio:
+            _cliente.cerrar()
+
 
 def procesar_texto_factura(texto):
     """
@@ -307,7 +322,7 @@ with st.sidebar:
     - Fecha de la factura
     """)
 
-    st.info("💡 El proceso toma ~3 segundos por factura")
+    st.info("💡 Las facturas se procesan en paralelo respetando el límite de solicitudes por servidor")
 
 # Área principal
 col1, col2 = st.columns([2, 1])
@@ -322,12 +337,20 @@ with col1:
 
 with col2:
     st.header("⚙️ Configuración")
-    delay_time = st.slider(
-        "Tiempo de espera entre facturas (segundos)",
+    max_workers = st.slider(
+        "Facturas en paralelo",
         min_value=1,
-        max_value=10,
-        value=3,
-        help="Ajusta el tiempo de espera para evitar bloqueos"
+        max_value=16,
+        value=4,
+        help="Número de facturas que se descargan al mismo tiempo"
+    )
+    tasa_por_host = st.slider(
+        "Solicitudes por segundo por servidor",
+        min_value=0.5,
+        max_value=10.0,
+        value=2.0,
+        step=0.5,
+        help="Ajusta el límite de solicitudes a RindeGastos/S3 para evitar bloqueos"
     )
 
 if uploaded_file is not None:
@@ -353,7 +376,8 @@ if uploaded_file is not None:
             with col2:
                 st.metric("Facturas encontradas", total_facturas)
             with col3:
-                tiempo_estimado = total_facturas * delay_time
+                # ~3 solicitudes por factura, limitadas por servidor
+                tiempo_estimado = int(total_facturas * 3 / tasa_por_host)
                 st.metric("Tiempo estimado", f"{tiempo_estimado // 60}:{tiempo_estimado % 60:02d} min")
 
             # Vista previa de datos
@@ -386,40 +410,51 @@ if uploaded_file is not None:
                     exitosas = 0
                     errores = 0
 
-                    for idx, (index, fila) in enumerate(facturas.iterrows()):
-                        url = fila['URL']
-
-                        if pd.isna(url):
-                            continue
-
-                        # Actualizar progreso
-                        progreso = (idx + 1) / total_facturas
-                        progress_bar.progress(progreso)
-                        status_text.text(
-                            f"Procesando {idx + 1}/{total_facturas} - {fila.get('Comercio', 'Sin nombre')}")
-
-                        # Extraer datos
-                        with st.spinner(f"Extrayendo datos de factura {idx + 1}..."):
-                            datos = extraer_datos_rindegastos(url)
-
-                        # Guardar resultados
-                        facturas.at[index, 'Descripción'] = datos['descripcion']
-                        facturas.at[index, 'Folio Fiscal Extraído'] = datos['folio_fiscal']
-                        facturas.at[index, 'Fecha_factura'] = datos['fecha_factura']
-
-                        # Actualizar contadores y mostrar resultado
-                        if "Error" not in datos['descripcion'] and datos['descripcion'] != "No encontrada":
-                            exitosas += 1
-                            with log_container:
-                                st.success(f"✅ Factura {idx + 1}: {datos['descripcion'][:50]}...")
-                        else:
-                            errores += 1
-                            with log_container:
-                                st.error(f"❌ Factura {idx + 1}: No se pudo extraer información")
-
-                        # Esperar antes de la siguiente
-                        if idx < total_facturas - 1:
-                            time.sleep(delay_time)
+                    limitador = LimitadorPorHost(
+                        tasas={host: tasa_por_host for host in TASAS_POR_HOST},
+                        tasa_defecto=tasa_por_host
+                    )
+                    cliente = ClienteHTTP(max_workers=max_workers, limitador=limitador)
+                    tareas = [(index, (url, None, cliente))
+                              for index, url in facturas['URL'].items() if not pd.isna(url)]
+
+                    status_text.text(f"Procesando {len(tareas)} facturas con {max_workers} hilos en paralelo...")
+
+                    try:
+                        # Los resultados llegan conforme se completan y se escriben en su fila
+                        for idx, (index, datos, error) in enumerate(
+                                procesar_en_paralelo(tareas, extraer_datos_rindegastos, max_workers)):
+                            fila = facturas.loc[index]
+
+                            if error is not None:
+                                datos = {
+                                    'descripcion': f"Error: {str(error)}",
+                                    'folio_fiscal': f"Error: {str(error)}",
+                                    'fecha_factura': f"Error: {str(error)}"
+                                }
+
+                            # Actualizar progreso
+                            progreso = (idx + 1) / len(tareas)
+                            progress_bar.progress(progreso)
+                            status_text.text(
+                                f"Procesadas {idx + 1}/{len(tareas)} - {fila.get('Comercio', 'Sin nombre')}")
+
+                            # Guardar resultados
+                            facturas.at[index, 'Descripción'] = datos['descripcion']
+                            facturas.at[index, 'Folio Fiscal Extraído'] = datos['folio_fiscal']
+                            facturas.at[index, 'Fecha_factura'] = datos['fecha_factura']
+
+                            # Actualizar contadores y mostrar resultado
+                            if "Error" not in datos['descripcion'] and datos['descripcion'] != "No encontrada":
+                                exitosas += 1
+                                with log_container:
+                                    st.success(f"✅ Factura {idx + 1}: {datos['descripcion'][:50]}...")
+                            else:
+                                errores += 1
+                                with log_container:
+                                    st.error(f"❌ Factura {idx + 1}: No se pudo extraer información")
+                    finally:
+                        cliente.cerrar()
 
                     # Actualizar DataFrame original
                     df_final = df.copy()
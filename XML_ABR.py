@@ -4,10 +4,59 @@ import os
 from pathlib import Path
 from datetime import datetime
 import re
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.styles import PatternFill, Font, Alignment
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+from almacen_cfdi import AlmacenCFDI
+from acumulador_cfdi import AcumuladorCFDI, conteo_valores
+from automata_palabras import AutomataPalabras
+from duplicados_cfdi import MOTIVO_MISMO_UUID, separar_duplicados
+from catalogos_sat import (TIPOS_COMPROBANTE, METODOS_PAGO, FORMAS_PAGO, USOS_CFDI,
+                           enriquecer_catalogo, enriquecer_conceptos)
+from hojas_excel import EscritorExcel, FORMATO_MONEDA, anchos_dataframe, anchos_filas
+
+# Emisores que se muestran en la hoja Resumen
+TOP_EMISORES_RESUMEN = 10
+
+# Filas de datos que caben en una hoja de Excel (sin el encabezado)
+MAX_FILAS_EXCEL = 1048575
+
+# Palabras que marcan un comprobante como relacionado con construcción
+PALABRAS_CONSTRUCCION = [
+    'tubo', 'valvula', 'codo', 'cemento', 'adhesivo', 'pintura', 'brocha',
+    'cable', 'foco', 'lampara', 'tornillo', 'clavo', 'herramienta', 'lija',
+    'silicon', 'pegamento', 'varilla', 'alambre', 'malla', 'tabique',
+    'grava', 'arena', 'mortero', 'yeso', 'impermeabilizante', 'sellador'
+]
+
+# DEBUG: textos cuya clasificación se muestra en consola
+DEBUG_EJEMPLOS = ["home depot", "pemex", "hotel", "uber", "comex"]
+
+def resumen_por(df, columna, por_monto=False):
+    """
+    Cantidad y total por valor de la columna en una sola agrupación: [(valor, cantidad, total), ...]
+    Ordenado por cantidad (o por monto), con los empates en orden de aparición
+    """
+    grupos = df.groupby(columna, observed=True, sort=False)['total'].agg(['size', 'sum'])
+    grupos = grupos.sort_values('sum' if por_monto else 'size', ascending=False, kind='stable')
+    return list(grupos.itertuples(name=None))
+
+
+# Catalogador de cada proceso del pool (se crea una vez por proceso)
+_catalogador_proceso = None
+
+
+def _inicializar_proceso(catalogador):
+    """Guarda el catalogador recibido para los XMLs que lea este proceso"""
+    global _catalogador_proceso
+    _catalogador_proceso = catalogador
+
+
+def _leer_xml_en_proceso(archivo_xml):
+    """Lee y clasifica un XML dentro de un proceso del pool"""
+    return _catalogador_proceso.leer_xml_completo(archivo_xml)
 
 
 class CatalogadorXMLsCFDI:
@@ -16,12 +65,21 @@ class CatalogadorXMLsCFDI:
     Genera un catálogo completo con clasificación por categorías corregidas
     """
 
-    def __init__(self, carpetas_cfdi):
+    # Cambiar si se modifica la lógica de clasificar_xml_corregido (invalida lo almacenado)
+    VERSION_CLASIFICACION = 1
+
+    # Cambiar si cambian las columnas que devuelve leer_xml_completo (obliga a volver a leer los XMLs)
+    VERSION_DATOS = 2
+
+    def __init__(self, carpetas_cfdi, ruta_almacen=None):
         if isinstance(carpetas_cfdi, str):
             self.carpetas_cfdi = [carpetas_cfdi]
         else:
             self.carpetas_cfdi = carpetas_cfdi
 
+        # Almacén SQLite con los XMLs ya leídos (None = leer siempre todos los XMLs)
+        self.ruta_almacen = ruta_almacen
+
         self.namespaces = {
             'cfdi': 'http://www.sat.gob.mx/cfd/4',
             'cfdi3': 'http://www.sat.gob.mx/cfd/3',
@@ -211,39 +269,64 @@ class CatalogadorXMLsCFDI:
             }
         }
 
+        self.preparar_clasificador()
+
+    def preparar_clasificador(self):
+        """
+        Compila emisores, palabras clave y palabras de construcción en un solo autómata
+        Cada patrón distinto guarda los (categoría, peso) que suma; los repetidos suman cada vez
+        """
+        indices = {}
+        self._patrones_clasificacion = []
+        self._pesos_patron = []
+
+        def indice_patron(patron):
+            patron = patron.lower()
+            if patron not in indices:
+                indices[patron] = len(self._patrones_clasificacion)
+                self._patrones_clasificacion.append(patron)
+                self._pesos_patron.append([])
+            return indices[patron]
+
+        self._nombres_categorias = list(self.categorias_corregidas)
+        for indice_categoria, criterios in enumerate(self.categorias_corregidas.values()):
+            for emisor in criterios['emisores']:
+                self._pesos_patron[indice_patron(emisor)].append((indice_categoria, 5))  # Mayor peso para emisores
+            for palabra in criterios['palabras_clave']:
+                self._pesos_patron[indice_patron(palabra)].append((indice_categoria, 1))
+
+        self._patrones_construccion = {indice_patron(palabra) for palabra in PALABRAS_CONSTRUCCION}
+        self._patrones_debug = {indice_patron(ejemplo) for ejemplo in DEBUG_EJEMPLOS}
+
+        self._automata_clasificacion = AutomataPalabras(self._patrones_clasificacion)
+
     def clasificar_xml_corregido(self, datos):
         """
         Clasifica el XML usando las categorías corregidas del Excel
         """
         texto_busqueda = f"{datos['emisor_nombre']} {datos['descripcion_concatenada']}".lower()
 
+        # Una sola pasada sobre el texto para todos los patrones
+        encontrados = self._automata_clasificacion.encontrar(texto_busqueda)
+
         # DEBUG: Mostrar algunos ejemplos de clasificación
-        debug_ejemplos = ["home depot", "pemex", "hotel", "uber", "comex"]
-        if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
+        depurar = not encontrados.isdisjoint(self._patrones_debug)
+        if depurar:
             print(f"\nDEBUG Clasificación: {datos['emisor_nombre']}")
             print(f"  Texto búsqueda: {texto_busqueda[:100]}...")
+            self.mostrar_coincidencias(encontrados)
+
+        # Sumar +5 por emisor y +1 por palabra clave encontrados
+        puntuaciones = [0] * len(self._nombres_categorias)
+        for indice in encontrados:
+            for indice_categoria, peso in self._pesos_patron[indice]:
+                puntuaciones[indice_categoria] += peso
 
-        # Buscar categoría
+        # Buscar categoría (en empate gana la primera)
         mejor_categoria = 'Miscelaneos'
         mejor_puntuacion = 0
 
-        for categoria, criterios in self.categorias_corregidas.items():
-            puntuacion = 0
-
-            # Verificar emisores
-            for emisor in criterios['emisores']:
-                if emisor.lower() in texto_busqueda:
-                    puntuacion += 5  # Mayor peso para emisores
-                    if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
-                        print(f"    Emisor match: {emisor} -> {categoria} (+5)")
-
-            # Verificar palabras clave
-            for palabra in criterios['palabras_clave']:
-                if palabra.lower() in texto_busqueda:
-                    puntuacion += 1
-                    if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
-                        print(f"    Palabra match: {palabra} -> {categoria} (+1)")
-
+        for categoria, puntuacion in zip(self._nombres_categorias, puntuaciones):
             if puntuacion > mejor_puntuacion:
                 mejor_puntuacion = puntuacion
                 mejor_categoria = categoria
@@ -257,18 +340,11 @@ class CatalogadorXMLsCFDI:
         datos['categoria'] = mejor_categoria
         datos['confianza_categoria'] = mejor_puntuacion
 
-        if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
+        if depurar:
             print(f"    RESULTADO: {mejor_categoria} (puntuación: {mejor_puntuacion})")
 
         # Verificar si es construcción (mantener esta funcionalidad)
-        palabras_construccion = [
-            'tubo', 'valvula', 'codo', 'cemento', 'adhesivo', 'pintura', 'brocha',
-            'cable', 'foco', 'lampara', 'tornillo', 'clavo', 'herramienta', 'lija',
-            'silicon', 'pegamento', 'varilla', 'alambre', 'malla', 'tabique',
-            'grava', 'arena', 'mortero', 'yeso', 'impermeabilizante', 'sellador'
-        ]
-
-        datos['es_construccion'] = any(palabra in texto_busqueda for palabra in palabras_construccion)
+        datos['es_construccion'] = not encontrados.isdisjoint(self._patrones_construccion)
 
         # Extraer palabras clave
         palabras = texto_busqueda.split()
@@ -277,19 +353,97 @@ class CatalogadorXMLsCFDI:
 
         return datos
 
+    def mostrar_coincidencias(self, encontrados):
+        """DEBUG: emisores y palabras clave encontrados, en el orden de las categorías"""
+        textos = {self._patrones_clasificacion[indice] for indice in encontrados}
+
+        for categoria, criterios in self.categorias_corregidas.items():
+            for emisor in criterios['emisores']:
+                if emisor.lower() in textos:
+                    print(f"    Emisor match: {emisor} -> {categoria} (+5)")
+            for palabra in criterios['palabras_clave']:
+                if palabra.lower() in textos:
+                    print(f"    Palabra match: {palabra} -> {categoria} (+1)")
+
+    def recorrer_xml(self, archivo_xml):
+        """
+        Recorre el XML una sola vez (iterparse) y junta los atributos de comprobante, emisor,
+        receptor, timbre, conceptos e impuestos. Cada elemento se libera al cerrarse, así la
+        memoria no crece con el tamaño de los conceptos, Addenda o complementos.
+        Como con find('.//...'), de emisor, receptor, timbre e impuestos se toma el primero
+        que aparece en el documento.
+        """
+        lectura = {
+            'comprobante': None,
+            'version': '',
+            'emisor': None,
+            'receptor': None,
+            'timbre': None,
+            'impuestos': None,
+            'conceptos': [],
+            'traslados': [],
+            'retenciones': [],
+            'tiene_complemento': False,
+            'tiene_addenda': False,
+        }
+        tag_timbre = f"{{{self.namespaces['tfd']}}}TimbreFiscalDigital"
+        abiertos = []
+
+        for evento, elem in ET.iterparse(archivo_xml, events=('start', 'end')):
+            if evento == 'end':
+                # Liberar el elemento y quitarlo de su padre (siempre es el primer hijo restante)
+                abiertos.pop()
+                elem.clear()
+                if abiertos:
+                    abiertos[-1].remove(elem)
+                continue
+
+            if not abiertos:
+                # Elemento raíz: determinar versión y namespace
+                lectura['comprobante'] = dict(elem.attrib)
+                lectura['version'] = elem.get('Version', '4.0')
+                uri = self.namespaces['cfdi3'] if lectura['version'].startswith('3') else self.namespaces['cfdi']
+                tags = {
+                    f"{{{uri}}}Emisor": 'emisor',
+                    f"{{{uri}}}Receptor": 'receptor',
+                    f"{{{uri}}}Impuestos": 'impuestos',
+                    tag_timbre: 'timbre',
+                }
+                tag_concepto = f"{{{uri}}}Concepto"
+                tag_traslado = f"{{{uri}}}Traslado"
+                tag_retencion = f"{{{uri}}}Retencion"
+                tag_complemento = f"{{{uri}}}Complemento"
+                tag_addenda = f"{{{uri}}}Addenda"
+                abiertos.append(elem)
+                continue
+
+            abiertos.append(elem)
+            tag = elem.tag
+
+            if tag == tag_concepto:
+                lectura['conceptos'].append(dict(elem.attrib))
+            elif tag == tag_traslado:
+                lectura['traslados'].append(elem.get('Impuesto', ''))
+            elif tag == tag_retencion:
+                lectura['retenciones'].append(elem.get('Impuesto', ''))
+            elif tag in tags:
+                if lectura[tags[tag]] is None:
+                    lectura[tags[tag]] = dict(elem.attrib)
+            elif tag == tag_complemento:
+                lectura['tiene_complemento'] = True
+            elif tag == tag_addenda:
+                lectura['tiene_addenda'] = True
+
+        return lectura
+
     def leer_xml_completo(self, archivo_xml):
         """
         Lee un archivo XML y extrae TODA la información relevante
         """
         try:
-            tree = ET.parse(archivo_xml)
-            root = tree.getroot()
-
-            # Determinar versión y namespace
-            version = root.get('Version', '4.0')
-            ns = self.namespaces.copy()
-            if version.startswith('3'):
-                ns['cfdi'] = ns['cfdi3']
+            lectura = self.recorrer_xml(archivo_xml)
+            comprobante = lectura['comprobante']
+            version = lectura['version']
 
             # Datos básicos del comprobante
             datos = {
@@ -300,27 +454,24 @@ class CatalogadorXMLsCFDI:
 
                 # Datos del comprobante
                 'version_cfdi': version,
-                'serie': root.get('Serie', ''),
-                'folio': root.get('Folio', ''),
-                'fecha': root.get('Fecha', ''),
+                'serie': comprobante.get('Serie', ''),
+                'folio': comprobante.get('Folio', ''),
+                'fecha': comprobante.get('Fecha', ''),
                 'fecha_parsed': None,
                 'mes': '',
                 'año': '',
-                'tipo_comprobante': root.get('TipoDeComprobante', ''),
-                'tipo_comprobante_desc': self.obtener_tipo_comprobante(root.get('TipoDeComprobante', '')),
-                'lugar_expedicion': root.get('LugarExpedicion', ''),
-                'metodo_pago': root.get('MetodoPago', ''),
-                'metodo_pago_desc': self.obtener_metodo_pago(root.get('MetodoPago', '')),
-                'forma_pago': root.get('FormaPago', ''),
-                'forma_pago_desc': self.obtener_forma_pago(root.get('FormaPago', '')),
-                'condiciones_pago': root.get('CondicionesDePago', ''),
-                'moneda': root.get('Moneda', 'MXN'),
-                'tipo_cambio': root.get('TipoCambio', '1'),
+                'tipo_comprobante': comprobante.get('TipoDeComprobante', ''),
+                'lugar_expedicion': comprobante.get('LugarExpedicion', ''),
+                'metodo_pago': comprobante.get('MetodoPago', ''),
+                'forma_pago': comprobante.get('FormaPago', ''),
+                'condiciones_pago': comprobante.get('CondicionesDePago', ''),
+                'moneda': comprobante.get('Moneda', 'MXN'),
+                'tipo_cambio': comprobante.get('TipoCambio', '1'),
 
                 # Montos
-                'subtotal': float(root.get('SubTotal', '0')),
-                'descuento': float(root.get('Descuento', '0')),
-                'total': float(root.get('Total', '0')),
+                'subtotal': float(comprobante.get('SubTotal', '0')),
+                'descuento': float(comprobante.get('Descuento', '0')),
+                'total': float(comprobante.get('Total', '0')),
 
                 # Emisor
                 'emisor_rfc': '',
@@ -331,7 +482,6 @@ class CatalogadorXMLsCFDI:
                 'receptor_rfc': '',
                 'receptor_nombre': '',
                 'receptor_uso_cfdi': '',
-                'receptor_uso_cfdi_desc': '',
                 'receptor_domicilio_fiscal': '',
                 'receptor_regimen': '',
 
@@ -380,24 +530,23 @@ class CatalogadorXMLsCFDI:
                     pass
 
             # Emisor
-            emisor = root.find('.//cfdi:Emisor', ns)
+            emisor = lectura['emisor']
             if emisor is not None:
                 datos['emisor_rfc'] = emisor.get('Rfc', '')
                 datos['emisor_nombre'] = emisor.get('Nombre', '')
                 datos['emisor_regimen'] = emisor.get('RegimenFiscal', '')
 
             # Receptor
-            receptor = root.find('.//cfdi:Receptor', ns)
+            receptor = lectura['receptor']
             if receptor is not None:
                 datos['receptor_rfc'] = receptor.get('Rfc', '')
                 datos['receptor_nombre'] = receptor.get('Nombre', '')
                 datos['receptor_uso_cfdi'] = receptor.get('UsoCFDI', '')
-                datos['receptor_uso_cfdi_desc'] = self.obtener_uso_cfdi(receptor.get('UsoCFDI', ''))
                 datos['receptor_domicilio_fiscal'] = receptor.get('DomicilioFiscalReceptor', '')
                 datos['receptor_regimen'] = receptor.get('RegimenFiscalReceptor', '')
 
             # Timbre fiscal
-            timbre = root.find('.//tfd:TimbreFiscalDigital', ns)
+            timbre = lectura['timbre']
             if timbre is not None:
                 datos['uuid'] = timbre.get('UUID', '')
                 datos['fecha_timbrado'] = timbre.get('FechaTimbrado', '')
@@ -406,7 +555,7 @@ class CatalogadorXMLsCFDI:
                 datos['rfc_prov_certif'] = timbre.get('RfcProvCertif', '')
 
             # Conceptos
-            conceptos = root.findall('.//cfdi:Concepto', ns)
+            conceptos = lectura['conceptos']
             descripciones = []
 
             for concepto in conceptos:
@@ -441,29 +590,25 @@ class CatalogadorXMLsCFDI:
             datos['descripcion_concatenada'] = " | ".join(descripciones[:5])  # Máximo 5 conceptos
 
             # Impuestos
-            impuestos = root.find('.//cfdi:Impuestos', ns)
+            impuestos = lectura['impuestos']
             if impuestos is not None:
                 datos['total_impuestos_trasladados'] = float(impuestos.get('TotalImpuestosTrasladados', '0'))
                 datos['total_impuestos_retenidos'] = float(impuestos.get('TotalImpuestosRetenidos', '0'))
 
                 # Verificar tipos de impuestos
-                for traslado in root.findall('.//cfdi:Traslado', ns):
-                    impuesto = traslado.get('Impuesto', '')
+                for impuesto in lectura['traslados']:
                     if impuesto == '002':
                         datos['tiene_iva'] = True
                     elif impuesto == '003':
                         datos['tiene_ieps'] = True
 
-                for retencion in root.findall('.//cfdi:Retencion', ns):
-                    if retencion.get('Impuesto', '') == '001':
+                for impuesto in lectura['retenciones']:
+                    if impuesto == '001':
                         datos['tiene_isr'] = True
 
             # Verificar complementos y addendas
-            if root.find('.//cfdi:Complemento', ns) is not None:
-                datos['tiene_complemento'] = True
-
-            if root.find('.//cfdi:Addenda', ns) is not None:
-                datos['tiene_addenda'] = True
+            datos['tiene_complemento'] = lectura['tiene_complemento']
+            datos['tiene_addenda'] = lectura['tiene_addenda']
 
             # Clasificar usando el método corregido
             datos = self.clasificar_xml_corregido(datos)
@@ -476,134 +621,213 @@ class CatalogadorXMLsCFDI:
 
     def obtener_tipo_comprobante(self, codigo):
         """Devuelve la descripción del tipo de comprobante"""
-        tipos = {
-            'I': 'Ingreso',
-            'E': 'Egreso',
-            'T': 'Traslado',
-            'N': 'Nómina',
-            'P': 'Pago'
-        }
-        return tipos.get(codigo, codigo)
+        return TIPOS_COMPROBANTE.get(codigo, codigo)
 
     def obtener_metodo_pago(self, codigo):
         """Devuelve la descripción del método de pago"""
-        metodos = {
-            'PUE': 'Pago en una sola exhibición',
-            'PPD': 'Pago en parcialidades o diferido'
-        }
-        return metodos.get(codigo, codigo)
+        return METODOS_PAGO.get(codigo, codigo)
 
     def obtener_forma_pago(self, codigo):
         """Devuelve la descripción de la forma de pago"""
-        formas = {
-            '01': 'Efectivo',
-            '02': 'Cheque nominativo',
-            '03': 'Transferencia electrónica',
-            '04': 'Tarjeta de crédito',
-            '28': 'Tarjeta de débito',
-            '99': 'Por definir'
-        }
-        return formas.get(codigo, codigo)
+        return FORMAS_PAGO.get(codigo, codigo)
 
     def obtener_uso_cfdi(self, codigo):
         """Devuelve la descripción del uso del CFDI"""
-        usos = {
-            'G01': 'Adquisición de mercancías',
-            'G02': 'Devoluciones, descuentos o bonificaciones',
-            'G03': 'Gastos en general',
-            'I01': 'Construcciones',
-            'I02': 'Mobiliario y equipo de oficina',
-            'I03': 'Equipo de transporte',
-            'I04': 'Equipo de cómputo',
-            'I05': 'Dados, troqueles, moldes',
-            'I06': 'Comunicaciones telefónicas',
-            'I07': 'Comunicaciones satelitales',
-            'I08': 'Otra maquinaria y equipo',
-            'D01': 'Honorarios médicos y gastos hospitalarios',
-            'D02': 'Gastos médicos por incapacidad',
-            'D03': 'Gastos funerales',
-            'D04': 'Donativos',
-            'D05': 'Intereses hipotecarios',
-            'D06': 'Aportaciones voluntarias al SAR',
-            'D07': 'Primas por seguros de gastos médicos',
-            'D08': 'Gastos de transportación escolar',
-            'D09': 'Depósitos en cuentas para el ahorro',
-            'D10': 'Pagos por servicios educativos',
-            'S01': 'Sin efectos fiscales',
-            'CP01': 'Pagos',
-            'CN01': 'Nómina'
-        }
-        return usos.get(codigo, codigo)
+        return USOS_CFDI.get(codigo, codigo)
+
+    def leer_xmls(self, archivos, workers=1):
+        """
+        Lee y clasifica los XMLs en el mismo orden de la lista
+        Con workers > 1 se reparten en bloques entre varios procesos
+        """
+        if workers <= 1 or len(archivos) < 2:
+            for archivo_xml in archivos:
+                yield self.leer_xml_completo(archivo_xml)
+            return
+
+        # Bloques pequeños para repartir bien la carga; map conserva el orden de entrada
+        tamano_bloque = max(1, min(100, len(archivos) // (workers * 8)))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_proceso,
+                                 initargs=(self,)) as executor:
+            yield from executor.map(_leer_xml_en_proceso, archivos, chunksize=tamano_bloque)
+
+    def firma_clasificacion(self):
+        """Identifica las reglas de clasificación vigentes y la forma de los datos"""
+        reglas = f"{self.VERSION_DATOS}|{self.VERSION_CLASIFICACION}|{self.categorias_corregidas!r}"
+        return hashlib.sha256(reglas.encode('utf-8')).hexdigest()[:16]
+
+    def abrir_almacen(self):
+        """Abre el almacén de XMLs ya leídos"""
+        return AlmacenCFDI(self.ruta_almacen, self.VERSION_DATOS)
+
+    def leer_xmls_incremental(self, archivos, workers=1, almacen=None):
+        """
+        Igual que leer_xmls pero usando el almacén: solo se leen los archivos nuevos o
+        modificados; los demás se toman del almacén (reclasificados si cambiaron las reglas)
+        almacen: un almacén ya abierto (p. ej. el usado para buscar duplicados); se cierra al terminar
+        """
+        if almacen is None:
+            almacen = self.abrir_almacen()
+        firma = self.firma_clasificacion()
 
-    def generar_catalogo_excel(self, archivo_salida):
+        # Primero las huellas (sin leer los XMLs) para saber cuáles hay que leer
+        huellas = [almacen.huella(archivo_xml) for archivo_xml in archivos]
+        pendientes = [archivo_xml for archivo_xml, (vigente, _) in zip(archivos, huellas) if not vigente]
+
+        print(f"\n💾 Almacén: {len(archivos) - len(pendientes)} XMLs sin cambios, {len(pendientes)} por leer")
+
+        # Los resultados salen en el orden de los archivos, sin juntarlos todos en memoria
+        lecturas = self.leer_xmls(pendientes, workers)
+        reclasificados = 0
+
+        try:
+            for archivo_xml, (vigente, huella) in zip(archivos, huellas):
+                if not vigente:
+                    datos = next(lecturas)
+                    almacen.guardar(archivo_xml, huella, datos, firma)
+                else:
+                    datos, firma_guardada = almacen.obtener(archivo_xml)
+                    if datos and firma_guardada != firma:
+                        datos = self.clasificar_xml_corregido(datos)
+                        almacen.guardar(archivo_xml, huella, datos, firma)
+                        reclasificados += 1
+
+                yield datos
+        finally:
+            almacen.cerrar()
+
+        if reclasificados:
+            print(f"   💾 Reclasificados con las reglas actuales: {reclasificados}")
+
+    def generar_catalogo_excel(self, archivo_salida, workers=1):
         """
         Genera un catálogo Excel completo con múltiples hojas usando categorías corregidas
+        workers: número de procesos para leer y clasificar los XMLs (1 = serial)
         """
         print("\n📊 Generando catálogo de XMLs con categorías corregidas...")
 
-        # Leer todos los XMLs
-        todos_xmls = []
-
+        # Archivos de todas las carpetas, en el mismo orden que el recorrido serial
+        archivos = []
         for carpeta in self.carpetas_cfdi:
             if not os.path.exists(carpeta):
                 print(f"⚠️  Carpeta no encontrada: {carpeta}")
                 continue
 
-            print(f"\n📁 Procesando: {carpeta}")
-            count = 0
+            archivos.extend((carpeta, archivo_xml) for archivo_xml in Path(carpeta).glob("*.xml"))
+
+        # Duplicados antes de leer: copias idénticas o mismo UUID (p. ej. en CFDI Junio y CFDI Julio)
+        # Con almacén, los archivos sin cambios toman su hash y UUID de él sin volver a leerse
+        almacen = self.abrir_almacen() if self.ruta_almacen else None
 
-            for archivo_xml in Path(carpeta).glob("*.xml"):
-                datos = self.leer_xml_completo(archivo_xml)
-                if datos:
-                    todos_xmls.append(datos)
-                    count += 1
+        print(f"\n🔍 Buscando duplicados en {len(archivos)} archivos...")
+        archivos, duplicados_previos = separar_duplicados(archivos, almacen)
+        if duplicados_previos:
+            print(f"⚠️  {len(duplicados_previos)} XMLs duplicados se omiten sin leerlos")
 
-                    if count % 50 == 0:
-                        print(f"   Procesados: {count} XMLs...")
+        if workers > 1:
+            print(f"\n⚙️ Leyendo {len(archivos)} XMLs con {workers} procesos")
 
-            print(f"   ✅ Total en {os.path.basename(carpeta)}: {count}")
+        # Leer todos los XMLs (directo a columnas, sin guardar un diccionario por XML)
+        acumulador = AcumuladorCFDI()
+        conteo_por_carpeta = defaultdict(int)
+
+        rutas = [archivo_xml for _, archivo_xml in archivos]
+        if almacen is not None:
+            lecturas = self.leer_xmls_incremental(rutas, workers, almacen)
+        else:
+            lecturas = self.leer_xmls(rutas, workers)
 
-        print(f"\n📊 Total XMLs procesados: {len(todos_xmls)}")
+        for (carpeta, archivo_xml), datos in zip(archivos, lecturas):
+            if datos:
+                acumulador.agregar(datos)
+                conteo_por_carpeta[carpeta] += 1
 
-        if not todos_xmls:
+                if len(acumulador) % 50 == 0:
+                    print(f"   Procesados: {len(acumulador)} XMLs...")
+
+        for carpeta in self.carpetas_cfdi:
+            if os.path.exists(carpeta):
+                print(f"   ✅ Total en {os.path.basename(carpeta)}: {conteo_por_carpeta[carpeta]}")
+
+        print(f"\n📊 Total XMLs procesados: {len(acumulador)}")
+
+        if not len(acumulador):
             print("❌ No se encontraron XMLs para procesar")
             return
 
         # Convertir a DataFrame
-        df = pd.DataFrame(todos_xmls)
+        df = acumulador.dataframe()
+
+        # Descripciones de los códigos SAT (una consulta por código distinto)
+        df = enriquecer_catalogo(df)
 
         # DEBUG: Verificar categorías antes de eliminar duplicados
         print(f"\n🔍 Verificando clasificación inicial...")
         if 'categoria' in df.columns:
-            categorias_inicial = df['categoria'].value_counts()
+            categorias_inicial = conteo_valores(df['categoria'])
             print(f"   Categorías encontradas: {len(categorias_inicial)}")
             for cat, count in categorias_inicial.head(5).items():
                 print(f"   - {cat}: {count}")
         else:
             print("   ❌ ERROR: No se encontró columna 'categoria'")
 
-        # Identificar y eliminar duplicados por UUID
+        # Identificar y eliminar duplicados por UUID que no se detectaron antes de leer
+        # (los XMLs sin timbre tienen UUID vacío y no son duplicados entre sí)
         print("\n🔍 Buscando duplicados...")
-        duplicados_antes = len(df)
-
-        # Marcar duplicados antes de eliminarlos
-        df['es_duplicado'] = df.duplicated(subset=['uuid'], keep='first')
-        num_duplicados = df['es_duplicado'].sum()
 
+        es_duplicado = (df['uuid'] != '') & df.duplicated(subset=['uuid'], keep='first')
+        df_duplicados = df[es_duplicado].copy()
+        df_duplicados['motivo_duplicado'] = MOTIVO_MISMO_UUID
+        df_duplicados['duplicado_de'] = df_duplicados['uuid'].map(
+            df[~es_duplicado & (df['uuid'] != '')].set_index('uuid')['ruta_completa'])
+        df = df[~es_duplicado].copy()
+
+        # Duplicados omitidos antes de leer: se muestran con los datos del archivo original
+        if duplicados_previos:
+            # Un original que resultó duplicado por UUID se reemplaza por el archivo que se conservó
+            conservado = df_duplicados.set_index('ruta_completa')['duplicado_de']
+            fila_por_ruta = pd.Series(df.index, index=df['ruta_completa'])
+
+            previos = []
+            copias_ilegibles = 0
+            for duplicado in duplicados_previos:
+                original = str(duplicado['original'])
+                motivo = duplicado['motivo']
+                if original in conservado.index:
+                    original = conservado[original]
+                    motivo = MOTIVO_MISMO_UUID
+
+                # Copias de un XML que no se pudo leer: no duplican nada del catálogo
+                if original not in fila_por_ruta.index:
+                    copias_ilegibles += 1
+                    continue
+                previos.append((duplicado['archivo'], motivo, original))
+
+            if copias_ilegibles:
+                print(f"⚠️  {copias_ilegibles} copias de XMLs que no se pudieron leer (no se listan como duplicados)")
+
+            if previos:
+                df_previos = df.loc[fila_por_ruta[[original for _, _, original in previos]].to_numpy()].copy()
+                df_previos['archivo'] = [archivo.name for archivo, _, _ in previos]
+                df_previos['carpeta'] = [archivo.parent.name for archivo, _, _ in previos]
+                df_previos['motivo_duplicado'] = [motivo for _, motivo, _ in previos]
+                df_previos['duplicado_de'] = [original for _, _, original in previos]
+                df_duplicados = pd.concat([df_previos, df_duplicados], ignore_index=True)
+
+        num_duplicados = len(df_duplicados)
         if num_duplicados > 0:
             print(f"⚠️  Encontrados {num_duplicados} XMLs duplicados")
-            df_duplicados = df[df['es_duplicado']].copy()
-            df = df[~df['es_duplicado']].copy()
-            df = df.drop('es_duplicado', axis=1)
+            for motivo, cantidad in df_duplicados['motivo_duplicado'].value_counts().items():
+                print(f"   - {motivo}: {cantidad}")
             print(f"✅ Duplicados eliminados: {num_duplicados}")
             print(f"📊 XMLs únicos restantes: {len(df)}")
         else:
             print("✅ No se encontraron duplicados")
-            df = df.drop('es_duplicado', axis=1)
-            df_duplicados = pd.DataFrame()
 
         # Crear libro de Excel con las mismas hojas que antes pero con categorías corregidas
-        wb = Workbook()
+        # (modo de solo escritura: cada hoja se escribe de una vez y los anchos se calculan antes)
+        escritor = EscritorExcel()
 
         # Estilos
         header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
@@ -611,24 +835,11 @@ class CatalogadorXMLsCFDI:
         subheader_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
         subheader_font = Font(color="FFFFFF", bold=True)
         highlight_fill = PatternFill(start_color="FFE699", end_color="FFE699", fill_type="solid")
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
 
         # 1. HOJA RESUMEN
-        ws_resumen = wb.active
-        ws_resumen.title = "Resumen"
-
-        ws_resumen.merge_cells('A1:E1')
-        ws_resumen['A1'] = "CATÁLOGO DE COMPROBANTES FISCALES (CFDI) - CATEGORÍAS CORREGIDAS"
-        ws_resumen['A1'].font = Font(size=16, bold=True)
-        ws_resumen['A1'].alignment = Alignment(horizontal='center')
+        titulo_resumen = "CATÁLOGO DE COMPROBANTES FISCALES (CFDI) - CATEGORÍAS CORREGIDAS"
 
         # Estadísticas
-        row = 3
         estadisticas = [
             ["ESTADÍSTICAS GENERALES", "", ""],
             ["Total de XMLs:", len(df), ""],
@@ -639,9 +850,8 @@ class CatalogadorXMLsCFDI:
         ]
 
         # Agregar conteo por tipo
-        for tipo, count in df['tipo_comprobante_desc'].value_counts().items():
-            estadisticas.append(
-                [f"  {tipo}:", count, f"${df[df['tipo_comprobante_desc'] == tipo]['total'].sum():,.2f}"])
+        for tipo, count, suma in resumen_por(df, 'tipo_comprobante_desc'):
+            estadisticas.append([f"  {tipo}:", count, f"${suma:,.2f}"])
 
         estadisticas.extend([
             ["", "", ""],
@@ -650,9 +860,7 @@ class CatalogadorXMLsCFDI:
 
         # Agregar conteo por categoría corregida
         if 'categoria' in df.columns and len(df) > 0:
-            categorias_unicas = df['categoria'].value_counts()
-            for cat, count in categorias_unicas.items():
-                total_cat = df[df['categoria'] == cat]['total'].sum()
+            for cat, count, total_cat in resumen_por(df, 'categoria'):
                 estadisticas.append([f"  {cat}:", count, f"${total_cat:,.2f}"])
         else:
             estadisticas.append(["  Error: Sin categorías definidas", "", ""])
@@ -664,68 +872,57 @@ class CatalogadorXMLsCFDI:
 
         # Agregar por mes
         if len(df) > 0:
-            df_por_mes = df.groupby(['año', 'mes'])['total'].agg(['count', 'sum']).reset_index()
-            for idx in range(len(df_por_mes)):
-                año = df_por_mes.iloc[idx]['año']
-                mes = df_por_mes.iloc[idx]['mes']
-                cantidad = df_por_mes.iloc[idx]['count']
-                suma = df_por_mes.iloc[idx]['sum']
+            df_por_mes = df.groupby(['año', 'mes'], observed=True)['total'].agg(['count', 'sum']).reset_index()
+            for año, mes, cantidad, suma in df_por_mes.itertuples(index=False, name=None):
                 estadisticas.append([f"  {año}-{mes}:", cantidad, f"${suma:,.2f}"])
 
-        # Escribir estadísticas
-        for stat in estadisticas:
-            ws_resumen[f'A{row}'] = str(stat[0])
-            ws_resumen[f'C{row}'] = stat[1] if stat[1] != "" else ""
-            ws_resumen[f'E{row}'] = str(stat[2]) if stat[2] != "" else ""
+        estadisticas.extend([
+            ["", "", ""],
+            [f"POR EMISOR (TOP {TOP_EMISORES_RESUMEN} POR MONTO)", "", ""],
+        ])
 
-            if stat[0] and isinstance(stat[0], str) and stat[0].isupper() and not stat[0].startswith('  '):
-                ws_resumen[f'A{row}'].font = Font(bold=True)
-                ws_resumen[f'A{row}'].fill = subheader_fill
-                ws_resumen[f'A{row}'].font = subheader_font
-            row += 1
+        # Agregar principales emisores
+        for emisor, count, suma in resumen_por(df, 'emisor_nombre', por_monto=True)[:TOP_EMISORES_RESUMEN]:
+            estadisticas.append([f"  {emisor}:", count, f"${suma:,.2f}"])
 
-        # Ajustar anchos
-        ws_resumen.column_dimensions['A'].width = 35
-        ws_resumen.column_dimensions['C'].width = 15
-        ws_resumen.column_dimensions['E'].width = 20
+        # Filas de la hoja: columnas A, C y E (B y D quedan vacías)
+        filas_resumen = [
+            [str(stat[0]), None, stat[1] if stat[1] != "" else "", None, str(stat[2]) if stat[2] != "" else ""]
+            for stat in estadisticas
+        ]
 
-        # 2. HOJA CATÁLOGO COMPLETO
-        ws_catalogo = wb.create_sheet("Catálogo Completo")
+        ws_resumen = escritor.crear_hoja("Resumen", anchos_filas([[titulo_resumen]] + filas_resumen))
+        escritor.titulo(ws_resumen, titulo_resumen, 'A1:E1', Font(size=16, bold=True))
+        ws_resumen.append([])
 
+        # Escribir estadísticas
+        celda_subtitulo = escritor.celda(ws_resumen, fill=subheader_fill, font=subheader_font)
+        for stat, fila in zip(estadisticas, filas_resumen):
+            if stat[0] and isinstance(stat[0], str) and stat[0].isupper() and not stat[0].startswith('  '):
+                celda_subtitulo.value = fila[0]
+                fila[0] = celda_subtitulo
+            ws_resumen.append(fila)
+
+        # 2. HOJA CATÁLOGO COMPLETO
         # Seleccionar columnas para mostrar
         columnas_catalogo = [
             'fecha', 'emisor_nombre', 'emisor_rfc', 'total', 'descripcion_concatenada',
             'uuid', 'categoria', 'tipo_comprobante_desc', 'metodo_pago_desc',
-            'forma_pago_desc', 'carpeta'
+            'forma_pago_desc', 'carpeta', 'emisor_regimen_desc', 'receptor_uso_cfdi_desc'
         ]
 
         df_catalogo = df[columnas_catalogo].copy()
         df_catalogo.columns = [
             'Fecha', 'Emisor', 'RFC Emisor', 'Total', 'Descripción',
-            'UUID', 'Categoría', 'Tipo', 'Método Pago', 'Forma Pago', 'Carpeta'
+            'UUID', 'Categoría', 'Tipo', 'Método Pago', 'Forma Pago', 'Carpeta', 'Régimen Emisor', 'Uso CFDI'
         ]
 
-        # Escribir datos
-        for r_idx, row in enumerate(dataframe_to_rows(df_catalogo, index=False, header=True), 1):
-            for c_idx, value in enumerate(row, 1):
-                cell = ws_catalogo.cell(row=r_idx, column=c_idx, value=value)
-
-                if r_idx == 1:
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = Alignment(horizontal='center')
-
-                # Formato de moneda para columna Total
-                if c_idx == 4 and r_idx > 1:  # Columna Total
-                    cell.number_format = '$#,##0.00'
-
-                cell.border = border
+        escritor.hoja_dataframe("Catálogo Completo", df_catalogo, header_fill, header_font,
+                                columnas_moneda=(4,), header_alignment=Alignment(horizontal='center'))
 
         # 3. HOJA POR EMISOR
-        ws_emisores = wb.create_sheet("Por Emisor")
-
         # Agrupar por emisor
-        df_emisores = df.groupby(['emisor_nombre', 'emisor_rfc', 'categoria']).agg({
+        df_emisores = df.groupby(['emisor_nombre', 'emisor_rfc', 'categoria'], observed=True).agg({
             'total': ['count', 'sum'],
             'uuid': 'count'
         }).reset_index()
@@ -733,23 +930,9 @@ class CatalogadorXMLsCFDI:
         df_emisores.columns = ['Emisor', 'RFC', 'Categoría', 'Cantidad', 'Total', 'Facturas']
         df_emisores = df_emisores.sort_values('Total', ascending=False)
 
-        # Escribir datos
-        for r_idx, row in enumerate(dataframe_to_rows(df_emisores, index=False, header=True), 1):
-            for c_idx, value in enumerate(row, 1):
-                cell = ws_emisores.cell(row=r_idx, column=c_idx, value=value)
-
-                if r_idx == 1:
-                    cell.fill = header_fill
-                    cell.font = header_font
-
-                if c_idx == 5 and r_idx > 1:  # Columna Total
-                    cell.number_format = '$#,##0.00'
-
-                cell.border = border
+        escritor.hoja_dataframe("Por Emisor", df_emisores, header_fill, header_font, columnas_moneda=(5,))
 
         # 4. HOJA CONSTRUCCIÓN
-        ws_construccion = wb.create_sheet("Relacionados Construcción")
-
         df_construccion = df[df['es_construccion'] == True].copy()
 
         if len(df_construccion) > 0:
@@ -763,22 +946,12 @@ class CatalogadorXMLsCFDI:
                 'Fecha', 'Emisor', 'Total', 'Descripción', 'Categoría', 'UUID'
             ]
 
-            for r_idx, row in enumerate(dataframe_to_rows(df_construccion, index=False, header=True), 1):
-                for c_idx, value in enumerate(row, 1):
-                    cell = ws_construccion.cell(row=r_idx, column=c_idx, value=value)
-
-                    if r_idx == 1:
-                        cell.fill = header_fill
-                        cell.font = header_font
-
-                    if c_idx == 3 and r_idx > 1:  # Columna Total
-                        cell.number_format = '$#,##0.00'
-
-                    cell.border = border
+            escritor.hoja_dataframe("Relacionados Construcción", df_construccion, header_fill, header_font,
+                                    columnas_moneda=(3,))
+        else:
+            escritor.crear_hoja("Relacionados Construcción", {})
 
         # 5. HOJA ANÁLISIS MENSUAL
-        ws_mensual = wb.create_sheet("Análisis Mensual")
-
         # Crear pivot por mes y categoría
         pivot_mensual = pd.pivot_table(
             df,
@@ -786,98 +959,107 @@ class CatalogadorXMLsCFDI:
             index=['año', 'mes'],
             columns='categoria',
             aggfunc='sum',
-            fill_value=0
+            fill_value=0,
+            observed=True
         )
 
-        # Escribir encabezados
-        ws_mensual['A1'] = 'Año'
-        ws_mensual['B1'] = 'Mes'
-        col = 3
-        for categoria in pivot_mensual.columns:
-            cell = ws_mensual.cell(row=1, column=col, value=categoria)
-            cell.fill = header_fill
-            cell.font = header_font
-            col += 1
+        df_mensual = pivot_mensual.reset_index()
+        encabezados_mensual = ['Año', 'Mes'] + list(pivot_mensual.columns)
+        ws_mensual = escritor.crear_hoja("Análisis Mensual", anchos_dataframe(df_mensual, [encabezados_mensual]))
+
+        # Encabezados: solo las categorías llevan estilo
+        celdas_encabezado = [None, None] + [
+            escritor.celda(ws_mensual, fill=header_fill, font=header_font) for _ in pivot_mensual.columns
+        ]
+        ws_mensual.append(escritor.fila(celdas_encabezado, encabezados_mensual))
 
         # Escribir datos
-        row = 2
-        for (año, mes), valores in pivot_mensual.iterrows():
-            ws_mensual.cell(row=row, column=1, value=año)
-            ws_mensual.cell(row=row, column=2, value=mes)
-            col = 3
-            for valor in valores:
-                cell = ws_mensual.cell(row=row, column=col, value=valor)
-                cell.number_format = '$#,##0.00'
-                col += 1
-            row += 1
+        celdas_mensual = [None, None] + [
+            escritor.celda(ws_mensual, number_format=FORMATO_MONEDA) for _ in pivot_mensual.columns
+        ]
+        for valores in df_mensual.itertuples(index=False, name=None):
+            ws_mensual.append(escritor.fila(celdas_mensual, valores))
 
         # 6. HOJA TOP GASTOS
-        ws_top = wb.create_sheet("Top 50 Gastos")
-
         df_top = df.nlargest(50, 'total')[
             ['fecha', 'emisor_nombre', 'total', 'descripcion_concatenada', 'categoria', 'uuid']
         ].copy()
 
         df_top.columns = ['Fecha', 'Emisor', 'Total', 'Descripción', 'Categoría', 'UUID']
 
-        for r_idx, row in enumerate(dataframe_to_rows(df_top, index=False, header=True), 1):
-            for c_idx, value in enumerate(row, 1):
-                cell = ws_top.cell(row=r_idx, column=c_idx, value=value)
-
-                if r_idx == 1:
-                    cell.fill = header_fill
-                    cell.font = header_font
+        # Resaltar gastos mayores a 10k
+        escritor.hoja_dataframe("Top 50 Gastos", df_top, header_fill, header_font, columnas_moneda=(3,),
+                                resaltar=(3, 10000, highlight_fill))
 
-                if c_idx == 3 and r_idx > 1:  # Columna Total
-                    cell.number_format = '$#,##0.00'
-                    if float(value) > 10000:  # Resaltar gastos mayores a 10k
-                        cell.fill = highlight_fill
+        # 7. HOJA CONCEPTOS (una fila por concepto de los XMLs únicos)
+        df_conceptos = acumulador.dataframe_conceptos()
+        df_conceptos = df_conceptos[df_conceptos['id_comprobante'].isin(df.index)]
+        df_conceptos = enriquecer_conceptos(df_conceptos)
+        df_conceptos = df_conceptos.merge(
+            df[['fecha', 'emisor_nombre', 'categoria']], left_on='id_comprobante', right_index=True, how='left'
+        )
 
-                cell.border = border
+        columnas_conceptos = [
+            'fecha', 'emisor_nombre', 'uuid', 'clave_producto', 'clave_producto_desc', 'descripcion', 'cantidad',
+            'unidad', 'clave_unidad', 'valor_unitario', 'importe', 'descuento', 'categoria'
+        ]
+        df_conceptos_show = df_conceptos[columnas_conceptos].copy()
+        df_conceptos_show.columns = [
+            'Fecha', 'Emisor', 'UUID', 'Clave SAT', 'Descripción Clave SAT', 'Descripción', 'Cantidad',
+            'Unidad', 'Clave Unidad', 'Valor Unitario', 'Importe', 'Descuento', 'Categoría'
+        ]
 
-        # 7. HOJA DE DUPLICADOS (si existen)
-        if len(df_duplicados) > 0:
-            ws_duplicados = wb.create_sheet("XMLs Duplicados")
+        # Archivo con todos los conceptos (una hoja de Excel admite poco más de un millón de filas)
+        archivo_conceptos = os.path.splitext(archivo_salida)[0] + '_conceptos.csv'
+        df_conceptos_show.to_csv(archivo_conceptos, index=False, encoding='utf-8-sig')
 
-            # Título
-            ws_duplicados.merge_cells('A1:G1')
-            ws_duplicados['A1'] = f"XMLs DUPLICADOS ENCONTRADOS: {len(df_duplicados)} archivos"
-            ws_duplicados['A1'].font = Font(size=14, bold=True, color="FF0000")
-            ws_duplicados['A1'].alignment = Alignment(horizontal='center')
+        if len(df_conceptos_show) > MAX_FILAS_EXCEL:
+            print(f"⚠️  {len(df_conceptos_show):,} conceptos: la hoja Conceptos solo incluye los primeros "
+                  f"{MAX_FILAS_EXCEL:,} (todos están en {archivo_conceptos})")
+            df_conceptos_show = df_conceptos_show.head(MAX_FILAS_EXCEL)
 
-            # Preparar datos de duplicados
-            columnas_dup = ['archivo', 'carpeta', 'uuid', 'fecha', 'emisor_nombre', 'total', 'descripcion_concatenada']
-            df_dup_show = df_duplicados[columnas_dup].copy()
-            df_dup_show.columns = ['Archivo', 'Carpeta', 'UUID', 'Fecha', 'Emisor', 'Total', 'Descripción']
+        escritor.hoja_dataframe("Conceptos", df_conceptos_show, header_fill, header_font,
+                                columnas_moneda=(10, 11, 12))
 
-            # Escribir datos
-            for r_idx, row in enumerate(dataframe_to_rows(df_dup_show, index=False, header=True), 3):
-                for c_idx, value in enumerate(row, 1):
-                    cell = ws_duplicados.cell(row=r_idx, column=c_idx, value=value)
+        # 8. HOJA POR CLAVE SAT
+        df_claves = df_conceptos.groupby(['clave_producto', 'clave_producto_desc'], observed=True).agg(
+            conceptos=('importe', 'size'),
+            comprobantes=('id_comprobante', 'nunique'),
+            cantidad=('cantidad', 'sum'),
+            importe=('importe', 'sum'),
+            descuento=('descuento', 'sum'),
+        ).reset_index()
 
-                    if r_idx == 3:  # Headers
-                        cell.fill = PatternFill(start_color="FF6B6B", end_color="FF6B6B", fill_type="solid")
-                        cell.font = Font(color="FFFFFF", bold=True)
+        df_claves.columns = ['Clave SAT', 'Descripción', 'Conceptos', 'Comprobantes', 'Cantidad', 'Importe', 'Descuento']
+        df_claves = df_claves.sort_values('Importe', ascending=False)
 
-                    cell.border = border
+        escritor.hoja_dataframe("Por Clave SAT", df_claves, header_fill, header_font, columnas_moneda=(6, 7))
 
-                    # Formato para columna Total
-                    if c_idx == 6 and r_idx > 3:
-                        cell.number_format = '$#,##0.00'
-
-        # Ajustar anchos de columna en todas las hojas
-        for ws in wb.worksheets:
-            for column_cells in ws.columns:
-                length = max(len(str(cell.value or '')) for cell in column_cells if hasattr(cell, 'value'))
-                # Obtener la letra de la columna del primer cell no merged
-                for cell in column_cells:
-                    if hasattr(cell, 'column_letter'):
-                        ws.column_dimensions[cell.column_letter].width = min(length + 2, 50)
-                        break
+        # 9. HOJA DE DUPLICADOS (si existen)
+        if len(df_duplicados) > 0:
+            # Preparar datos de duplicados
+            columnas_dup = ['archivo', 'carpeta', 'motivo_duplicado', 'duplicado_de', 'uuid', 'fecha',
+                            'emisor_nombre', 'total', 'descripcion_concatenada']
+            df_dup_show = df_duplicados[columnas_dup].copy()
+            df_dup_show.columns = ['Archivo', 'Carpeta', 'Motivo', 'Duplicado de', 'UUID', 'Fecha',
+                                   'Emisor', 'Total', 'Descripción']
+
+            titulo_duplicados = (
+                f"XMLs DUPLICADOS ENCONTRADOS: {len(df_duplicados)} archivos",
+                'A1:I1',
+                Font(size=14, bold=True, color="FF0000")
+            )
+            escritor.hoja_dataframe(
+                "XMLs Duplicados", df_dup_show,
+                PatternFill(start_color="FF6B6B", end_color="FF6B6B", fill_type="solid"),
+                Font(color="FFFFFF", bold=True),
+                columnas_moneda=(8,), titulo_hoja=titulo_duplicados
+            )
 
         # Guardar archivo
-        wb.save(archivo_salida)
+        escritor.guardar(archivo_salida)
         print(f"\n✅ Catálogo con categorías corregidas guardado en: {archivo_salida}")
+        print(f"✅ Conceptos guardados en: {archivo_conceptos}")
 
         # Resumen final
         print("\n📊 RESUMEN DEL CATÁLOGO CORREGIDO:")
@@ -887,13 +1069,26 @@ class CatalogadorXMLsCFDI:
         print(f"   - Categorías únicas: {df['categoria'].nunique()}")
 
         print("\n📋 Top 5 categorías por monto:")
-        top_categorias = df.groupby('categoria')['total'].sum().sort_values(ascending=False).head()
+        top_categorias = df.groupby('categoria', observed=True)['total'].sum().sort_values(ascending=False).head()
         for cat, monto in top_categorias.items():
             print(f"   - {cat}: ${monto:,.2f}")
 
+        print(f"\n📋 Top 5 claves SAT por importe ({len(df_conceptos):,} conceptos):")
+        for clave, importe in df_claves.head()[['Clave SAT', 'Importe']].itertuples(index=False, name=None):
+            print(f"   - {clave or 'Sin clave'}: ${importe:,.2f}")
+
 
 # ========== PROGRAMA PRINCIPAL ==========
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalogador de XMLs CFDI")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Procesos para leer y clasificar los XMLs (1 = serial)")
+    parser.add_argument('--almacen', default=None,
+                        help="Archivo SQLite con los XMLs ya leídos (por defecto junto al archivo de salida)")
+    parser.add_argument('--sin-almacen', dest='sin_almacen', action='store_true',
+                        help="Leer todos los XMLs sin usar el almacén")
+    args = parser.parse_args()
+
     print("\n" + "=" * 80)
     print("📚 CATALOGADOR DE XMLs CFDI - VERSIÓN CORREGIDA")
     print("   • Lee todos los XMLs de las carpetas especificadas")
@@ -912,6 +1107,7 @@ if __name__ == "__main__":
     for carpeta in carpetas_cfdi:
         print(f"   - {carpeta}")
     print(f"📤 Archivo salida: {archivo_salida}")
+    print(f"⚙️ Procesos: {args.workers}")
 
     # Verificar carpetas
     carpetas_validas = []
@@ -930,10 +1126,15 @@ if __name__ == "__main__":
     respuesta = input("\n¿Generar catálogo con categorías corregidas? (s/n): ")
 
     if respuesta.lower() == 's':
-        catalogador = CatalogadorXMLsCFDI(carpetas_validas)
+        ruta_almacen = None
+        if not args.sin_almacen:
+            ruta_almacen = args.almacen or os.path.join(os.path.dirname(archivo_salida), 'catalogo_cfdi.sqlite3')
+            print(f"💾 Almacén de XMLs: {ruta_almacen}")
+
+        catalogador = CatalogadorXMLsCFDI(carpetas_validas, ruta_almacen=ruta_almacen)
 
         try:
-            catalogador.generar_catalogo_excel(archivo_salida)
+            catalogador.generar_catalogo_excel(archivo_salida, workers=args.workers)
             print("\n✅ ¡Catálogo con categorías corregidas generado exitosamente!")
 
         except Exception as e:
@@ -0,0 +1,140 @@
+from array import array
+
+import pandas as pd
+
+# Columnas numéricas: se guardan en arreglos tipados en lugar de listas de objetos
+COLUMNAS_DECIMALES = [
+    'subtotal', 'descuento', 'total', 'total_impuestos_trasladados', 'total_impuestos_retenidos'
+]
+COLUMNAS_ENTERAS = ['num_conceptos', 'confianza_categoria']
+
+# Columnas de texto con pocos valores distintos: se guardan como códigos de categoría
+COLUMNAS_CATEGORICAS = [
+    'carpeta', 'version_cfdi', 'mes', 'tipo_comprobante', 'tipo_comprobante_desc',
+    'lugar_expedicion', 'metodo_pago', 'metodo_pago_desc', 'forma_pago', 'forma_pago_desc',
+    'moneda', 'emisor_rfc', 'emisor_nombre', 'emisor_regimen', 'receptor_rfc', 'receptor_nombre',
+    'receptor_uso_cfdi', 'receptor_uso_cfdi_desc', 'receptor_regimen', 'categoria', 'subcategoria'
+]
+
+# Tabla de conceptos (una fila por concepto, ligada al comprobante)
+COLUMNAS_CONCEPTOS = [
+    'id_comprobante', 'uuid', 'descripcion', 'clave_producto', 'clave_unidad',
+    'cantidad', 'unidad', 'valor_unitario', 'importe', 'descuento'
+]
+DECIMALES_CONCEPTOS = ['cantidad', 'valor_unitario', 'importe', 'descuento']
+CATEGORICAS_CONCEPTOS = ['clave_producto', 'clave_unidad', 'unidad']
+
+
+class _ColumnaCategorica:
+    """Columna de texto guardada como códigos enteros más el catálogo de valores"""
+
+    def __init__(self):
+        self.codigos = array('l')
+        self.valores = {}
+
+    def append(self, valor):
+        if valor is None:
+            self.codigos.append(-1)
+            return
+        codigo = self.valores.get(valor)
+        if codigo is None:
+            codigo = self.valores[valor] = len(self.valores)
+        self.codigos.append(codigo)
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def categorical(self):
+        """pd.Categorical con las categorías ordenadas (igual que agrupar texto)"""
+        categorias = list(self.valores)
+        categorical = pd.Categorical.from_codes(self.codigos, categories=categorias)
+        return categorical.reorder_categories(sorted(categorias, key=str))
+
+
+def _columna_nueva(nombre, decimales, enteras, categoricas):
+    if nombre in decimales:
+        return array('d')
+    if nombre in enteras:
+        return array('q')
+    if nombre in categoricas:
+        return _ColumnaCategorica()
+    return []
+
+
+def _vacio(columna):
+    """Valor para una fila sin dato en la columna"""
+    if isinstance(columna, array):
+        return float('nan') if columna.typecode == 'd' else 0
+    return None
+
+
+def _serie(columna):
+    if isinstance(columna, _ColumnaCategorica):
+        return columna.categorical()
+    return columna
+
+
+class AcumuladorCFDI:
+    """
+    Junta los datos de los XMLs directamente en columnas (arreglos tipados y códigos de
+    categoría) en lugar de una lista de diccionarios; los conceptos van a una tabla aparte
+    ligada por id_comprobante (el índice del DataFrame de comprobantes) y UUID
+    """
+
+    def __init__(self):
+        self.columnas = {}
+        self.conceptos = {nombre: _columna_nueva(nombre, DECIMALES_CONCEPTOS, ['id_comprobante'],
+                                                 CATEGORICAS_CONCEPTOS)
+                          for nombre in COLUMNAS_CONCEPTOS}
+        self.filas = 0
+
+    def __len__(self):
+        return self.filas
+
+    def agregar(self, datos):
+        """Agrega un comprobante (el diccionario de leer_xml_completo)"""
+        id_comprobante = self.filas
+
+        for nombre, valor in datos.items():
+            if nombre == 'conceptos':
+                continue
+
+            columna = self.columnas.get(nombre)
+            if columna is None:
+                # Columna nueva: rellenar las filas anteriores con vacío
+                columna = self.columnas[nombre] = _columna_nueva(
+                    nombre, COLUMNAS_DECIMALES, COLUMNAS_ENTERAS, COLUMNAS_CATEGORICAS)
+                for _ in range(id_comprobante):
+                    columna.append(_vacio(columna))
+
+            columna.append(valor)
+
+        # Columnas que este comprobante no trae
+        for nombre, columna in self.columnas.items():
+            if len(columna) == id_comprobante:
+                columna.append(_vacio(columna))
+
+        for concepto in datos.get('conceptos', []):
+            self.conceptos['id_comprobante'].append(id_comprobante)
+            self.conceptos['uuid'].append(datos.get('uuid', ''))
+            for nombre in COLUMNAS_CONCEPTOS[2:]:
+                self.conceptos[nombre].append(concepto.get(nombre))
+
+        self.filas += 1
+
+    def dataframe(self):
+        """DataFrame de comprobantes (una fila por XML, índice = id_comprobante)"""
+        return pd.DataFrame({nombre: _serie(columna) for nombre, columna in self.columnas.items()})
+
+    def dataframe_conceptos(self):
+        """DataFrame de conceptos (una fila por concepto)"""
+        return pd.DataFrame({nombre: _serie(columna) for nombre, columna in self.conceptos.items()})
+
+
+def conteo_valores(serie):
+    """
+    value_counts con los empates en orden de aparición y sin categorías vacías
+    (igual que sobre una columna de texto)
+    """
+    conteo = serie.value_counts(sort=False)
+    return conteo.reindex(pd.unique(serie)).sort_values(ascending=False, kind='stable')
@@ -0,0 +1,147 @@
+import hashlib
+import pickle
+import sqlite3
+
+from duplicados_cfdi import huella_xml
+
+
+class AlmacenCFDI:
+    """
+    Almacén local (SQLite) de los datos ya leídos de cada XML
+    Cada registro se identifica por ruta, mtime, tamaño y SHA-256 del contenido, así solo
+    se vuelven a leer los archivos nuevos o modificados
+    Aparte guarda el SHA-256 y UUID de cada archivo visto (también los duplicados que no se
+    leen), para buscar duplicados sin volver a leer los archivos sin cambios
+    version_datos identifica la forma de los datos guardados: si el almacén se llenó con otra
+    versión, se vacía y todos los XMLs se vuelven a leer
+    """
+
+    def __init__(self, ruta, version_datos=1):
+        self.ruta = str(ruta)
+        self._conexion = sqlite3.connect(self.ruta)
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS xmls (
+                ruta TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                tamano INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                firma_clasificacion TEXT,
+                datos BLOB
+            )
+        """)
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS huellas_cfdi (
+                ruta TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                tamano INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                uuid TEXT NOT NULL
+            )
+        """)
+
+        # La versión se guarda en el propio archivo (PRAGMA user_version, 0 en almacenes anteriores)
+        version_guardada = self._conexion.execute("PRAGMA user_version").fetchone()[0]
+        if version_guardada != version_datos:
+            self._conexion.execute("DELETE FROM xmls")
+            self._conexion.execute(f"PRAGMA user_version = {int(version_datos)}")
+        self._conexion.commit()
+
+        # Índice en memoria: ruta -> (mtime, tamaño, sha256)
+        self._huellas = {
+            ruta: (mtime, tamano, sha256)
+            for ruta, mtime, tamano, sha256 in self._conexion.execute(
+                "SELECT ruta, mtime, tamano, sha256 FROM xmls")
+        }
+
+        # ruta -> (mtime, tamaño, sha256, uuid) de huella_cfdi
+        self._huellas_cfdi = {
+            ruta: (mtime, tamano, sha256, uuid)
+            for ruta, mtime, tamano, sha256, uuid in self._conexion.execute(
+                "SELECT ruta, mtime, tamano, sha256, uuid FROM huellas_cfdi")
+        }
+
+    @staticmethod
+    def sha256_archivo(archivo):
+        """SHA-256 del contenido de un archivo"""
+        sha = hashlib.sha256()
+        with open(archivo, 'rb') as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(bloque)
+        return sha.hexdigest()
+
+    def huella(self, archivo):
+        """
+        Devuelve (vigente, huella): vigente indica que lo guardado corresponde al archivo actual
+        El hash solo se calcula si cambió el mtime o el tamaño
+        """
+        stat = archivo.stat()
+        guardada = self._huellas.get(str(archivo))
+
+        if guardada and guardada[0] == stat.st_mtime and guardada[1] == stat.st_size:
+            return True, guardada
+
+        # El hash ya se calculó al buscar duplicados (huella_cfdi)
+        calculada = self._huellas_cfdi.get(str(archivo))
+        if calculada and calculada[0] == stat.st_mtime and calculada[1] == stat.st_size:
+            sha256 = calculada[2]
+        else:
+            sha256 = self.sha256_archivo(archivo)
+        huella = (stat.st_mtime, stat.st_size, sha256)
+
+        # Mismo contenido con otro mtime (p. ej. copiado de nuevo): solo se actualiza la huella
+        if guardada and guardada[2] == sha256:
+            self._conexion.execute(
+                "UPDATE xmls SET mtime = ?, tamano = ? WHERE ruta = ?",
+                (stat.st_mtime, stat.st_size, str(archivo))
+            )
+            self._huellas[str(archivo)] = huella
+            return True, huella
+
+        return False, huella
+
+    def huella_cfdi(self, archivo):
+        """
+        Devuelve (sha256, uuid) como duplicados_cfdi.huella_xml, sin leer el archivo si ruta,
+        mtime y tamaño coinciden con lo guardado
+        """
+        ruta = str(archivo)
+        stat = archivo.stat()
+        guardada = self._huellas_cfdi.get(ruta)
+
+        if guardada and guardada[0] == stat.st_mtime and guardada[1] == stat.st_size:
+            return guardada[2], guardada[3]
+
+        sha256, uuid = huella_xml(archivo)
+        self._conexion.execute(
+            "INSERT OR REPLACE INTO huellas_cfdi (ruta, mtime, tamano, sha256, uuid) VALUES (?, ?, ?, ?, ?)",
+            (ruta, stat.st_mtime, stat.st_size, sha256, uuid)
+        )
+        self._huellas_cfdi[ruta] = (stat.st_mtime, stat.st_size, sha256, uuid)
+        return sha256, uuid
+
+    def obtener(self, archivo):
+        """Devuelve (datos, firma_clasificacion) guardados para el archivo"""
+        fila = self._conexion.execute(
+            "SELECT datos, firma_clasificacion FROM xmls WHERE ruta = ?", (str(archivo),)
+        ).fetchone()
+        return pickle.loads(fila[0]), fila[1]
+
+    def guardar(self, archivo, huella, datos, firma_clasificacion):
+        """Guarda (o reemplaza) los datos leídos de un archivo"""
+        mtime, tamano, sha256 = huella
+        self._conexion.execute(
+            "INSERT OR REPLACE INTO xmls (ruta, mtime, tamano, sha256, firma_clasificacion, datos) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (str(archivo), mtime, tamano, sha256, firma_clasificacion,
+             pickle.dumps(datos, protocol=pickle.HIGHEST_PROTOCOL))
+        )
+        self._huellas[str(archivo)] = huella
+
+    def confirmar(self):
+        """Escribe los cambios pendientes en disco"""
+        self._conexion.commit()
+
+    def cerrar(self):
+        """Confirma y cierra la conexión"""
+        self._conexion.commit()
+        self._conexion.close()
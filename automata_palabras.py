@@ -0,0 +1,80 @@
+from collections import deque
+
+# pyahocorasick (opcional) es una implementación en C del mismo autómata
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class AutomataPalabras:
+    """
+    Autómata de Aho–Corasick: encuentra en una sola pasada sobre el texto cuáles de los
+    patrones aparecen en él (como subcadena, igual que `patron in texto`)
+    """
+
+    def __init__(self, patrones, usar_c=True):
+        self.patrones = list(patrones)
+
+        if usar_c and ahocorasick is not None:
+            self._automata_c = ahocorasick.Automaton()
+            for indice, patron in enumerate(self.patrones):
+                self._automata_c.add_word(patron, indice)
+            self._automata_c.make_automaton()
+        else:
+            self._automata_c = None
+            self._construir()
+
+    def _construir(self):
+        """Trie con enlaces de falla convertido en tabla de transiciones completa"""
+        hijos = [{}]
+        salidas = [[]]
+
+        for indice, patron in enumerate(self.patrones):
+            estado = 0
+            for caracter in patron:
+                siguiente = hijos[estado].get(caracter)
+                if siguiente is None:
+                    siguiente = len(hijos)
+                    hijos[estado][caracter] = siguiente
+                    hijos.append({})
+                    salidas.append([])
+                estado = siguiente
+            salidas[estado].append(indice)
+
+        # Recorrido por niveles: cada estado hereda las transiciones y salidas de su enlace de falla,
+        # así la búsqueda hace una sola consulta por carácter
+        transiciones = [None] * len(hijos)
+        transiciones[0] = dict(hijos[0])
+        falla = [0] * len(hijos)
+        cola = deque(hijos[0].values())
+
+        while cola:
+            estado = cola.popleft()
+            transiciones[estado] = dict(transiciones[falla[estado]])
+            transiciones[estado].update(hijos[estado])
+            salidas[estado] = salidas[estado] + salidas[falla[estado]]
+
+            for caracter, hijo in hijos[estado].items():
+                falla[hijo] = transiciones[falla[estado]].get(caracter, 0)
+                cola.append(hijo)
+
+        self._transiciones = transiciones
+        self._salidas = [tuple(salida) if salida else None for salida in salidas]
+
+    def encontrar(self, texto):
+        """Índices de los patrones que aparecen en el texto"""
+        if self._automata_c is not None:
+            return {indice for _, indice in self._automata_c.iter(texto)} if texto else set()
+
+        encontrados = set()
+        transiciones = self._transiciones
+        salidas = self._salidas
+        estado = 0
+
+        for caracter in texto:
+            estado = transiciones[estado].get(caracter, 0)
+            if salidas[estado]:
+                encontrados.update(salidas[estado])
+
+        return encontrados
@@ -0,0 +1,159 @@
+"""
+Microbenchmark de clasificar_xml_corregido (XML_ABR.py)
+
+Compara el clasificador con autómata de Aho–Corasick contra la implementación anterior
+(una prueba `in` por emisor y palabra clave de cada categoría, con las comprobaciones
+de DEBUG dentro de los ciclos) sobre un catálogo de comprobantes realista.
+
+Uso:
+    python bench_clasificador.py                  # 5,000 comprobantes sintéticos
+    python bench_clasificador.py carpeta_xmls ... # XMLs reales
+"""
+import contextlib
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+from XML_ABR import CatalogadorXMLsCFDI, PALABRAS_CONSTRUCCION
+from automata_palabras import AutomataPalabras, ahocorasick
+
+
+def clasificar_anterior(catalogador, datos):
+    """
+    Implementación anterior: recorre todas las categorías, emisores y palabras clave
+    """
+    texto_busqueda = f"{datos['emisor_nombre']} {datos['descripcion_concatenada']}".lower()
+
+    debug_ejemplos = ["home depot", "pemex", "hotel", "uber", "comex"]
+    if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
+        print(f"\nDEBUG Clasificación: {datos['emisor_nombre']}")
+        print(f"  Texto búsqueda: {texto_busqueda[:100]}...")
+
+    mejor_categoria = 'Miscelaneos'
+    mejor_puntuacion = 0
+
+    for categoria, criterios in catalogador.categorias_corregidas.items():
+        puntuacion = 0
+
+        for emisor in criterios['emisores']:
+            if emisor.lower() in texto_busqueda:
+                puntuacion += 5
+                if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
+                    print(f"    Emisor match: {emisor} -> {categoria} (+5)")
+
+        for palabra in criterios['palabras_clave']:
+            if palabra.lower() in texto_busqueda:
+                puntuacion += 1
+                if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
+                    print(f"    Palabra match: {palabra} -> {categoria} (+1)")
+
+        if puntuacion > mejor_puntuacion:
+            mejor_puntuacion = puntuacion
+            mejor_categoria = categoria
+
+    if datos['tipo_comprobante'] == 'P':
+        mejor_categoria = 'N/A'
+    elif datos['tipo_comprobante'] == 'N':
+        mejor_categoria = 'Honorarios Profesionales'
+
+    datos['categoria'] = mejor_categoria
+    datos['confianza_categoria'] = mejor_puntuacion
+
+    if any(ejemplo in texto_busqueda for ejemplo in debug_ejemplos):
+        print(f"    RESULTADO: {mejor_categoria} (puntuación: {mejor_puntuacion})")
+
+    datos['es_construccion'] = any(palabra in texto_busqueda for palabra in PALABRAS_CONSTRUCCION)
+
+    palabras = texto_busqueda.split()
+    palabras_relevantes = [p for p in palabras if len(p) > 4 and not p.isdigit()]
+    datos['palabras_clave'] = list(set(palabras_relevantes[:10]))
+
+    return datos
+
+
+def catalogo_sintetico(catalogador, cantidad):
+    """Comprobantes con emisores y conceptos tomados de las categorías, más texto sin relación"""
+    random.seed(7)
+    emisores = [emisor for c in catalogador.categorias_corregidas.values() for emisor in c['emisores']]
+    palabras = [palabra for c in catalogador.categorias_corregidas.values() for palabra in c['palabras_clave']]
+    relleno = ['pieza', 'unidad', 'servicio', 'general', 'modelo', 'marca', 'paquete', 'caja', 'kit', 'sa de cv']
+
+    comprobantes = []
+    for _ in range(cantidad):
+        emisor = f"{random.choice(emisores + relleno).upper()} {random.choice(relleno).upper()}"
+        conceptos = []
+        for _ in range(random.randint(1, 8)):
+            conceptos.append(" ".join(random.choice(palabras + relleno * 3) for _ in range(random.randint(2, 6))))
+
+        comprobantes.append({
+            'emisor_nombre': emisor,
+            'descripcion_concatenada': " | ".join(conceptos).upper(),
+            'tipo_comprobante': random.choice('IIIIIEPN'),
+        })
+
+    return comprobantes
+
+
+def catalogo_de_carpetas(catalogador, carpetas):
+    """Datos de los XMLs de las carpetas (sin clasificar)"""
+    comprobantes = []
+    for carpeta in carpetas:
+        for archivo_xml in Path(carpeta).glob("*.xml"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                datos = catalogador.leer_xml_completo(archivo_xml)
+            if datos:
+                comprobantes.append(datos)
+    return comprobantes
+
+
+def medir(clasificar, comprobantes):
+    """Tiempo total en milisegundos, resultados y salida de DEBUG"""
+    copias = [dict(datos) for datos in comprobantes]
+    with contextlib.redirect_stdout(io.StringIO()) as salida:
+        inicio = time.perf_counter()
+        for datos in copias:
+            clasificar(datos)
+        transcurrido = time.perf_counter() - inicio
+    return transcurrido * 1000, copias, salida.getvalue()
+
+
+def resultado(datos):
+    return datos['categoria'], datos['confianza_categoria'], datos['es_construccion']
+
+
+if __name__ == "__main__":
+    catalogador = CatalogadorXMLsCFDI([])
+
+    if len(sys.argv) > 1:
+        comprobantes = catalogo_de_carpetas(catalogador, sys.argv[1:])
+    else:
+        comprobantes = catalogo_sintetico(catalogador, 5000)
+
+    print(f"Comprobantes: {len(comprobantes):,} | patrones: {len(catalogador._patrones_clasificacion)} | "
+          f"pyahocorasick: {'sí' if ahocorasick else 'no'}")
+
+    t_anterior, r_anterior, debug_anterior = medir(lambda d: clasificar_anterior(catalogador, d), comprobantes)
+
+    variantes = [("Autómata", catalogador)]
+    if ahocorasick is not None:
+        # Misma clasificación con el autómata en Python puro, para comparar
+        catalogador_python = CatalogadorXMLsCFDI([])
+        catalogador_python._automata_clasificacion = AutomataPalabras(
+            catalogador_python._patrones_clasificacion, usar_c=False)
+        variantes = [("Autómata (C)", catalogador), ("Autómata (Python)", catalogador_python)]
+
+    print(f"{'Clasificador':<22}{'Total (ms)':>12}{'µs/comprobante':>17}{'Mejora':>9}")
+    print("-" * 60)
+    print(f"{'Anterior':<22}{t_anterior:>12.1f}{t_anterior * 1000 / len(comprobantes):>17.1f}{'':>9}")
+
+    for nombre, instancia in variantes:
+        t_nuevo, r_nuevo, debug_nuevo = medir(instancia.clasificar_xml_corregido, comprobantes)
+
+        diferentes = sum(resultado(a) != resultado(b) for a, b in zip(r_anterior, r_nuevo))
+        if diferentes or debug_anterior != debug_nuevo:
+            print(f"❌ {nombre}: {diferentes} clasificaciones distintas, DEBUG igual: {debug_anterior == debug_nuevo}")
+
+        print(f"{nombre:<22}{t_nuevo:>12.1f}{t_nuevo * 1000 / len(comprobantes):>17.1f}"
+              f"{t_anterior / t_nuevo:>8.1f}x")
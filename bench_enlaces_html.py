@@ -0,0 +1,149 @@
+"""
+Microbenchmark de la búsqueda de enlaces en la página de un comprobante (RindeGastos.py)
+
+Compara la búsqueda anterior (árbol completo de BeautifulSoup, find_all de enlaces e iframes,
+str(soup) para buscar las URLs en los scripts y get_text) contra PaginaHTML, que recorre el
+HTML una sola vez sin construir el árbol.
+
+Uso:
+    python bench_enlaces_html.py                  # páginas sintéticas de ~30 KB, ~240 KB y ~800 KB
+    python bench_enlaces_html.py pagina.html ...  # páginas de comprobantes guardadas
+"""
+import contextlib
+import io
+import re
+import sys
+import time
+import urllib.parse
+
+from bs4 import BeautifulSoup
+
+from RindeGastos import ExtractorFacturasRindeGastosV7
+from enlaces_html import PaginaHTML
+
+URL_COMPROBANTE = "https://web.rindegastos.com/document/receipt?i=123456&key=abc123"
+
+
+def buscar_enlaces_anterior(contenido_html, url_original):
+    """
+    Implementación anterior: árbol completo de BeautifulSoup, un recorrido por cada find_all,
+    el documento reserializado con str(soup) para las expresiones regulares y get_text al final
+    Devuelve (enlaces_pdf, enlaces_xml, texto_html)
+    """
+    soup = BeautifulSoup(contenido_html, 'html.parser')
+    enlaces_pdf = []
+    enlaces_xml = []
+
+    for link in soup.find_all('a'):
+        href = link.get('href', '')
+        texto = link.get_text(strip=True).lower()
+
+        ruta = urllib.parse.urlparse(href).path.lower()
+        es_xml = (ruta.endswith('.xml') or re.search(r'[?&](?:format|tipo)=xml\b', href, re.I) or
+                  ('xml' in texto and 'pdf' not in texto and not ruta.endswith('.pdf')))
+        if href and es_xml:
+            if href.startswith('/'):
+                href = '/'.join(url_original.split('/')[:3]) + href
+            if href.startswith('http') and href not in enlaces_xml:
+                enlaces_xml.append(href)
+            continue
+
+        if href and ('.pdf' in href.lower() or 's3.amazonaws.com' in href or 'ppstatic' in href or
+                     ('descargar' in texto or 'download' in texto)):
+            if href.startswith('http'):
+                enlaces_pdf.append(href)
+            elif href.startswith('/'):
+                enlaces_pdf.append('/'.join(url_original.split('/')[:3]) + href)
+
+    for iframe in soup.find_all('iframe'):
+        src = iframe.get('src', '')
+        if src and ('pdf' in src.lower() or 'viewer' in src.lower()) and 'file=' in src:
+            params = urllib.parse.parse_qs(urllib.parse.urlparse(src).query)
+            if 'file' in params:
+                enlaces_pdf.append(urllib.parse.unquote(params['file'][0]))
+
+    page_text = str(soup)
+    for pattern in [r'https?://[^\s\'"]+\.s3\.amazonaws\.com/[^\s\'"]+\.pdf', r'https?://[^\s\'"]+\.pdf']:
+        for match in re.findall(pattern, page_text, re.IGNORECASE):
+            if match not in enlaces_pdf:
+                enlaces_pdf.append(match)
+
+    for match in re.findall(r'https?://[^\s\'"<>]+\.xml\b(?:\?[^\s\'"<>]*)?', page_text, re.IGNORECASE):
+        if match not in enlaces_xml:
+            enlaces_xml.append(match)
+
+    return enlaces_pdf, enlaces_xml, soup.get_text()
+
+
+def pagina_sintetica(bloques):
+    """
+    Página de comprobante como la de RindeGastos: menús, el bundle de JavaScript en línea,
+    la tabla del gasto y el enlace al PDF en S3 dentro de un script
+    """
+    menu = "".join(f'<li class="nav-item"><a class="nav-link" href="/app/seccion/{i}">Sección {i}</a></li>\n'
+                   for i in range(40))
+    bundle = "".join(f'function m{i}(a,b){{return a.map(function(x){{return x+"{i}"&&b}})}};\n'
+                     for i in range(300))
+    filas = "".join(f'<tr><td>{i}</td><td>Concepto de gasto número {i} &amp; viáticos</td>'
+                    f'<td class="monto">${i * 12.5:,.2f}</td></tr>\n' for i in range(30))
+    return (
+        '<!DOCTYPE html><html lang="es"><head><meta charset="utf-8"><title>Comprobante</title>'
+        '<style>' + '.c{margin:0;padding:0}' * 200 + '</style></head><body>'
+        '<nav><ul>' + menu + '</ul></nav>'
+        + ('<script>' + bundle + '</script>\n<div class="contenido"><table>' + filas + '</table></div>\n') * bloques +
+        '<a class="btn" href="/document/download/123456?key=abc123">Descargar</a>'
+        '<a href="/document/download/123456?key=abc123&amp;format=xml">XML</a>'
+        '<iframe src="/viewer.html?file=https%3A%2F%2Fppstatic.s3.amazonaws.com%2Fr%2F123456.pdf"></iframe>'
+        '<script>window.__DOC__={"pdf":"https://rindegastos.s3.amazonaws.com/docs/123456.pdf"};</script>'
+        '</body></html>'
+    ).encode('utf-8')
+
+
+def paginas_de_archivos(rutas):
+    for ruta in rutas:
+        with open(ruta, 'rb') as f:
+            yield ruta, f.read()
+
+
+def medir(funcion, contenido, repeticiones):
+    """Tiempo promedio por llamada en milisegundos"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            resultado = funcion(contenido, URL_COMPROBANTE)
+        transcurrido = time.perf_counter() - inicio
+    return transcurrido / repeticiones * 1000, resultado
+
+
+if __name__ == "__main__":
+    extractor = ExtractorFacturasRindeGastosV7(cache=False, procesos_pdf=0)
+
+    def buscar_enlaces_nuevo(contenido_html, url_original):
+        pagina = PaginaHTML(contenido_html)
+        enlaces_pdf, enlaces_xml = extractor.buscar_enlaces_pdf_mejorado(pagina, url_original)
+        return enlaces_pdf, enlaces_xml, pagina.texto
+
+    if len(sys.argv) > 1:
+        casos = list(paginas_de_archivos(sys.argv[1:]))
+    else:
+        casos = [(f"sintética {n} bloques", pagina_sintetica(n)) for n in (1, 10, 35)]
+
+    print(f"{'Página':<28}{'Bytes':>12}{'Anterior (ms)':>16}{'Una pasada (ms)':>17}{'Mejora':>9}")
+    print("-" * 82)
+
+    for nombre, contenido in casos:
+        repeticiones = max(3, 2000000 // max(len(contenido), 1))
+        t_anterior, r_anterior = medir(buscar_enlaces_anterior, contenido, repeticiones)
+        t_nuevo, r_nuevo = medir(buscar_enlaces_nuevo, contenido, repeticiones)
+
+        # Las URLs en el código se buscan en el HTML original: pueden diferir, p. ej., si la página
+        # escribe un & sin escapar dentro de un atributo (str(soup) lo convertía en &amp;)
+        if r_anterior != r_nuevo:
+            print(f"❌ Resultados distintos en {nombre}:")
+            for etiqueta, anterior, nuevo in zip(("PDFs", "XMLs"), r_anterior[:2], r_nuevo[:2]):
+                if anterior != nuevo:
+                    print(f"   {etiqueta}: {anterior} vs {nuevo}")
+            if r_anterior[2] != r_nuevo[2]:
+                print(f"   El texto de la página difiere")
+
+        print(f"{nombre[:27]:<28}{len(contenido):>12,}{t_anterior:>16.2f}{t_nuevo:>17.2f}{t_anterior / t_nuevo:>8.1f}x")
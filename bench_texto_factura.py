@@ -0,0 +1,143 @@
+"""
+Microbenchmark de procesar_texto_factura (Rinde_Gastos_Final.py)
+
+Compara el motor con patrones precompilados y salida temprana contra la implementación
+anterior (re.findall sin compilar, acumulando todas las fechas) sobre el texto de facturas
+grandes de varias páginas.
+
+Uso:
+    python bench_texto_factura.py                 # facturas sintéticas de 1, 10 y 50 páginas
+    python bench_texto_factura.py factura.pdf ... # texto real de PDFs (requiere pdfplumber) o .txt
+"""
+import contextlib
+import io
+import re
+import sys
+import time
+from datetime import datetime
+
+import Rinde_Gastos_Final as rgf
+
+
+def procesar_texto_factura_anterior(texto):
+    """
+    Implementación anterior: re.findall sin compilar sobre todo el texto para cada patrón
+    y todas las fechas de todos los patrones antes de elegir una
+    """
+    resultado = {
+        'descripcion': "No encontrada",
+        'folio_fiscal': "No encontrado",
+        'fecha_factura': "No encontrada"
+    }
+
+    for patron in rgf.PATRONES_DESCRIPCION:
+        matches = re.findall(patron.pattern, texto, re.IGNORECASE | re.MULTILINE)
+        for match in matches:
+            match_limpio = re.sub(r'\s+', ' ', str(match).strip())
+            if (10 <= len(match_limpio) <= 200 and
+                    not any(palabra in match_limpio.lower() for palabra in rgf.PALABRAS_NO_DESCRIPCION)):
+                resultado['descripcion'] = match_limpio
+                break
+        if resultado['descripcion'] != "No encontrada":
+            break
+
+    for patron in rgf.PATRONES_FOLIO:
+        matches = re.findall(patron.pattern, texto, re.IGNORECASE)
+        for match in matches:
+            match_limpio = str(match).strip()
+            if len(match_limpio) >= 15:
+                resultado['folio_fiscal'] = match_limpio
+                break
+        if resultado['folio_fiscal'] != "No encontrado":
+            break
+
+    fechas_encontradas = []
+    for patron in rgf.PATRONES_FECHA:
+        for match in re.findall(patron.pattern, texto, re.IGNORECASE | re.MULTILINE):
+            try:
+                if isinstance(match, tuple):
+                    año = match[2] if len(match[2]) != 2 else '20' + match[2]
+                    fecha_str = f"{match[0].zfill(2)}/{rgf.MESES_ESPANOL.get(match[1].lower(), match[1])}/{año}"
+                else:
+                    fecha_str = str(match).strip()
+                fecha_normalizada = rgf.normalizar_fecha(fecha_str)
+                if fecha_normalizada:
+                    fechas_encontradas.append(fecha_normalizada)
+            except Exception:
+                continue
+
+    if fechas_encontradas:
+        fechas_validas = []
+        for fecha in fechas_encontradas:
+            try:
+                if 2020 <= datetime.strptime(fecha, '%d/%m/%Y').year <= datetime.now().year + 1:
+                    fechas_validas.append(fecha)
+            except ValueError:
+                continue
+        resultado['fecha_factura'] = fechas_validas[0] if fechas_validas else fechas_encontradas[0]
+
+    return resultado
+
+
+def factura_sintetica(paginas):
+    """Texto de una factura CFDI impresa con muchas partidas por página"""
+    encabezado = (
+        "FACTURA ELECTRÓNICA\n"
+        "Folio Fiscal: 6F1A2B3C-4D5E-6F70-8192-A3B4C5D6E7F8\n"
+        "No. de serie del CSD: 00001000000504465028\n"
+        "Fecha y hora de emisión: 2025-06-14T10:22:31\n"
+        "Lugar de expedición: 64000\n"
+        "Cantidad | Unidad | Descripción | P. Unitario | Importe\n"
+    )
+    partidas = "".join(
+        f"{i % 7 + 1} | H87 | Tornillo hexagonal galvanizado {i} mm | ${i * 3.5:,.2f} | ${i * 7:,.2f}\n"
+        for i in range(1, 41)
+    )
+    pie = (
+        "Subtotal: $12,345.67\nIVA 16%: $1,975.31\nTotal: $14,320.98\n"
+        "Sello digital del CFDI: " + "A1b2C3d4" * 40 + "\n"
+        "Cadena original del complemento de certificación digital del SAT\n"
+    )
+    return encabezado + (partidas + pie) * paginas
+
+
+def textos_de_archivos(rutas):
+    """Texto de PDFs (pdfplumber) o archivos de texto"""
+    for ruta in rutas:
+        if ruta.lower().endswith('.pdf'):
+            import pdfplumber
+            with pdfplumber.open(ruta) as pdf:
+                yield ruta, "\n".join(page.extract_text() or '' for page in pdf.pages)
+        else:
+            with open(ruta, 'r', encoding='utf-8', errors='ignore') as f:
+                yield ruta, f.read()
+
+
+def medir(funcion, texto, repeticiones):
+    """Tiempo promedio por llamada en milisegundos"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            resultado = funcion(texto)
+        transcurrido = time.perf_counter() - inicio
+    return transcurrido / repeticiones * 1000, resultado
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        casos = list(textos_de_archivos(sys.argv[1:]))
+    else:
+        casos = [(f"sintética {n} pág.", factura_sintetica(n)) for n in (1, 10, 50)]
+
+    print(f"{'Factura':<28}{'Caracteres':>12}{'Anterior (ms)':>16}{'Compilado (ms)':>16}{'Mejora':>9}")
+    print("-" * 81)
+
+    for nombre, texto in casos:
+        repeticiones = max(3, 200000 // max(len(texto), 1))
+        t_anterior, r_anterior = medir(procesar_texto_factura_anterior, texto, repeticiones)
+        t_nuevo, r_nuevo = medir(rgf.procesar_texto_factura, texto, repeticiones)
+
+        if r_anterior != r_nuevo:
+            print(f"❌ Resultados distintos en {nombre}: {r_anterior} vs {r_nuevo}")
+
+        print(f"{nombre[:27]:<28}{len(texto):>12,}{t_anterior:>16.2f}{t_nuevo:>16.2f}{t_anterior / t_nuevo:>8.1f}x")
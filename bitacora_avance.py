@@ -0,0 +1,73 @@
+import json
+import os
+import re
+import threading
+
+
+class BitacoraAvance:
+    """
+    Bitácora de avance (JSONL de solo anexado) con el resultado de cada comprobante
+    Cada resultado se escribe en cuanto termina, así una corrida interrumpida puede reanudarse
+    """
+
+    def __init__(self, ruta, reanudar=False):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+        # Sin reanudar se empieza una bitácora nueva
+        if not reanudar and os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+        self.completados = self.cargar()
+        self._archivo = open(self.ruta, 'a', encoding='utf-8')
+
+        # Si la corrida anterior se cortó a media línea, empezar en una línea nueva
+        if self._archivo.tell() > 0:
+            with open(self.ruta, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._archivo.write("\n")
+
+    @staticmethod
+    def clave_comprobante(url):
+        """
+        Identificador del comprobante: el id de RindeGastos (i=...) o la URL completa
+        """
+        match = re.search(r'i=(\d+)', str(url))
+        return match.group(1) if match else str(url)
+
+    def cargar(self):
+        """
+        Lee los resultados ya guardados (clave -> resultado); la última línea puede estar truncada
+        """
+        completados = {}
+
+        if not os.path.exists(self.ruta):
+            return completados
+
+        with open(self.ruta, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                    completados[registro['clave']] = registro['resultado']
+                except (ValueError, KeyError):
+                    continue
+
+        return completados
+
+    def registrar(self, clave, resultado):
+        """
+        Agrega el resultado de un comprobante y lo fuerza a disco
+        """
+        linea = json.dumps({'clave': clave, 'resultado': resultado}, ensure_ascii=False, default=str)
+
+        with self._lock:
+            self._archivo.write(linea + "\n")
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+            self.completados[clave] = resultado
+
+    def cerrar(self):
+        """Cierra el archivo de la bitácora"""
+        with self._lock:
+            self._archivo.close()
@@ -0,0 +1,273 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+# Parámetros de firma de las URLs prefirmadas de S3 (v4 y v2): cambian cada vez que se pide la página
+PARAMETROS_FIRMA = ('x-amz-', 'awsaccesskeyid', 'signature', 'expires')
+
+
+def clave_url(url):
+    """
+    Llave de la caché para una URL: sin los parámetros de firma, así un PDF en S3 se encuentra
+    aunque la página lo enlace con otra URL firmada. Las demás URLs quedan igual
+    """
+    partes = urllib.parse.urlsplit(url)
+    parametros = urllib.parse.parse_qsl(partes.query, keep_blank_values=True)
+    sin_firma = [(k, v) for k, v in parametros if not k.lower().startswith(PARAMETROS_FIRMA)]
+
+    if len(sin_firma) == len(parametros):
+        return url
+    return urllib.parse.urlunsplit(partes._replace(query=urllib.parse.urlencode(sin_firma), fragment=''))
+
+
+def _sha256_archivo(ruta):
+    """SHA-256 de un archivo leído por bloques"""
+    sha256 = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(bloque)
+    return sha256.hexdigest()
+
+
+class CacheDescargas:
+    """
+    Caché local de páginas y PDFs descargados
+    Las respuestas se indexan por URL y el contenido se guarda por su SHA-256,
+    con caducidad (TTL) y límite de tamaño con desalojo LRU
+    Las páginas HTML caducan en ttl_paginas_minutos: traen enlaces firmados (S3) que expiran
+    Las URLs se guardan sin su firma (ver clave_url)
+    """
+
+    def __init__(self, directorio='.cache_rindegastos', ttl_horas=24 * 30, max_mb=500, ttl_paginas_minutos=10):
+        self.directorio = Path(directorio)
+        self.directorio_objetos = self.directorio / 'objetos'
+        self.directorio_objetos.mkdir(parents=True, exist_ok=True)
+
+        self.ttl = ttl_horas * 3600
+        self.ttl_paginas = ttl_paginas_minutos * 60
+        self.max_bytes = max_mb * 1024 * 1024
+
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(str(self.directorio / 'indice.sqlite3'), check_same_thread=False)
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                tamano INTEGER NOT NULL,
+                content_type TEXT,
+                guardado REAL NOT NULL,
+                accedido REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                ttl REAL
+            )
+        """)
+
+        # Cachés creadas antes de guardar los validadores HTTP y la caducidad de cada entrada
+        columnas = {fila[1] for fila in self._conexion.execute("PRAGMA table_info(entradas)")}
+        for columna in ('etag', 'last_modified'):
+            if columna not in columnas:
+                self._conexion.execute(f"ALTER TABLE entradas ADD COLUMN {columna} TEXT")
+        if 'ttl' not in columnas:
+            self._conexion.execute("ALTER TABLE entradas ADD COLUMN ttl REAL")
+            self._conexion.execute("UPDATE entradas SET ttl = ? WHERE content_type LIKE '%html%'", (self.ttl_de('text/html'),))
+        self._conexion.commit()
+
+        # Estadísticas de la corrida
+        self.aciertos = 0
+        self.fallos = 0
+        self.revalidados = 0
+
+    def ruta_objeto(self, sha256):
+        """Ruta del archivo que guarda un contenido"""
+        return self.directorio_objetos / sha256[:2] / sha256
+
+    def ttl_de(self, content_type):
+        """Segundos de vigencia de un contenido según su tipo"""
+        if 'html' in (content_type or '').lower():
+            return min(self.ttl_paginas, self.ttl)
+        return self.ttl
+
+    def obtener(self, url):
+        """
+        Devuelve (contenido, content_type) si la URL está en caché y no ha caducado, o None
+        Las entradas caducadas con ETag o Last-Modified se conservan para revalidarlas (ver validadores)
+        """
+        url = clave_url(url)
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT sha256, content_type, guardado, etag, last_modified, ttl FROM entradas WHERE url = ?", (url,)
+            ).fetchone()
+
+            if fila is None:
+                self.fallos += 1
+                return None
+
+            sha256, content_type, guardado, etag, last_modified, ttl = fila
+            caducada = time.time() - guardado > (ttl or self.ttl)
+
+            if caducada and not (etag or last_modified):
+                self._eliminar(url, sha256)
+                self._conexion.commit()
+                self.fallos += 1
+                return None
+
+            if caducada:
+                self.fallos += 1
+                return None
+
+            # Se lee dentro del lock: fuera de él, otro hilo que guarda podría desalojar el archivo
+            try:
+                contenido = self.ruta_objeto(sha256).read_bytes()
+            except FileNotFoundError:
+                self._eliminar(url, sha256)
+                self._conexion.commit()
+                self.fallos += 1
+                return None
+
+            self._conexion.execute("UPDATE entradas SET accedido = ? WHERE url = ?", (time.time(), url))
+            self._conexion.commit()
+            self.aciertos += 1
+
+        return contenido, content_type or ''
+
+    def vigente(self, url):
+        """True si la URL está en caché y no ha caducado (sin leer el contenido)"""
+        url = clave_url(url)
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT sha256, guardado, ttl FROM entradas WHERE url = ?", (url,)
+            ).fetchone()
+
+        return (fila is not None and time.time() - fila[1] <= (fila[2] or self.ttl) and
+                self.ruta_objeto(fila[0]).exists())
+
+    def validadores(self, url):
+        """
+        Encabezados para una solicitud condicional (If-None-Match / If-Modified-Since) con el
+        ETag y Last-Modified guardados de la URL; vacío si no los hay
+        """
+        url = clave_url(url)
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT sha256, etag, last_modified FROM entradas WHERE url = ?", (url,)
+            ).fetchone()
+
+        if fila is None or not self.ruta_objeto(fila[0]).exists():
+            return {}
+
+        encabezados = {}
+        if fila[1]:
+            encabezados['If-None-Match'] = fila[1]
+        if fila[2]:
+            encabezados['If-Modified-Since'] = fila[2]
+        return encabezados
+
+    def renovar(self, url):
+        """
+        El servidor confirmó (304) que el contenido guardado sigue vigente: se reinicia su caducidad
+        Devuelve (contenido, content_type) o None si ya no está en la caché
+        """
+        url = clave_url(url)
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT sha256, content_type FROM entradas WHERE url = ?", (url,)
+            ).fetchone()
+
+            if fila is None:
+                return None
+
+            try:
+                contenido = self.ruta_objeto(fila[0]).read_bytes()
+            except FileNotFoundError:
+                self._eliminar(url, fila[0])
+                self._conexion.commit()
+                return None
+
+            ahora = time.time()
+            self._conexion.execute("UPDATE entradas SET guardado = ?, accedido = ? WHERE url = ?", (ahora, ahora, url))
+            self._conexion.commit()
+            self.revalidados += 1
+
+        return contenido, fila[1] or ''
+
+    def guardar(self, url, contenido, content_type='', etag=None, last_modified=None):
+        """
+        Guarda el contenido de una URL (deduplicado por SHA-256), con su ETag y Last-Modified
+        para revalidarla cuando caduque; las páginas HTML caducan en ttl_paginas
+        contenido puede ser bytes o la ruta de un archivo (p. ej. un PDF grande descargado a disco)
+        """
+        url = clave_url(url)
+        if isinstance(contenido, Path):
+            sha256 = _sha256_archivo(contenido)
+            tamano = contenido.stat().st_size
+        else:
+            sha256 = hashlib.sha256(contenido).hexdigest()
+            tamano = len(contenido)
+        ruta = self.ruta_objeto(sha256)
+
+        with self._lock:
+            if not ruta.exists():
+                ruta.parent.mkdir(parents=True, exist_ok=True)
+                temporal = ruta.with_suffix('.tmp')
+                if isinstance(contenido, Path):
+                    shutil.copyfile(contenido, temporal)
+                else:
+                    temporal.write_bytes(contenido)
+                os.replace(temporal, ruta)
+
+            ahora = time.time()
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO entradas "
+                "(url, sha256, tamano, content_type, guardado, accedido, etag, last_modified, ttl) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, sha256, tamano, content_type, ahora, ahora, etag, last_modified, self.ttl_de(content_type))
+            )
+            self._desalojar()
+            self._conexion.commit()
+
+    def _eliminar(self, url, sha256):
+        """
+        Elimina una entrada y su contenido si ya no lo usa ninguna otra URL
+        Devuelve True si el contenido se eliminó
+        """
+        self._conexion.execute("DELETE FROM entradas WHERE url = ?", (url,))
+        en_uso = self._conexion.execute(
+            "SELECT 1 FROM entradas WHERE sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone()
+
+        if en_uso is not None:
+            return False
+
+        try:
+            self.ruta_objeto(sha256).unlink()
+        except FileNotFoundError:
+            pass
+        return True
+
+    def _desalojar(self):
+        """Desaloja las entradas usadas hace más tiempo hasta respetar el tamaño máximo"""
+        total = self._conexion.execute(
+            "SELECT COALESCE(SUM(tamano), 0) FROM (SELECT DISTINCT sha256, tamano FROM entradas)"
+        ).fetchone()[0]
+
+        if total <= self.max_bytes:
+            return
+
+        for url, sha256, tamano in self._conexion.execute(
+                "SELECT url, sha256, tamano FROM entradas ORDER BY accedido").fetchall():
+            # El contenido compartido por varias URLs solo libera espacio al quitar la última
+            if self._eliminar(url, sha256):
+                total -= tamano
+            if total <= self.max_bytes:
+                break
+
+    def resumen(self):
+        """Texto con aciertos y fallos de la corrida"""
+        return (f"💾 Caché: {self.aciertos} aciertos, {self.revalidados} revalidados (304), "
+                f"{max(0, self.fallos - self.revalidados)} descargas")
@@ -0,0 +1,228 @@
+import csv
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+
+import pandas as pd
+
+# Catálogo completo de claves de producto (opcional): CSV con columnas c_ClaveProdServ y Descripción,
+# exportado del catCFDI del SAT (son ~52,000 claves)
+RUTA_CLAVES_PROD_SERV = Path(__file__).parent / 'catalogos_sat' / 'c_ClaveProdServ.csv'
+
+# c_TipoDeComprobante
+TIPOS_COMPROBANTE = MappingProxyType({
+    'I': 'Ingreso',
+    'E': 'Egreso',
+    'T': 'Traslado',
+    'N': 'Nómina',
+    'P': 'Pago',
+})
+
+# c_MetodoPago
+METODOS_PAGO = MappingProxyType({
+    'PUE': 'Pago en una sola exhibición',
+    'PPD': 'Pago en parcialidades o diferido',
+})
+
+# c_FormaPago
+FORMAS_PAGO = MappingProxyType({
+    '01': 'Efectivo',
+    '02': 'Cheque nominativo',
+    '03': 'Transferencia electrónica',
+    '04': 'Tarjeta de crédito',
+    '05': 'Monedero electrónico',
+    '06': 'Dinero electrónico',
+    '08': 'Vales de despensa',
+    '12': 'Dación en pago',
+    '13': 'Pago por subrogación',
+    '14': 'Pago por consignación',
+    '15': 'Condonación',
+    '17': 'Compensación',
+    '23': 'Novación',
+    '24': 'Confusión',
+    '25': 'Remisión de deuda',
+    '26': 'Prescripción o caducidad',
+    '27': 'A satisfacción del acreedor',
+    '28': 'Tarjeta de débito',
+    '29': 'Tarjeta de servicios',
+    '30': 'Aplicación de anticipos',
+    '31': 'Intermediario pagos',
+    '99': 'Por definir',
+})
+
+# c_UsoCFDI (CFDI 4.0, más P01 de CFDI 3.3)
+USOS_CFDI = MappingProxyType({
+    'G01': 'Adquisición de mercancías',
+    'G02': 'Devoluciones, descuentos o bonificaciones',
+    'G03': 'Gastos en general',
+    'I01': 'Construcciones',
+    'I02': 'Mobiliario y equipo de oficina',
+    'I03': 'Equipo de transporte',
+    'I04': 'Equipo de cómputo',
+    'I05': 'Dados, troqueles, moldes',
+    'I06': 'Comunicaciones telefónicas',
+    'I07': 'Comunicaciones satelitales',
+    'I08': 'Otra maquinaria y equipo',
+    'D01': 'Honorarios médicos y gastos hospitalarios',
+    'D02': 'Gastos médicos por incapacidad',
+    'D03': 'Gastos funerales',
+    'D04': 'Donativos',
+    'D05': 'Intereses hipotecarios',
+    'D06': 'Aportaciones voluntarias al SAR',
+    'D07': 'Primas por seguros de gastos médicos',
+    'D08': 'Gastos de transportación escolar',
+    'D09': 'Depósitos en cuentas para el ahorro',
+    'D10': 'Pagos por servicios educativos',
+    'S01': 'Sin efectos fiscales',
+    'CP01': 'Pagos',
+    'CN01': 'Nómina',
+    'P01': 'Por definir',
+})
+
+# c_RegimenFiscal
+REGIMENES_FISCALES = MappingProxyType({
+    '601': 'General de Ley Personas Morales',
+    '603': 'Personas Morales con Fines no Lucrativos',
+    '605': 'Sueldos y Salarios e Ingresos Asimilados a Salarios',
+    '606': 'Arrendamiento',
+    '607': 'Régimen de Enajenación o Adquisición de Bienes',
+    '608': 'Demás ingresos',
+    '609': 'Consolidación',
+    '610': 'Residentes en el Extranjero sin Establecimiento Permanente en México',
+    '611': 'Ingresos por Dividendos (socios y accionistas)',
+    '612': 'Personas Físicas con Actividades Empresariales y Profesionales',
+    '614': 'Ingresos por intereses',
+    '615': 'Régimen de los ingresos por obtención de premios',
+    '616': 'Sin obligaciones fiscales',
+    '620': 'Sociedades Cooperativas de Producción que optan por diferir sus ingresos',
+    '621': 'Incorporación Fiscal',
+    '622': 'Actividades Agrícolas, Ganaderas, Silvícolas y Pesqueras',
+    '623': 'Opcional para Grupos de Sociedades',
+    '624': 'Coordinados',
+    '625': 'Régimen de las Actividades Empresariales con ingresos a través de Plataformas Tecnológicas',
+    '626': 'Régimen Simplificado de Confianza',
+    '628': 'Hidrocarburos',
+    '629': 'De los Regímenes Fiscales Preferentes y de las Empresas Multinacionales',
+    '630': 'Enajenación de acciones en bolsa de valores',
+})
+
+# Segmentos de c_ClaveProdServ (dos primeros dígitos, basados en UNSPSC): descripción
+# cuando no se tiene el catálogo completo o la clave no aparece en él
+SEGMENTOS_CLAVE_PROD_SERV = MappingProxyType({
+    '01': 'No existe en el catálogo',
+    '10': 'Material Vivo Vegetal y Animal, Accesorios y Suministros',
+    '11': 'Material Mineral, Textil y Vegetal y Animal No Comestible',
+    '12': 'Material Químico incluyendo Bioquímicos y Materiales de Gas',
+    '13': 'Materiales de Resina, Colofonia, Caucho, Espuma, Película y Elastoméricos',
+    '14': 'Materiales y Productos de Papel',
+    '15': 'Materiales Combustibles, Aditivos para Combustibles, Lubricantes y Anticorrosivos',
+    '20': 'Maquinaria y Accesorios de Minería y Perforación de Pozos',
+    '21': 'Maquinaria y Accesorios para Agricultura, Pesca, Silvicultura y Fauna',
+    '22': 'Maquinaria y Accesorios para Construcción y Edificación',
+    '23': 'Maquinaria y Accesorios para Manufactura y Procesamiento Industrial',
+    '24': 'Maquinaria, Accesorios y Suministros para Manejo, Acondicionamiento y Almacenamiento de Materiales',
+    '25': 'Vehículos Comerciales, Militares y Particulares, Accesorios y Componentes',
+    '26': 'Maquinaria y Accesorios para Generación y Distribución de Energía',
+    '27': 'Herramientas y Maquinaria General',
+    '30': 'Componentes y Suministros para Estructuras, Edificación, Construcción y Obras Civiles',
+    '31': 'Componentes y Suministros de Manufactura',
+    '32': 'Componentes y Suministros Electrónicos',
+    '39': 'Componentes, Accesorios y Suministros de Sistemas Eléctricos e Iluminación',
+    '40': 'Componentes y Equipos para Distribución y Sistemas de Acondicionamiento',
+    '41': 'Equipo de Laboratorio, de Medición, de Observación y de Pruebas',
+    '42': 'Equipo Médico, Accesorios y Suministros',
+    '43': 'Difusión de Tecnologías de Información y Telecomunicaciones',
+    '44': 'Equipos de Oficina, Accesorios y Suministros',
+    '45': 'Equipos y Suministros de Imprenta, Fotografía y Audiovisuales',
+    '46': 'Equipos y Suministros de Defensa, Orden Público, Protección, Vigilancia y Seguridad',
+    '47': 'Equipos de Limpieza y Suministros',
+    '48': 'Maquinaria, Equipo y Suministros para la Industria de Servicios',
+    '49': 'Equipos, Suministros y Accesorios para Deportes y Recreación',
+    '50': 'Alimentos, Bebidas y Tabaco',
+    '51': 'Medicamentos y Productos Farmacéuticos',
+    '52': 'Artículos Domésticos, Suministros y Productos Electrónicos de Consumo',
+    '53': 'Ropa, Maletas y Productos de Aseo Personal',
+    '54': 'Productos para Relojería, Joyería y Piedras Preciosas',
+    '55': 'Publicaciones Impresas, Publicaciones Electrónicas y Accesorios',
+    '56': 'Muebles, Mobiliario y Decoración',
+    '60': 'Instrumentos Musicales, Juegos, Artes, Artesanías y Equipo Educativo, Materiales, Accesorios y Suministros',
+    '64': 'Instrumentos Financieros, Productos, Contratos y Acuerdos',
+    '70': 'Servicios de Contratación Agrícola, Pesquera, Forestal y de Fauna',
+    '71': 'Servicios de Minería, Petróleo y Gas',
+    '72': 'Servicios de Edificación, Construcción de Instalaciones y Mantenimiento',
+    '73': 'Servicios de Producción Industrial y Manufactura',
+    '76': 'Servicios de Limpieza, Descontaminación y Tratamiento de Residuos',
+    '77': 'Servicios Medioambientales',
+    '78': 'Servicios de Transporte, Almacenaje y Correo',
+    '80': 'Servicios de Gestión, Servicios Profesionales de Empresa y Servicios Administrativos',
+    '81': 'Servicios Basados en Ingeniería, Investigación y Tecnología',
+    '82': 'Servicios Editoriales, de Diseño, de Artes Gráficas y Bellas Artes',
+    '83': 'Servicios Públicos y Servicios Relacionados con el Sector Público',
+    '84': 'Servicios Financieros y de Seguros',
+    '85': 'Servicios de Salud',
+    '86': 'Servicios Educativos y de Formación',
+    '90': 'Servicios de Viajes, Alimentación, Alojamiento y Entretenimiento',
+    '91': 'Servicios Personales y Domésticos',
+    '92': 'Servicios de Defensa Nacional, Orden Público, Seguridad y Vigilancia',
+    '93': 'Servicios Políticos y de Asuntos Cívicos',
+    '94': 'Organizaciones y Clubes',
+    '95': 'Terrenos, Edificios, Estructuras y Vías',
+})
+
+
+@lru_cache(maxsize=None)
+def claves_prod_serv(ruta=RUTA_CLAVES_PROD_SERV):
+    """
+    Catálogo c_ClaveProdServ (clave -> descripción) leído una sola vez del CSV;
+    vacío si el archivo no existe
+    """
+    ruta = Path(ruta)
+    if not ruta.exists():
+        return MappingProxyType({})
+
+    claves = {}
+    try:
+        with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+            for fila in csv.DictReader(f):
+                clave = (fila.get('c_ClaveProdServ') or '').strip()
+                if clave:
+                    claves[clave] = (fila.get('Descripción') or fila.get('Descripcion') or '').strip()
+    except Exception as e:
+        print(f"⚠️ No se pudo leer {ruta.name}: {str(e)[:50]}")
+
+    return MappingProxyType(claves)
+
+
+def describir_clave_prod_serv(clave):
+    """Descripción de una clave de producto o servicio (o de su segmento)"""
+    descripcion = claves_prod_serv().get(clave)
+    if descripcion:
+        return descripcion
+    return SEGMENTOS_CLAVE_PROD_SERV.get(str(clave)[:2], '')
+
+
+def describir(serie, tabla):
+    """
+    Descripción de cada código de la serie (el propio código si no está en el catálogo)
+    El catálogo se consulta una vez por código distinto y se aplica con un solo map
+    """
+    descripciones = {codigo: tabla.get(codigo, codigo) for codigo in pd.unique(serie)}
+    return serie.map(descripciones)
+
+
+def enriquecer_catalogo(df):
+    """Agrega las descripciones de los códigos SAT al DataFrame de comprobantes"""
+    df['tipo_comprobante_desc'] = describir(df['tipo_comprobante'], TIPOS_COMPROBANTE)
+    df['metodo_pago_desc'] = describir(df['metodo_pago'], METODOS_PAGO)
+    df['forma_pago_desc'] = describir(df['forma_pago'], FORMAS_PAGO)
+    df['receptor_uso_cfdi_desc'] = describir(df['receptor_uso_cfdi'], USOS_CFDI)
+    df['emisor_regimen_desc'] = describir(df['emisor_regimen'], REGIMENES_FISCALES)
+    df['receptor_regimen_desc'] = describir(df['receptor_regimen'], REGIMENES_FISCALES)
+    return df
+
+
+def enriquecer_conceptos(df_conceptos):
+    """Agrega la descripción de la clave de producto o servicio a cada concepto"""
+    descripciones = {clave: describir_clave_prod_serv(clave) for clave in pd.unique(df_conceptos['clave_producto'])}
+    df_conceptos['clave_producto_desc'] = df_conceptos['clave_producto'].map(descripciones)
+    return df_conceptos
@@ -0,0 +1,421 @@
+import email.utils
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from concurrencia import LimitadorPorHost
+
+# Respuestas que pueden cambiar al reintentar (el servidor está saturado o falló temporalmente)
+ESTADOS_REINTENTABLES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Respuestas que dicen con certeza que la URL no existe (no cambian al reintentar)
+ESTADOS_SIN_RECURSO = frozenset({404, 410})
+
+# PDFs descargados: tamaño máximo aceptado y tamaño a partir del cual se pasan a un archivo temporal
+MAX_BYTES_PDF = 50 * 1024 * 1024
+MAX_BYTES_PDF_EN_MEMORIA = 5 * 1024 * 1024
+TAMANO_BLOQUE = 64 * 1024
+
+# Candidatos de descarga que se sondean a la vez por comprobante (solo el primer KB de cada uno)
+SONDEOS_SIMULTANEOS = 4
+
+
+def segundos_retry_after(valor):
+    """
+    Segundos indicados en el encabezado Retry-After (número de segundos o fecha HTTP);
+    None si no viene o no se entiende
+    """
+    if not valor:
+        return None
+
+    valor = valor.strip()
+    if valor.isdigit():
+        return float(valor)
+
+    try:
+        fecha = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return max(0.0, (fecha - datetime.now(timezone.utc)).total_seconds())
+
+
+def tamano_pdf(pdf):
+    """Bytes de un PDF descargado (en memoria o en archivo temporal)"""
+    return pdf.stat().st_size if isinstance(pdf, Path) else len(pdf)
+
+
+def borrar_pdf_temporal(pdf):
+    """Borra el archivo temporal de un PDF grande (los PDFs en memoria no necesitan nada)"""
+    if isinstance(pdf, Path):
+        pdf.unlink(missing_ok=True)
+
+
+class RecepcionPDF:
+    """
+    PDF que se recibe por bloques (lo usan la descarga con requests y la asíncrona)
+    - Se rechaza en cuanto el primer KB no trae la firma %PDF (p. ej. una página de error HTML)
+    - Se rechaza si excede max_bytes
+    - Si pasa de max_bytes_memoria se escribe en un archivo temporal en lugar de quedarse en RAM
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES_PDF, max_bytes_memoria=MAX_BYTES_PDF_EN_MEMORIA, content_type=''):
+        self.max_bytes = max_bytes
+        self.max_bytes_memoria = max_bytes_memoria
+        self.content_type = content_type
+
+        self.inicio = b''
+        self.contenido = bytearray()
+        self.archivo = None
+        self.total = 0
+
+    def longitud_aceptada(self, longitud):
+        """False si el Content-Length declarado ya excede el máximo"""
+        if longitud.isdigit() and int(longitud) > self.max_bytes:
+            print(f"   ⚠️ PDF demasiado grande ({int(longitud):,} bytes), se omite")
+            return False
+        return True
+
+    def firma_valida(self):
+        """True si el primer KB trae la firma %PDF"""
+        if b'%PDF' in self.inicio:
+            return True
+        print(f"   ⚠️ No es un PDF válido ({self.content_type or 'sin content-type'})")
+        return False
+
+    def agregar(self, bloque):
+        """Agrega un bloque; False si el PDF se rechaza y ya no hay que seguir leyendo"""
+        if len(self.inicio) < 1024:
+            self.inicio += bloque[:1024 - len(self.inicio)]
+            if len(self.inicio) >= 1024 and not self.firma_valida():
+                return False
+
+        self.total += len(bloque)
+        if self.total > self.max_bytes:
+            print(f"   ⚠️ PDF demasiado grande (más de {self.max_bytes:,} bytes), se omite")
+            return False
+
+        if self.archivo is None and self.total > self.max_bytes_memoria:
+            self.archivo = tempfile.NamedTemporaryFile(prefix='rindegastos_', suffix='.pdf', delete=False)
+            self.archivo.write(self.contenido)
+            self.contenido = None
+
+        if self.archivo is None:
+            self.contenido += bloque
+        else:
+            self.archivo.write(bloque)
+        return True
+
+    def terminar(self):
+        """
+        PDF completo: bytes, la Path del archivo temporal (quien llama lo borra con
+        borrar_pdf_temporal) o None si no es un PDF válido
+        """
+        if len(self.inicio) < 1024 and not self.firma_valida():
+            return None
+
+        if self.total <= 1000:
+            print(f"   ⚠️ No es un PDF válido ({self.total} bytes)")
+            return None
+
+        if self.archivo is not None:
+            self.archivo.close()
+            return Path(self.archivo.name)
+        return bytes(self.contenido)
+
+    def descartar(self):
+        """Borra el archivo temporal de un PDF rechazado o incompleto"""
+        if self.archivo is not None:
+            self.archivo.close()
+            borrar_pdf_temporal(Path(self.archivo.name))
+
+
+class ClienteHTTP:
+    """
+    Sesión HTTP compartida por todos los hilos: las conexiones se reutilizan (keep-alive) con un
+    pool del tamaño del número de hilos más los sondeos, cada solicitud respeta el límite por
+    servidor y los fallos temporales se reintentan con backoff exponencial y jitter
+    Los sondeos de candidatos corren en un solo executor compartido por todos los hilos
+    """
+
+    def __init__(self, max_workers=4, limitador=None, reintentos=3, backoff_base=1.0,
+                 backoff_maximo=30.0, retry_after_maximo=120.0, headers=None):
+        self.limitador = limitador or LimitadorPorHost()
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.backoff_maximo = backoff_maximo
+        self.retry_after_maximo = retry_after_maximo
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+
+        # Respuesta de un sondeo que ya trae el PDF completo (el servidor ignoró Range), por hilo:
+        # la descarga siguiente de esa URL la lee en lugar de volver a pedirla
+        self._sondeo_abierto = threading.local()
+        self._sondeos = None
+        self.dimensionar(max_workers)
+
+    def dimensionar(self, max_workers):
+        """
+        Ajusta el pool de conexiones por servidor al número de hilos que descargan más los
+        sondeos que pueden estar en curso a la vez, así ninguna conexión se descarta por pool lleno
+        """
+        max_workers = max(1, max_workers)
+        sondeos = max(SONDEOS_SIMULTANEOS, max_workers)
+
+        adaptador = HTTPAdapter(pool_maxsize=max_workers + sondeos)
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+
+        if self._sondeos is not None:
+            self._sondeos.shutdown(wait=False)
+        self._sondeos = ThreadPoolExecutor(max_workers=sondeos, thread_name_prefix='sondeo_pdf')
+
+    def cerrar(self):
+        """Termina el executor de sondeos y cierra las conexiones"""
+        self._descartar_sondeo()
+        self._sondeos.shutdown(wait=False)
+        self.session.close()
+
+    def espera(self, intento, retry_after=None):
+        """
+        Segundos antes del siguiente intento: lo que pida el servidor (Retry-After) o backoff
+        exponencial con jitter completo, para que los hilos no reintenten todos a la vez
+        """
+        segundos = segundos_retry_after(retry_after)
+        if segundos is not None:
+            return min(segundos, self.retry_after_maximo)
+        return random.uniform(0, min(self.backoff_maximo, self.backoff_base * 2 ** intento))
+
+    def get(self, url, headers=None, timeout=20, stream=False):
+        """
+        GET con reintentos
+        - 408, 429 y 5xx: se reintenta (esperando lo que indique Retry-After, si viene)
+        - Otros 4xx: se devuelve la respuesta sin reintentar (no se corrigen reintentando)
+        - Timeouts y errores de conexión: se reintenta; al agotar los intentos se lanza la excepción
+        Devuelve la última respuesta
+        """
+        for intento in range(self.reintentos + 1):
+            self.limitador.esperar(url)
+
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout, stream=stream)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                if intento == self.reintentos:
+                    raise
+                tipo = "Tiempo agotado" if isinstance(e, requests.Timeout) else "Error de conexión"
+                espera = self.espera(intento)
+                print(f"   🔁 {tipo}, reintento {intento + 1} en {espera:.1f} s: {url[:60]}")
+                time.sleep(espera)
+                continue
+
+            if response.status_code not in ESTADOS_REINTENTABLES or intento == self.reintentos:
+                return response
+
+            espera = self.espera(intento, response.headers.get('Retry-After'))
+            response.close()
+            print(f"   🔁 HTTP {response.status_code}, reintento {intento + 1} en {espera:.1f} s: {url[:60]}")
+            time.sleep(espera)
+
+    def get_con_cache(self, url, cache, headers=None, timeout=20):
+        """
+        GET que guarda las respuestas 200 en la caché junto con su ETag y Last-Modified
+        Si la URL ya estaba en la caché (caducada), la solicitud es condicional y un 304
+        reutiliza el contenido guardado sin volver a descargarlo
+        Devuelve (status_code, content_type, contenido)
+        """
+        headers = dict(headers or {})
+        if cache:
+            headers.update(cache.validadores(url))
+
+        response = self.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and cache:
+            en_cache = cache.renovar(url)
+            if en_cache:
+                return 200, en_cache[1], en_cache[0]
+
+            # La entrada desapareció entre la consulta y la respuesta: descarga completa
+            response = self.get(url, headers={k: v for k, v in headers.items() if not k.startswith('If-')},
+                                timeout=timeout)
+
+        content_type = response.headers.get('content-type', '')
+        if response.status_code == 200 and cache:
+            cache.guardar(url, response.content, content_type,
+                          response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        return response.status_code, content_type, response.content
+
+    def sondear_pdf(self, url, headers=None, timeout=10):
+        """
+        True si la URL responde con un PDF, pidiendo solo el primer KB (Range: bytes=0-1023)
+        Se usa Range en lugar de HEAD porque las URLs firmadas (p. ej. S3) solo valen para GET
+        """
+        es_pdf, abierta = self._sondear(url, headers, timeout)
+        if abierta is not None:
+            abierta[0].close()
+        return bool(es_pdf)
+
+    def _sondear(self, url, headers=None, timeout=10):
+        """
+        Sondeo de sondear_pdf; devuelve (es_pdf, abierta)
+        es_pdf es True si responde con un PDF, False si la respuesta es definitiva (404, 410 o algo
+        que no es PDF) y None si no hubo respuesta definitiva (timeouts, errores de conexión, 5xx)
+        Si el servidor ignoró Range (200 en lugar de 206) y es un PDF, la respuesta queda abierta
+        en abierta = (response, inicio), con inicio los bytes ya leídos; si no, abierta es None
+        """
+        headers = dict(headers or {})
+        headers['Range'] = 'bytes=0-1023'
+
+        try:
+            response = self.get(url, headers=headers, timeout=timeout, stream=True)
+        except requests.RequestException:
+            return None, None
+
+        try:
+            if response.status_code not in (200, 206):
+                response.close()
+                return (False if response.status_code in ESTADOS_SIN_RECURSO else None), None
+
+            inicio = b''
+            for bloque in response.iter_content(1024):
+                inicio += bloque
+                if len(inicio) >= 1024:
+                    break
+
+            if b'%PDF' not in inicio[:1024]:
+                response.close()
+                return False, None
+
+            if response.status_code == 200:
+                return True, (response, inicio)
+
+            response.close()
+            return True, None
+
+        except requests.RequestException:
+            response.close()
+            return None, None
+
+    def _descartar_sondeo(self):
+        """Cierra la respuesta de sondeo que este hilo no llegó a usar"""
+        abierta = getattr(self._sondeo_abierto, 'respuesta', None)
+        self._sondeo_abierto.respuesta = None
+        if abierta is not None:
+            abierta[1].close()
+
+    def _tomar_sondeo(self, url):
+        """(response, inicio) del sondeo abierto de esta URL en este hilo, o None"""
+        abierta = getattr(self._sondeo_abierto, 'respuesta', None)
+        if abierta is None or abierta[0] != url:
+            self._descartar_sondeo()
+            return None
+        self._sondeo_abierto.respuesta = None
+        return abierta[1], abierta[2]
+
+    def resolver_pdfs(self, urls, headers=None, timeout=10, simultaneos=SONDEOS_SIMULTANEOS):
+        """
+        Sondea en paralelo las URLs candidatas, por lotes en orden de prioridad, hasta que un lote
+        tenga alguna que responda con un PDF
+        Si la primera confirmada respondió con el PDF completo, la respuesta se conserva para que
+        descargar_pdf la lea sin pedirla otra vez (en este mismo hilo)
+        Devuelve (confirmadas, descartadas): las confirmadas en su orden original; descartadas
+        solo son las que respondieron en definitiva que no hay PDF (404, 410 o algo que no es PDF)
+        """
+        self._descartar_sondeo()
+        descartadas = []
+
+        for inicio in range(0, len(urls), simultaneos):
+            lote = urls[inicio:inicio + simultaneos]
+
+            futuros = [self._sondeos.submit(self._sondear, url, headers, timeout) for url in lote]
+            resultados = [futuro.result() for futuro in futuros]
+
+            confirmadas = [url for url, (es_pdf, _) in zip(lote, resultados) if es_pdf]
+            descartadas.extend(url for url, (es_pdf, _) in zip(lote, resultados) if es_pdf is False)
+
+            for url, (_, abierta) in zip(lote, resultados):
+                if abierta is None:
+                    continue
+                if url == confirmadas[0]:
+                    self._sondeo_abierto.respuesta = (url, *abierta)
+                else:
+                    abierta[0].close()
+
+            if confirmadas:
+                return confirmadas, descartadas
+
+        return [], descartadas
+
+    def descargar_pdf(self, url, headers=None, timeout=30, max_bytes=MAX_BYTES_PDF,
+                      max_bytes_memoria=MAX_BYTES_PDF_EN_MEMORIA, cache=None):
+        """
+        Descarga un PDF leyendo la respuesta por bloques
+        - Se rechaza en cuanto el primer KB no trae la firma %PDF (p. ej. una página de error HTML),
+          sin leer el resto del cuerpo
+        - Se rechaza si excede max_bytes (según Content-Length o conforme se lee)
+        - Si pasa de max_bytes_memoria se escribe en un archivo temporal en lugar de quedarse en RAM
+        - Con cache, un PDF válido se guarda con su ETag y Last-Modified y, si ya estaba guardado
+          (caducado), la solicitud es condicional: un 304 reutiliza el contenido de la caché
+        - Si resolver_pdfs dejó abierta la respuesta del sondeo de esta URL (el servidor ignoró
+          Range y ya estaba enviando el PDF completo), se sigue leyendo esa en lugar de pedirla otra vez
+        Devuelve (status_code, content_type, pdf): pdf son bytes, la Path del archivo temporal
+        (quien llama lo borra con borrar_pdf_temporal) o None si no es un PDF válido
+        """
+        sondeo = self._tomar_sondeo(url)
+        if sondeo is not None:
+            response, inicio = sondeo
+        else:
+            headers = dict(headers or {})
+            if cache:
+                headers.update(cache.validadores(url))
+
+            response = self.get(url, headers=headers, timeout=timeout, stream=True)
+            inicio = b''
+        content_type = response.headers.get('content-type', '')
+
+        if response.status_code == 304 and cache:
+            response.close()
+            en_cache = cache.renovar(url)
+            if en_cache and b'%PDF' in en_cache[0][:1024]:
+                print(f"   💾 PDF revalidado (304): {url[:60]}")
+                return 200, en_cache[1], en_cache[0]
+            return self.descargar_pdf(url, {k: v for k, v in headers.items() if not k.startswith('If-')},
+                                      timeout, max_bytes, max_bytes_memoria)
+
+        with response:
+            if response.status_code != 200:
+                return response.status_code, content_type, None
+
+            recepcion = RecepcionPDF(max_bytes, max_bytes_memoria, content_type)
+            if not recepcion.longitud_aceptada(response.headers.get('Content-Length', '')):
+                return response.status_code, content_type, None
+
+            pdf = None
+            try:
+                # Con la respuesta de un sondeo, el primer KB ya se leyó y se agrega primero
+                bloques = response.iter_content(TAMANO_BLOQUE)
+                if ((not inicio or recepcion.agregar(inicio)) and
+                        all(recepcion.agregar(bloque) for bloque in bloques)):
+                    pdf = recepcion.terminar()
+            finally:
+                # Un PDF incompleto (rechazado o con error de lectura) no deja archivo temporal
+                if pdf is None:
+                    recepcion.descartar()
+
+            if pdf is None:
+                return response.status_code, content_type, None
+
+        if cache:
+            cache.guardar(url, pdf, content_type, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        return response.status_code, content_type, pdf
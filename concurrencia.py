@@ -0,0 +1,98 @@
+import itertools
+import threading
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Solicitudes por segundo permitidas por servidor (se compara por sufijo del host)
+TASAS_POR_HOST = {
+    'rindegastos.com': 2.0,
+    'amazonaws.com': 5.0,
+}
+
+
+class LimitadorPorHost:
+    """
+    Limitador tipo token bucket por servidor
+    Permite procesar varias facturas en paralelo sin saturar (ni ser bloqueados por) cada host
+    """
+
+    def __init__(self, tasas=None, tasa_defecto=2.0, rafaga=2):
+        self.tasas = TASAS_POR_HOST.copy() if tasas is None else tasas
+        self.tasa_defecto = tasa_defecto
+        self.rafaga = rafaga
+
+        self._cubetas = {}  # host -> (tokens, último instante)
+        self._lock = threading.Lock()
+
+    def clave_host(self, url):
+        """
+        Devuelve el host (o sufijo configurado) y la tasa que le corresponde
+        """
+        host = urllib.parse.urlparse(url).hostname or ''
+
+        for sufijo, tasa in self.tasas.items():
+            if host == sufijo or host.endswith('.' + sufijo):
+                return sufijo, tasa
+
+        return host, self.tasa_defecto
+
+    def reservar(self, url):
+        """
+        Reserva un turno para la URL y devuelve los segundos que hay que esperar antes de usarlo
+        """
+        clave, tasa = self.clave_host(url)
+
+        with self._lock:
+            ahora = time.monotonic()
+            tokens, ultimo = self._cubetas.get(clave, (self.rafaga, ahora))
+
+            # Recargar tokens según el tiempo transcurrido; si quedan negativos, hay cola
+            tokens = min(self.rafaga, tokens + (ahora - ultimo) * tasa) - 1
+            self._cubetas[clave] = (tokens, ahora)
+
+        return max(0.0, -tokens / tasa)
+
+    def esperar(self, url):
+        """
+        Bloquea el hilo actual hasta que el host de la URL tenga un turno disponible
+        """
+        espera = self.reservar(url)
+        if espera > 0:
+            time.sleep(espera)
+
+
+def procesar_en_paralelo(tareas, funcion, max_workers=4):
+    """
+    Ejecuta funcion(*argumentos) para cada (clave, argumentos) en un pool de hilos
+    Devuelve (clave, resultado, error) conforme se completan, para escribir cada
+    resultado en su fila correspondiente
+    Solo hay unas 2 * max_workers tareas enviadas a la vez; si el generador se cierra
+    (p. ej. con Ctrl+C) las que no han empezado se cancelan sin esperarlas
+    """
+    tareas = iter(tareas)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futuros = {}
+
+    def enviar(cantidad):
+        for clave, argumentos in itertools.islice(tareas, cantidad):
+            futuros[executor.submit(funcion, *argumentos)] = clave
+
+    try:
+        enviar(2 * max_workers)
+
+        while futuros:
+            terminados, _ = wait(futuros, return_when=FIRST_COMPLETED)
+
+            for futuro in terminados:
+                clave = futuros.pop(futuro)
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    yield clave, None, e
+                else:
+                    yield clave, resultado, None
+
+            enviar(2 * max_workers - len(futuros))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,73 @@
+import hashlib
+import re
+
+# UUID del TimbreFiscalDigital, buscado directamente en los bytes (sin parsear el XML)
+PATRON_UUID_TIMBRE = re.compile(
+    rb'TimbreFiscalDigital\b[^>]*?\sUUID\s*=\s*["\']([0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-'
+    rb'[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12})["\']'
+)
+
+MOTIVO_MISMO_CONTENIDO = "Mismo contenido (bytes)"
+MOTIVO_MISMO_UUID = "Mismo UUID"
+
+
+def huella_xml(archivo_xml):
+    """
+    Devuelve (sha256, uuid) de un XML con una sola lectura del archivo
+    uuid es '' si el XML no tiene TimbreFiscalDigital
+    """
+    contenido = archivo_xml.read_bytes()
+    sha256 = hashlib.sha256(contenido).hexdigest()
+
+    # El timbre suele ir al final (en el Complemento): buscar primero en la cola
+    match = PATRON_UUID_TIMBRE.search(contenido, max(0, len(contenido) - 16384))
+    if match is None:
+        match = PATRON_UUID_TIMBRE.search(contenido)
+
+    uuid = match.group(1).decode('ascii').upper() if match else ''
+    return sha256, uuid
+
+
+def separar_duplicados(archivos, almacen=None):
+    """
+    Separa, antes de leerlos, los XMLs repetidos: mismo contenido byte a byte o mismo UUID
+    que un archivo anterior de la lista. Los XMLs sin timbre (UUID vacío) nunca se consideran
+    duplicados por UUID.
+    archivos: lista de (carpeta, Path) en orden
+    almacen: AlmacenCFDI opcional; los archivos sin cambios toman de él su hash y UUID sin leerse
+    Devuelve (únicos, duplicados); cada duplicado es un dict con carpeta, archivo, motivo y original
+    """
+    unicos = []
+    duplicados = []
+    por_contenido = {}
+    por_uuid = {}
+    huella = almacen.huella_cfdi if almacen is not None else huella_xml
+
+    for carpeta, archivo_xml in archivos:
+        try:
+            sha256, uuid = huella(archivo_xml)
+        except OSError as e:
+            print(f"Error leyendo {archivo_xml}: {str(e)}")
+            continue
+
+        original = por_contenido.get(sha256)
+        motivo = MOTIVO_MISMO_CONTENIDO
+        if original is None and uuid:
+            original = por_uuid.get(uuid)
+            motivo = MOTIVO_MISMO_UUID
+
+        if original is not None:
+            duplicados.append({
+                'carpeta': carpeta,
+                'archivo': archivo_xml,
+                'motivo': motivo,
+                'original': original,
+            })
+            continue
+
+        por_contenido[sha256] = archivo_xml
+        if uuid:
+            por_uuid[uuid] = archivo_xml
+        unicos.append((carpeta, archivo_xml))
+
+    return unicos, duplicados
@@ -0,0 +1,163 @@
+import html
+import re
+from html.entities import html5
+from html.parser import HTMLParser
+
+from bs4 import UnicodeDammit
+
+# URLs de PDFs y XMLs escritas en el código de la página (scripts, atributos data-*, JSON)
+PATRON_PDF_S3 = re.compile(r'https?://[^\s\'"]+\.s3\.amazonaws\.com/[^\s\'"]+\.pdf', re.IGNORECASE)
+PATRON_PDF = re.compile(r'https?://[^\s\'"]+\.pdf', re.IGNORECASE)
+PATRON_XML = re.compile(r'https?://[^\s\'"<>]+\.xml\b(?:\?[^\s\'"<>]*)?', re.IGNORECASE)
+
+# Su contenido no cuenta como texto de la página (igual que en BeautifulSoup.get_text)
+ETIQUETAS_SIN_TEXTO = frozenset({'script', 'style', 'template'})
+
+# Dentro de ellas el texto que solo tiene espacios se conserva tal cual
+ETIQUETAS_PRESERVAN_ESPACIOS = frozenset({'pre', 'textarea'})
+
+# Espacios que BeautifulSoup reduce a ' ' o '\n' cuando un texto solo tiene espacios
+ESPACIOS_ASCII = ' \n\t\x0c\r'
+
+# Elementos vacíos: nunca quedan abiertos
+ETIQUETAS_VACIAS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer',
+})
+
+
+class PaginaHTML(HTMLParser):
+    """
+    Página de un comprobante recorrida una sola vez, sin construir el árbol de BeautifulSoup
+    - anclas: (href, texto) de cada <a>, con el texto como link.get_text(strip=True)
+    - iframes: src de cada <iframe>
+    - texto: texto de la página, igual que soup.get_text()
+    - fuente: el HTML decodificado, para buscar URLs en los scripts sin volver a serializarlo
+    Las etiquetas se cierran como en el parser html.parser de BeautifulSoup: cerrar una etiqueta
+    cierra también las que quedaron abiertas dentro de ella
+    """
+
+    def __init__(self, contenido):
+        # Las entidades se resuelven aquí, como en BeautifulSoup (&desconocida; queda como "&desconocida")
+        super().__init__(convert_charrefs=False)
+
+        # Misma detección de codificación que BeautifulSoup
+        if isinstance(contenido, str):
+            self.fuente = contenido
+        else:
+            self.fuente = UnicodeDammit(contenido, is_html=True).unicode_markup
+
+        self.anclas = []
+        self.iframes = []
+        self._texto = []
+        self._datos = []
+
+        # Etiquetas abiertas y, de ellas, los enlaces: (índice en anclas, partes del texto)
+        self._abiertas = []
+        self._anclas_abiertas = []
+        self._sin_texto = 0
+        self._preservar = 0
+
+        self.feed(self.fuente)
+        self.close()
+        self._terminar_datos()
+        self._cerrar_hasta(0)
+
+    @property
+    def texto(self):
+        return ''.join(self._texto)
+
+    def _cerrar_hasta(self, posicion):
+        """Cierra las etiquetas abiertas desde la posición indicada de la pila"""
+        while len(self._abiertas) > posicion:
+            tag = self._abiertas.pop()
+            if tag == 'a':
+                indice, partes = self._anclas_abiertas.pop()
+                self.anclas[indice] = (self.anclas[indice][0], ''.join(partes))
+            elif tag in ETIQUETAS_SIN_TEXTO:
+                self._sin_texto -= 1
+            elif tag in ETIQUETAS_PRESERVAN_ESPACIOS:
+                self._preservar -= 1
+
+    def _terminar_datos(self):
+        """
+        Cierra el texto acumulado desde la última etiqueta (html.parser lo entrega en partes, p. ej.
+        al encontrar entidades) y lo agrega al texto de la página y de los enlaces abiertos
+        """
+        if not self._datos:
+            return
+        data = ''.join(self._datos)
+        self._datos = []
+
+        if self._sin_texto:
+            return
+
+        if not self._preservar and not data.strip(ESPACIOS_ASCII):
+            self._texto.append('\n' if '\n' in data else ' ')
+            return
+
+        self._texto.append(data)
+
+        limpio = data.strip()
+        if limpio:
+            for _, partes in self._anclas_abiertas:
+                partes.append(limpio)
+
+    def handle_starttag(self, tag, attrs):
+        self._terminar_datos()
+        if tag == 'a':
+            self.anclas.append((dict(attrs).get('href') or '', ''))
+        elif tag == 'iframe':
+            self.iframes.append(dict(attrs).get('src') or '')
+
+        if tag in ETIQUETAS_VACIAS:
+            return
+
+        self._abiertas.append(tag)
+        if tag == 'a':
+            self._anclas_abiertas.append((len(self.anclas) - 1, []))
+        elif tag in ETIQUETAS_SIN_TEXTO:
+            self._sin_texto += 1
+        elif tag in ETIQUETAS_PRESERVAN_ESPACIOS:
+            self._preservar += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <a href="..."/>: enlace sin texto
+        self._terminar_datos()
+        self.handle_starttag(tag, attrs)
+        if tag not in ETIQUETAS_VACIAS:
+            self._cerrar_hasta(len(self._abiertas) - 1)
+
+    def handle_endtag(self, tag):
+        self._terminar_datos()
+        # Una etiqueta de cierre sin apertura se ignora
+        for posicion in range(len(self._abiertas) - 1, -1, -1):
+            if self._abiertas[posicion] == tag:
+                self._cerrar_hasta(posicion)
+                return
+
+    def handle_data(self, data):
+        self._datos.append(data)
+
+    def handle_charref(self, name):
+        self.handle_data(html.unescape(f'&#{name};'))
+
+    def handle_entityref(self, name):
+        self.handle_data(html5.get(name + ';', '&' + name))
+
+    def handle_comment(self, data):
+        self._terminar_datos()
+
+    def handle_decl(self, decl):
+        self._terminar_datos()
+
+    def handle_pi(self, data):
+        self._terminar_datos()
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]> sí cuenta como texto
+        self._terminar_datos()
+        if data.upper().startswith('CDATA['):
+            self.handle_data(data[6:])
+            self._terminar_datos()
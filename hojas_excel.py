@@ -0,0 +1,146 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+FORMATO_MONEDA = '$#,##0.00'
+ANCHO_MAXIMO = 50
+
+BORDE = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+
+
+def anchos_filas(filas):
+    """Ancho de cada columna (texto más largo) para unas pocas filas de valores"""
+    anchos = {}
+    for fila in filas:
+        for c_idx, valor in enumerate(fila, 1):
+            anchos[c_idx] = max(anchos.get(c_idx, 0), len(str(valor or '')))
+    return anchos
+
+
+def anchos_dataframe(df, filas_extra=()):
+    """
+    Ancho de cada columna calculado sobre el DataFrame completo (vectorizado) más las
+    filas adicionales (encabezados, títulos)
+    """
+    anchos = anchos_filas(filas_extra)
+
+    for c_idx in range(1, len(df.columns) + 1):
+        serie = df.iloc[:, c_idx - 1]
+        if len(serie) == 0:
+            continue
+
+        longitudes = serie.astype(str).str.len()
+        # Igual que str(valor or ''): None, 0 y '' no ocupan espacio
+        vacios = (serie == 0) | (serie == '')
+        if serie.dtype.kind == 'O':  # texto o categorías
+            vacios |= serie.isna()
+        longitud = int(longitudes.mask(vacios, 0).max())
+
+        anchos[c_idx] = max(anchos.get(c_idx, 0), longitud)
+
+    return anchos
+
+
+class EscritorExcel:
+    """
+    Libro de Excel en modo de solo escritura: las filas se envían a disco conforme se escriben
+    y los estilos se comparten por columna en lugar de asignarse celda por celda
+    """
+
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+
+    def crear_hoja(self, titulo, anchos):
+        """Crea una hoja con los anchos de columna ya fijados (deben ir antes de las filas)"""
+        ws = self.wb.create_sheet(titulo)
+        for c_idx, ancho in anchos.items():
+            ws.column_dimensions[get_column_letter(c_idx)].width = min(ancho + 2, ANCHO_MAXIMO)
+        return ws
+
+    @staticmethod
+    def celda(ws, fill=None, font=None, alignment=None, border=None, number_format=None):
+        """Celda con estilo que se reutiliza fila tras fila (solo cambia su valor)"""
+        celda = WriteOnlyCell(ws)
+        if fill is not None:
+            celda.fill = fill
+        if font is not None:
+            celda.font = font
+        if alignment is not None:
+            celda.alignment = alignment
+        if border is not None:
+            celda.border = border
+        if number_format is not None:
+            celda.number_format = number_format
+        return celda
+
+    @staticmethod
+    def fila(celdas, valores):
+        """Asigna los valores a las celdas con estilo de la fila; None deja el valor sin estilo"""
+        fila = []
+        for celda, valor in zip(celdas, valores):
+            if celda is None:
+                fila.append(valor)
+            else:
+                celda.value = valor
+                fila.append(celda)
+        return fila
+
+    def titulo(self, ws, texto, rango, font):
+        """Título combinado y centrado en la primera fila de la hoja"""
+        ws.merged_cells.add(rango)
+        celda = self.celda(ws, font=font, alignment=Alignment(horizontal='center'))
+        celda.value = texto
+        ws.append([celda])
+
+    def hoja_dataframe(self, titulo, df, header_fill, header_font, columnas_moneda=(),
+                       header_alignment=None, titulo_hoja=None, resaltar=None):
+        """
+        Escribe un DataFrame como tabla con encabezado, bordes y formato de moneda
+        titulo_hoja: (texto, rango combinado, font) escrito arriba de la tabla, con una fila en blanco
+        resaltar: (columna, umbral, fill) para las celdas de moneda mayores al umbral
+        """
+        encabezados = list(df.columns)
+        filas_extra = [encabezados]
+        if titulo_hoja:
+            filas_extra.append([titulo_hoja[0]])
+
+        ws = self.crear_hoja(titulo, anchos_dataframe(df, filas_extra))
+
+        if titulo_hoja:
+            self.titulo(ws, *titulo_hoja)
+            ws.append([])
+
+        celdas_encabezado = [
+            self.celda(ws, fill=header_fill, font=header_font, alignment=header_alignment, border=BORDE)
+            for _ in encabezados
+        ]
+        ws.append(self.fila(celdas_encabezado, encabezados))
+
+        celdas = [
+            self.celda(ws, border=BORDE, number_format=FORMATO_MONEDA if c_idx in columnas_moneda else None)
+            for c_idx in range(1, len(encabezados) + 1)
+        ]
+
+        celda_resaltada = None
+        if resaltar:
+            columna_resaltar, umbral, fill = resaltar
+            celda_resaltada = self.celda(ws, fill=fill, border=BORDE, number_format=FORMATO_MONEDA)
+
+        for valores in df.itertuples(index=False, name=None):
+            fila = self.fila(celdas, valores)
+            if celda_resaltada is not None and float(valores[columna_resaltar - 1]) > umbral:
+                celda_resaltada.value = valores[columna_resaltar - 1]
+                fila[columna_resaltar - 1] = celda_resaltada
+            ws.append(fila)
+
+        return ws
+
+    def guardar(self, archivo_salida):
+        """Guarda el libro"""
+        self.wb.save(archivo_salida)
@@ -0,0 +1,199 @@
+import json
+import os
+import bisect
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+
+class IndiceCFDI:
+    """
+    Índice persistente de los XMLs CFDI de una carpeta
+    Se construye una sola vez y solo vuelve a leer los archivos cuyo mtime/tamaño cambió
+    """
+
+    NOMBRE_ARCHIVO = '.indice_cfdi.json'
+    VERSION = 1
+
+    def __init__(self, carpeta_cfdi, ruta_indice=None):
+        self.carpeta_cfdi = Path(carpeta_cfdi)
+        self.ruta_indice = Path(ruta_indice) if ruta_indice else self.carpeta_cfdi / self.NOMBRE_ARCHIVO
+
+        self.namespaces = {
+            'cfdi': 'http://www.sat.gob.mx/cfd/4',
+            'cfdi3': 'http://www.sat.gob.mx/cfd/3',
+            'tfd': 'http://www.sat.gob.mx/TimbreFiscalDigital'
+        }
+
+        # nombre de archivo -> datos indexados
+        self.entradas = {}
+
+        # Tablas de búsqueda
+        self.totales_ordenados = []  # [(total_centavos, nombre)] ordenado
+        self.por_fecha = {}  # 'YYYY-MM-DD' -> [nombre]
+
+        self.cargar()
+        self.actualizar()
+
+    def cargar(self):
+        """
+        Carga el índice guardado en disco (si existe y es compatible)
+        """
+        if not self.ruta_indice.exists():
+            return
+
+        try:
+            with open(self.ruta_indice, 'r', encoding='utf-8') as f:
+                contenido = json.load(f)
+
+            if contenido.get('version') == self.VERSION:
+                self.entradas = contenido.get('archivos', {})
+        except Exception as e:
+            print(f"   ⚠️ Índice de XMLs inválido, se reconstruirá: {str(e)[:50]}")
+            self.entradas = {}
+
+    def guardar(self):
+        """
+        Guarda el índice en disco
+        """
+        try:
+            temporal = self.ruta_indice.with_suffix('.tmp')
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'archivos': self.entradas}, f, ensure_ascii=False)
+            os.replace(temporal, self.ruta_indice)
+        except OSError as e:
+            print(f"   ⚠️ No se pudo guardar el índice de XMLs: {str(e)[:50]}")
+
+    def leer_xml(self, archivo):
+        """
+        Extrae solo los campos necesarios para buscar coincidencias
+        """
+        root = ET.parse(archivo).getroot()
+
+        ns = self.namespaces.copy()
+        if root.get('Version', '4.0').startswith('3'):
+            ns['cfdi'] = ns['cfdi3']
+
+        datos = {
+            'total': float(root.get('Total', '0')),
+            'fecha': root.get('Fecha', ''),
+            'emisor': '',
+            'rfc': '',
+            'uuid': ''
+        }
+
+        emisor = root.find('.//cfdi:Emisor', ns)
+        if emisor is not None:
+            datos['emisor'] = emisor.get('Nombre', '')
+            datos['rfc'] = emisor.get('Rfc', '')
+
+        timbre = root.find('.//tfd:TimbreFiscalDigital', ns)
+        if timbre is not None:
+            datos['uuid'] = timbre.get('UUID', '')
+
+        return datos
+
+    def actualizar(self):
+        """
+        Sincroniza el índice con la carpeta: solo parsea archivos nuevos o modificados
+        """
+        vistos = set()
+        nuevos = 0
+
+        for archivo in sorted(self.carpeta_cfdi.glob("*.xml")):
+            try:
+                stat = archivo.stat()
+            except OSError:
+                continue
+
+            vistos.add(archivo.name)
+            entrada = self.entradas.get(archivo.name)
+
+            if entrada and entrada['mtime'] == stat.st_mtime and entrada['tamano'] == stat.st_size:
+                continue
+
+            entrada = {'mtime': stat.st_mtime, 'tamano': stat.st_size}
+            try:
+                entrada.update(self.leer_xml(archivo))
+            except Exception as e:
+                print(f"      ❌ Error leyendo {archivo.name}: {str(e)[:50]}")
+                entrada['error'] = True
+
+            self.entradas[archivo.name] = entrada
+            nuevos += 1
+
+        eliminados = [nombre for nombre in self.entradas if nombre not in vistos]
+        for nombre in eliminados:
+            del self.entradas[nombre]
+
+        if nuevos or eliminados:
+            print(f"   📇 Índice de XMLs actualizado: {nuevos} leídos, {len(eliminados)} eliminados, "
+                  f"{len(self.entradas)} en total")
+            self.guardar()
+
+        self.construir_tablas()
+
+    def construir_tablas(self):
+        """
+        Construye las tablas de búsqueda por total y por fecha
+        """
+        self.totales_ordenados = []
+        self.por_fecha = {}
+
+        for nombre in sorted(self.entradas):
+            entrada = self.entradas[nombre]
+            if entrada.get('error'):
+                continue
+
+            self.totales_ordenados.append((round(entrada['total'] * 100), nombre))
+
+            fecha = entrada['fecha'][:10]
+            if fecha:
+                self.por_fecha.setdefault(fecha, []).append(nombre)
+
+        self.totales_ordenados.sort()
+
+    def buscar(self, comercio, fecha_factura, total, tolerancia=0.10):
+        """
+        Busca el mejor XML: primero por total (con tolerancia), luego por fecha y nombre similar
+        """
+        candidatos = []
+        con_total = set()
+
+        # Coincidencias por total: búsqueda binaria sobre los totales ordenados
+        minimo = round((total - tolerancia) * 100)
+        maximo = round((total + tolerancia) * 100)
+        inicio = bisect.bisect_left(self.totales_ordenados, (minimo, ''))
+
+        for centavos, nombre in self.totales_ordenados[inicio:]:
+            if centavos > maximo:
+                break
+
+            entrada = self.entradas[nombre]
+            if abs(entrada['total'] - total) < tolerancia:
+                con_total.add(nombre)
+                candidatos.append((nombre, True))
+                print(f"      ✅ Coincidencia por total encontrada: {nombre}")
+
+        # Coincidencias por fecha y nombre del emisor
+        if fecha_factura:
+            try:
+                clave_fecha = fecha_factura.date().isoformat()
+            except Exception:
+                clave_fecha = None
+
+            comercio_upper = str(comercio).upper()
+            for nombre in self.por_fecha.get(clave_fecha, []):
+                if nombre in con_total:
+                    continue
+
+                emisor_upper = self.entradas[nombre]['emisor'].upper()
+                if comercio_upper in emisor_upper or emisor_upper in comercio_upper:
+                    candidatos.append((nombre, False))
+                    print(f"      ⚠️ Posible coincidencia por fecha/nombre: {nombre}")
+
+        if not candidatos:
+            return None
+
+        # Priorizar coincidencias por total
+        candidatos.sort(key=lambda x: (x[1], -self.entradas[x[0]]['total']), reverse=True)
+        return self.carpeta_cfdi / candidatos[0][0]
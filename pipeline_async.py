@@ -0,0 +1,505 @@
+import asyncio
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# aiohttp (opcional) permite tener cientos de descargas en curso sin un hilo por cada una
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from cliente_http import (ESTADOS_REINTENTABLES, ESTADOS_SIN_RECURSO, MAX_BYTES_PDF, MAX_BYTES_PDF_EN_MEMORIA,
+                          SONDEOS_SIMULTANEOS, TAMANO_BLOQUE, RecepcionPDF, borrar_pdf_temporal, tamano_pdf)
+from pool_pdf import es_xml_cfdi
+
+# Facturas en curso a la vez: descargas simultáneas y tamaño de las colas entre etapas
+CONCURRENCIA_PIPELINE = 100
+
+
+class ClienteHTTPAsync:
+    """
+    Versión asíncrona (aiohttp) de ClienteHTTP: mismos reintentos, backoff y límite por servidor,
+    tomados del cliente síncrono; se usa como `async with ClienteHTTPAsync(cliente) as http:`
+    """
+
+    def __init__(self, cliente, concurrencia=CONCURRENCIA_PIPELINE):
+        self.cliente = cliente
+        self.concurrencia = max(1, concurrencia)
+        self.session = None
+
+    @staticmethod
+    def sin_accept_encoding(headers):
+        """
+        Encabezados sin Accept-Encoding: aiohttp negocia la compresión que sabe descomprimir
+        (br solo si Brotli está instalado; pedirlo sin él deja la respuesta ilegible)
+        """
+        return {k: v for k, v in (headers or {}).items() if k.lower() != 'accept-encoding'}
+
+    async def __aenter__(self):
+        headers = self.sin_accept_encoding(self.cliente.session.headers)
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrencia),
+                                             headers=headers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def get(self, url, headers=None, timeout=20):
+        """
+        GET con los mismos reintentos que ClienteHTTP.get (408, 429, 5xx, timeouts y errores de
+        conexión); timeout aplica a la conexión y a cada lectura, igual que en requests
+        Devuelve la última respuesta, sin leer el cuerpo (se usa con `async with`)
+        """
+        limites = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+        headers = self.sin_accept_encoding(headers)
+
+        for intento in range(self.cliente.reintentos + 1):
+            espera = self.cliente.limitador.reservar(url)
+            if espera > 0:
+                await asyncio.sleep(espera)
+
+            try:
+                response = await self.session.get(url, headers=headers, timeout=limites)
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                if intento == self.cliente.reintentos:
+                    raise
+                tipo = "Tiempo agotado" if isinstance(e, asyncio.TimeoutError) else "Error de conexión"
+                espera = self.cliente.espera(intento)
+                print(f"   🔁 {tipo}, reintento {intento + 1} en {espera:.1f} s: {url[:60]}")
+                await asyncio.sleep(espera)
+                continue
+
+            if response.status not in ESTADOS_REINTENTABLES or intento == self.cliente.reintentos:
+                return response
+
+            espera = self.cliente.espera(intento, response.headers.get('Retry-After'))
+            response.release()
+            print(f"   🔁 HTTP {response.status}, reintento {intento + 1} en {espera:.1f} s: {url[:60]}")
+            await asyncio.sleep(espera)
+
+    async def get_con_cache(self, url, cache, headers=None, timeout=20):
+        """
+        Igual que ClienteHTTP.get_con_cache: revalida con ETag / Last-Modified lo que ya está en la caché
+        Devuelve (status_code, content_type, contenido)
+        """
+        headers = dict(headers or {})
+        if cache:
+            headers.update(cache.validadores(url))
+
+        async with await self.get(url, headers=headers, timeout=timeout) as response:
+            if response.status == 304 and cache:
+                en_cache = cache.renovar(url)
+                if en_cache:
+                    return 200, en_cache[1], en_cache[0]
+
+                # La entrada desapareció entre la consulta y la respuesta: descarga completa
+                sin_validadores = {k: v for k, v in headers.items() if not k.startswith('If-')}
+                return await self.get_con_cache(url, None, sin_validadores, timeout)
+
+            content_type = response.headers.get('content-type', '')
+            contenido = await response.read()
+
+        if response.status == 200 and cache:
+            cache.guardar(url, contenido, content_type,
+                          response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        return response.status, content_type, contenido
+
+    async def sondear_pdf(self, url, headers=None, timeout=10):
+        """
+        True si la URL responde con un PDF, pidiendo solo el primer KB (Range: bytes=0-1023)
+        Igual que ClienteHTTP._sondear: False solo si la respuesta es definitiva (404, 410 o algo que
+        no es PDF) y None si no la hubo (timeouts, errores de conexión, 5xx)
+        """
+        headers = dict(headers or {})
+        headers['Range'] = 'bytes=0-1023'
+
+        try:
+            async with await self.get(url, headers=headers, timeout=timeout) as response:
+                if response.status not in (200, 206):
+                    return False if response.status in ESTADOS_SIN_RECURSO else None
+
+                inicio = b''
+                async for bloque in response.content.iter_chunked(1024):
+                    inicio += bloque
+                    if len(inicio) >= 1024:
+                        break
+
+                return b'%PDF' in inicio[:1024]
+
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            return None
+
+    async def resolver_pdfs(self, urls, headers=None, timeout=10, simultaneos=SONDEOS_SIMULTANEOS):
+        """
+        Igual que ClienteHTTP.resolver_pdfs: sondea por lotes hasta que un lote tenga algún PDF
+        Devuelve (confirmadas, descartadas)
+        """
+        descartadas = []
+
+        for inicio in range(0, len(urls), simultaneos):
+            lote = urls[inicio:inicio + simultaneos]
+            resultados = await asyncio.gather(*(self.sondear_pdf(url, headers, timeout) for url in lote))
+
+            confirmadas = [url for url, es_pdf in zip(lote, resultados) if es_pdf]
+            descartadas.extend(url for url, es_pdf in zip(lote, resultados) if es_pdf is False)
+
+            if confirmadas:
+                return confirmadas, descartadas
+
+        return [], descartadas
+
+    async def descargar_pdf(self, url, headers=None, timeout=30, max_bytes=MAX_BYTES_PDF,
+                            max_bytes_memoria=MAX_BYTES_PDF_EN_MEMORIA, cache=None):
+        """
+        Igual que ClienteHTTP.descargar_pdf: lectura por bloques, rechazo temprano de lo que no es
+        PDF, tamaño máximo, archivo temporal para los grandes y revalidación con la caché
+        Devuelve (status_code, content_type, pdf)
+        """
+        headers = dict(headers or {})
+        if cache:
+            headers.update(cache.validadores(url))
+
+        async with await self.get(url, headers=headers, timeout=timeout) as response:
+            content_type = response.headers.get('content-type', '')
+
+            if response.status == 304 and cache:
+                en_cache = cache.renovar(url)
+                if en_cache and b'%PDF' in en_cache[0][:1024]:
+                    print(f"   💾 PDF revalidado (304): {url[:60]}")
+                    return 200, en_cache[1], en_cache[0]
+                sin_validadores = {k: v for k, v in headers.items() if not k.startswith('If-')}
+                return await self.descargar_pdf(url, sin_validadores, timeout, max_bytes, max_bytes_memoria)
+
+            if response.status != 200:
+                return response.status, content_type, None
+
+            recepcion = RecepcionPDF(max_bytes, max_bytes_memoria, content_type)
+            if not recepcion.longitud_aceptada(response.headers.get('Content-Length', '')):
+                return response.status, content_type, None
+
+            pdf = None
+            try:
+                async for bloque in response.content.iter_chunked(TAMANO_BLOQUE):
+                    if not recepcion.agregar(bloque):
+                        break
+                else:
+                    pdf = recepcion.terminar()
+            finally:
+                # Un PDF incompleto (rechazado o con error de lectura) no deja archivo temporal
+                if pdf is None:
+                    recepcion.descartar()
+
+            if pdf is None:
+                return response.status, content_type, None
+
+        if cache:
+            # Un PDF grande se copia desde el archivo temporal: fuera del event loop
+            await asyncio.to_thread(cache.guardar, url, pdf, content_type,
+                                    response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        return response.status, content_type, pdf
+
+
+class FacturaEnCurso:
+    """Una factura avanzando por las etapas del pipeline"""
+
+    __slots__ = ('clave', 'url', 'comercio', 'fecha', 'total', 'contenido_html', 'enlaces_pdf',
+                 'enlaces_xml', 'texto_html', 'pdf', 'resultado', 'error')
+
+    def __init__(self, clave, url, comercio=None, fecha=None, total=None):
+        self.clave = clave
+        self.url = url
+        self.comercio = comercio
+        self.fecha = fecha
+        self.total = total
+
+        self.contenido_html = None
+        self.enlaces_pdf = []
+        self.enlaces_xml = []
+        self.texto_html = ''
+        self.pdf = None
+        self.resultado = None
+        self.error = None
+
+
+class PipelineFacturas:
+    """
+    Versión asíncrona de ExtractorFacturasRindeGastosV7.extraer_datos_factura, como pipeline por etapas:
+    página -> enlaces -> descarga del XML/PDF -> lectura -> resultado
+    - Las descargas son corrutinas (aiohttp): hay hasta `concurrencia` facturas en curso
+    - El análisis del HTML y la lectura de los PDFs corren en un executor, con tantos hilos como
+      max_workers del extractor (los PDFs además pasan por su pool de procesos)
+    - Entre cada etapa hay una cola acotada: una etapa lenta frena a la anterior en lugar de
+      acumular páginas y PDFs en memoria
+    Usa la caché, plantillas, límites por servidor y lectura de PDFs del extractor
+    """
+
+    def __init__(self, extractor, concurrencia=CONCURRENCIA_PIPELINE):
+        if aiohttp is None:
+            raise ImportError("El pipeline asíncrono requiere aiohttp (pip install aiohttp)")
+
+        self.extractor = extractor
+        self.concurrencia = max(1, concurrencia)
+        self.http = None
+        self.executor = None
+
+    async def ejecutar(self, tareas, escribir, detener=None):
+        """
+        Procesa las tareas (clave, (url, comercio, fecha, total)) y llama a escribir(clave, resultado, error)
+        conforme termina cada factura (en cualquier orden; escribir corre fuera del event loop)
+        detener: threading.Event opcional; al activarse ya no se inician facturas nuevas
+        """
+        hilos = max(1, self.extractor.max_workers)
+        # (etapa, trabajadores, solo facturas pendientes): una factura resuelta o con error
+        # solo pasa por la lectura (XML local / último recurso)
+        etapas = [
+            (self.descargar_pagina, self.concurrencia, True),
+            (self.buscar_enlaces, hilos, True),
+            (self.descargar_documento, self.concurrencia, True),
+            (self.leer_documento, hilos, False),
+        ]
+        colas = [asyncio.Queue(maxsize=self.concurrencia) for _ in range(len(etapas) + 1)]
+
+        self.executor = ThreadPoolExecutor(max_workers=hilos)
+        try:
+            async with ClienteHTTPAsync(self.extractor.cliente, self.concurrencia) as self.http:
+                trabajadores = [
+                    asyncio.create_task(self._trabajador(etapa, colas[i], colas[i + 1], solo_pendientes))
+                    for i, (etapa, cantidad, solo_pendientes) in enumerate(etapas)
+                    for _ in range(cantidad)
+                ]
+                trabajadores.append(asyncio.create_task(self._escritor(colas[-1], escribir)))
+
+                try:
+                    for clave, argumentos in tareas:
+                        if detener is not None and detener.is_set():
+                            break
+                        await colas[0].put(FacturaEnCurso(clave, *argumentos))
+
+                    # Cada etapa termina de pasar lo suyo a la siguiente antes de revisar esa
+                    for cola in colas:
+                        await cola.join()
+                finally:
+                    for trabajador in trabajadores:
+                        trabajador.cancel()
+                    await asyncio.gather(*trabajadores, return_exceptions=True)
+        finally:
+            self.executor.shutdown()
+
+    async def _trabajador(self, etapa, entrada, salida, solo_pendientes):
+        """Toma facturas de la cola de entrada, aplica la etapa y las pasa a la siguiente cola"""
+        while True:
+            factura = await entrada.get()
+            try:
+                if not solo_pendientes or (factura.resultado is None and factura.error is None):
+                    try:
+                        await etapa(factura)
+                    except Exception as e:
+                        factura.error = e
+                await salida.put(factura)
+            finally:
+                entrada.task_done()
+
+    async def _escritor(self, entrada, escribir):
+        while True:
+            factura = await entrada.get()
+            try:
+                error = factura.error if factura.resultado is None else None
+                await asyncio.get_running_loop().run_in_executor(None, escribir, factura.clave,
+                                                                 factura.resultado, error)
+            finally:
+                entrada.task_done()
+
+    async def en_executor(self, funcion, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, funcion, *args)
+
+    async def descargar_pagina(self, factura):
+        """Etapa 1: página del comprobante (primero desde la caché local)"""
+        extractor = self.extractor
+        print(f"🔍 Accediendo a: {factura.url}")
+
+        en_cache = extractor.cache.obtener(factura.url) if extractor.cache else None
+        if en_cache:
+            factura.contenido_html = en_cache[0]
+            print("   💾 Página desde caché")
+            return
+
+        status_code, _, factura.contenido_html = await self.http.get_con_cache(
+            factura.url, extractor.cache, extractor.headers, 20)
+        if status_code != 200:
+            raise aiohttp.ClientError(f"{status_code} Error al obtener la página: {factura.url}")
+
+    async def buscar_enlaces(self, factura):
+        """Etapa 2: enlaces a XMLs y PDFs (el HTML se analiza en el executor)"""
+        factura.enlaces_pdf, factura.enlaces_xml, factura.texto_html = await self.en_executor(
+            self.extractor.analizar_pagina, factura.contenido_html, factura.url)
+        factura.contenido_html = None
+
+    async def descargar_documento(self, factura):
+        """
+        Etapa 3: un XML enlazado con folio resuelve la factura; si no, se descarga el primer
+        candidato confirmado como PDF (sin PDF, la lectura extrae del texto de la página)
+        """
+        extractor = self.extractor
+
+        for enlace in factura.enlaces_xml:
+            xml_content = await self.descargar_xml(enlace, factura.url)
+
+            if xml_content:
+                resultado_xml = await self.en_executor(extractor.procesar_xml_cfdi, io.BytesIO(xml_content))
+                if extractor.xml_con_folio(resultado_xml):
+                    factura.resultado = resultado_xml
+                    return
+
+        for enlace in await self.enlaces_pdf_confirmados(factura.enlaces_pdf, factura.url):
+            factura.pdf = await self.descargar_pdf(enlace, factura.url)
+            if factura.pdf:
+                return
+
+    async def leer_documento(self, factura):
+        """Etapa 4: lectura del PDF (o del texto de la página) y XML local como respaldo, en el executor"""
+        try:
+            factura.resultado = await self.en_executor(self.leer_factura, factura)
+        finally:
+            borrar_pdf_temporal(factura.pdf)
+            factura.pdf = None
+
+    def leer_factura(self, factura):
+        """Parte síncrona de la lectura (corre en un hilo del executor)"""
+        extractor = self.extractor
+
+        if factura.error is not None:
+            return extractor.resultado_por_error(factura.error, factura.comercio, factura.fecha, factura.total)
+
+        resultado = factura.resultado
+        if resultado is None and factura.pdf:
+            resultado = extractor.procesar_pdf_mejorado(factura.pdf)
+        elif resultado is None:
+            print("   ⚠️ No se pudo procesar PDF, extrayendo del HTML...")
+            resultado = extractor.procesar_texto_factura_mejorado(factura.texto_html)
+
+        return extractor.completar_con_xml_local(resultado, factura.comercio, factura.fecha, factura.total)
+
+    async def enlaces_pdf_confirmados(self, enlaces_pdf, referer):
+        """Igual que en el extractor: primero los vigentes en la caché; el resto se sondea"""
+        extractor = self.extractor
+
+        vigentes = []
+        pendientes = []
+        for enlace in enlaces_pdf:
+            if extractor.cache and extractor.cache.vigente(enlace):
+                vigentes.append(enlace)
+            else:
+                pendientes.append(enlace)
+
+        if not pendientes:
+            return vigentes
+
+        print(f"   🔎 Sondeando {len(pendientes)} candidato(s) de descarga...")
+        confirmadas, descartadas = await self.http.resolver_pdfs(pendientes, headers=extractor.headers_pdf(referer))
+
+        extractor.plantillas.registrar_sondeo(confirmadas, descartadas)
+        if not confirmadas:
+            print(f"   ⚠️ Ningún candidato respondió con un PDF")
+
+        return vigentes + confirmadas
+
+    async def descargar_pdf(self, url_pdf, referer):
+        """Igual que ExtractorFacturasRindeGastosV7.descargar_pdf, con la descarga asíncrona"""
+        extractor = self.extractor
+
+        if extractor.cache and extractor.cache.vigente(url_pdf):
+            # Desde la caché local: sin red, la lectura del archivo va al executor
+            return await self.en_executor(extractor.descargar_pdf, url_pdf, referer)
+
+        try:
+            print(f"   📥 Descargando: {url_pdf[:80]}...")
+            status_code, content_type, pdf = await self.http.descargar_pdf(
+                url_pdf, headers=extractor.headers_pdf(referer), timeout=30, cache=extractor.cache)
+            extractor.plantillas.registrar_descarga(url_pdf, status_code, pdf)
+
+            if pdf is not None:
+                print(f"   ✅ PDF descargado: {tamano_pdf(pdf):,} bytes")
+                return pdf
+            elif status_code != 200:
+                print(f"   ❌ Error HTTP: {status_code}")
+
+        except Exception as e:
+            print(f"   ❌ Error descarga: {str(e)[:50]}")
+
+        return None
+
+    async def descargar_xml(self, url_xml, referer):
+        """Igual que ExtractorFacturasRindeGastosV7.descargar_xml, con la descarga asíncrona"""
+        extractor = self.extractor
+        en_cache = extractor.cache.obtener(url_xml) if extractor.cache else None
+
+        try:
+            if en_cache:
+                content = en_cache[0]
+                print(f"   💾 XML desde caché: {len(content):,} bytes")
+            else:
+                print(f"   📥 Descargando XML: {url_xml[:80]}...")
+
+                xml_headers = extractor.headers.copy()
+                xml_headers.update({
+                    'Accept': 'application/xml,text/xml,*/*',
+                    'Referer': referer
+                })
+
+                status_code, _, content = await self.http.get_con_cache(url_xml, extractor.cache, xml_headers, 30)
+
+                if status_code != 200:
+                    print(f"   ❌ Error HTTP: {status_code}")
+                    return None
+
+        except Exception as e:
+            print(f"   ❌ Error descarga: {str(e)[:50]}")
+            return None
+
+        if not es_xml_cfdi(content):
+            print(f"   ⚠️ No es un XML de CFDI")
+            return None
+
+        print(f"   ✅ XML de CFDI descargado")
+        return content
+
+
+def procesar_en_pipeline(extractor, tareas, concurrencia=CONCURRENCIA_PIPELINE):
+    """
+    Envoltura síncrona del pipeline, con la misma forma que procesar_en_paralelo: devuelve
+    (clave, resultado, error) conforme terminan las facturas
+    El pipeline corre en un hilo con su propio event loop; la cola de salida también es acotada
+    """
+    pipeline = PipelineFacturas(extractor, concurrencia)
+    salida = queue.Queue(maxsize=pipeline.concurrencia)
+    detener = threading.Event()
+    fin = object()
+
+    def correr():
+        try:
+            asyncio.run(pipeline.ejecutar(tareas, lambda *elemento: salida.put(elemento), detener))
+        except BaseException as e:
+            salida.put(e)
+        finally:
+            salida.put(fin)
+
+    hilo = threading.Thread(target=correr, name='pipeline-facturas', daemon=True)
+    hilo.start()
+
+    try:
+        while (elemento := salida.get()) is not fin:
+            if isinstance(elemento, BaseException):
+                raise elemento
+            yield elemento
+    finally:
+        # Si quien consume se detiene, ya no se inician facturas y se vacía la cola para que terminen las que van
+        detener.set()
+        while hilo.is_alive():
+            try:
+                salida.get(timeout=0.1)
+            except queue.Empty:
+                pass
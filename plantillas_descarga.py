@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from cliente_http import ESTADOS_SIN_RECURSO
+
+# Plantillas de URLs de descarga especulativas para un comprobante de RindeGastos
+PLANTILLAS_DESCARGA = {
+    'receipt_download': '{url}&download=1',
+    'receipt_format_pdf': '{url}&format=pdf',
+    'receipt_tipo_pdf': '{url}&tipo=pdf',
+    'www_document_download': 'https://www.rindegastos.com/document/download/{receipt_id}?key={key}',
+    'web_document_download': 'https://web.rindegastos.com/document/download/{receipt_id}?key={key}',
+    'web_document_download_sin_key': 'https://web.rindegastos.com/document/download/{receipt_id}',
+    'web_download': 'https://web.rindegastos.com/download/{receipt_id}?key={key}',
+    'web_receipt_download': 'https://web.rindegastos.com/document/receipt?i={receipt_id}&key={key}&download=1',
+    'ruta_download': '{url_download}',
+}
+
+# URLs generadas que se recuerdan para saber de qué plantilla vienen (las más antiguas se olvidan)
+MAX_URLS_RECORDADAS = 10000
+
+
+class EstadisticasPlantillas:
+    """
+    Aprende qué plantillas de URL de descarga funcionan, durante la corrida y entre corridas
+    Las plantillas exitosas se prueban primero y las que fallan quedan al final, sin omitirse nunca
+    Solo cuentan como fallo las respuestas definitivas (404, 410 o algo que no es PDF): los
+    timeouts, errores de conexión y 5xx no dicen nada de la plantilla
+    Al pasar de `ventana` resultados los conteos se reducen a la mitad, así el historial viejo
+    pierde peso y una plantilla que empieza a funcionar vuelve a subir
+    """
+
+    def __init__(self, ruta='.cache_rindegastos/plantillas_descarga.json', ventana=50):
+        self.ruta = Path(ruta)
+        self.ventana = ventana
+
+        self.estadisticas = {}  # plantilla -> {'exitos': n, 'fallos': n}
+        self.plantilla_por_url = {}
+        self._pendientes = 0
+        self._lock = threading.Lock()
+
+        if self.ruta.exists():
+            try:
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    self.estadisticas = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Estadísticas de plantillas inválidas, se reinician: {str(e)[:50]}")
+
+    def construir(self, nombres, url, receipt_id, key):
+        """
+        Genera las URLs de las plantillas indicadas, ordenadas por tasa de éxito
+        """
+        valores = {
+            'url': url,
+            'receipt_id': receipt_id,
+            'key': key,
+            'url_download': url.replace('/receipt', '/download'),
+        }
+
+        candidatos = [(nombre, PLANTILLAS_DESCARGA[nombre].format(**valores)) for nombre in nombres]
+
+        with self._lock:
+            for nombre, url_candidata in candidatos:
+                self.plantilla_por_url[url_candidata] = nombre
+            while len(self.plantilla_por_url) > MAX_URLS_RECORDADAS:
+                del self.plantilla_por_url[next(iter(self.plantilla_por_url))]
+
+        # Estimador de Laplace: las plantillas sin historial quedan a mitad de la lista
+        candidatos.sort(key=lambda c: -self.puntuacion(c[0]))
+        return [url_candidata for _, url_candidata in candidatos]
+
+    def conteo(self, nombre):
+        """Devuelve (éxitos, fallos) de una plantilla"""
+        datos = self.estadisticas.get(nombre, {})
+        return datos.get('exitos', 0), datos.get('fallos', 0)
+
+    def puntuacion(self, nombre):
+        """Probabilidad estimada de que la plantilla devuelva un PDF"""
+        exitos, fallos = self.conteo(nombre)
+        return (exitos + 1) / (exitos + fallos + 2)
+
+    def registrar(self, url_candidata, exito):
+        """
+        Registra el resultado de una URL; se ignoran las que no provienen de una plantilla
+        """
+        nombre = self.plantilla_por_url.get(url_candidata)
+        if nombre is None:
+            return
+
+        with self._lock:
+            datos = self.estadisticas.setdefault(nombre, {'exitos': 0, 'fallos': 0})
+            datos['exitos' if exito else 'fallos'] += 1
+            if datos['exitos'] + datos['fallos'] > self.ventana:
+                datos['exitos'] = (datos['exitos'] + 1) // 2
+                datos['fallos'] = (datos['fallos'] + 1) // 2
+            self._pendientes += 1
+            guardar = self._pendientes >= 20
+
+        if guardar:
+            self.guardar()
+
+    def registrar_descarga(self, url_candidata, status_code, pdf):
+        """
+        Registra el resultado de una descarga: éxito si trajo un PDF, fallo si la respuesta fue
+        definitiva (404, 410 o un 200 que no es PDF); cualquier otra respuesta no se cuenta
+        """
+        if pdf is not None:
+            self.registrar(url_candidata, True)
+        elif status_code == 200 or status_code in ESTADOS_SIN_RECURSO:
+            self.registrar(url_candidata, False)
+
+    def registrar_sondeo(self, confirmadas, descartadas):
+        """
+        Registra como fallos las plantillas descartadas por el sondeo (resolver_pdfs), salvo que
+        el PDF lo haya dado un enlace que no viene de una plantilla: entonces no hacían falta
+        y su resultado no se compara con nada
+        """
+        if any(url not in self.plantilla_por_url for url in confirmadas):
+            return
+        for url_candidata in descartadas:
+            self.registrar(url_candidata, False)
+
+    def guardar(self):
+        """Guarda las estadísticas en disco"""
+        with self._lock:
+            self._pendientes = 0
+            try:
+                self.ruta.parent.mkdir(parents=True, exist_ok=True)
+                temporal = self.ruta.with_suffix('.tmp')
+                with open(temporal, 'w', encoding='utf-8') as f:
+                    json.dump(self.estadisticas, f, indent=2)
+                os.replace(temporal, self.ruta)
+            except OSError as e:
+                print(f"⚠️ No se pudieron guardar las estadísticas de plantillas: {str(e)[:50]}")
+
+    def resumen(self):
+        """Texto con la tasa de éxito de cada plantilla"""
+        lineas = []
+        for nombre in sorted(self.estadisticas, key=lambda n: -self.puntuacion(n)):
+            exitos, fallos = self.conteo(nombre)
+            lineas.append(f"   - {nombre}: {exitos} éxitos / {fallos} fallos")
+        return "\n".join(lineas)
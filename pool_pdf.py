@@ -0,0 +1,303 @@
+import io
+import multiprocessing
+import threading
+import time
+
+
+# Páginas que se leen como máximo por PDF (los escaneados pueden traer decenas de páginas)
+MAX_PAGINAS_PDF = 5
+
+
+def abrir_pdf(pdf_content):
+    """
+    Origen para pdfplumber/PyPDF2: los bytes se leen desde memoria y una ruta (PDF grande
+    descargado a un archivo temporal) se abre directamente, sin copiarla entre procesos
+    """
+    if isinstance(pdf_content, (bytes, bytearray)):
+        return io.BytesIO(pdf_content)
+    return str(pdf_content)
+
+
+def iterar_paginas_pdf(pdf_content, desde=0, max_paginas=None):
+    """
+    Texto y tablas de cada página con pdfplumber, una página a la vez: (texto, tablas)
+    Cada página se lee solo cuando se pide, así quien itera puede detenerse en cuanto
+    encuentra lo que busca; max_paginas limita hasta qué página se lee
+    """
+    import pdfplumber
+
+    with pdfplumber.open(abrir_pdf(pdf_content)) as pdf:
+        for page in pdf.pages[desde:max_paginas]:
+            yield page.extract_text(), page.extract_tables()
+            page.close()  # libera los objetos de la página ya leída
+
+
+def extraer_paginas_pdf(pdf_content, desde, hasta):
+    """
+    Texto y tablas de las páginas desde..hasta-1 con una sola apertura del PDF: [(texto, tablas), ...]
+    Devuelve menos páginas si el PDF termina antes. Corre dentro de los procesos del pool
+    """
+    return list(iterar_paginas_pdf(pdf_content, desde, hasta))
+
+
+def extraer_texto_pypdf2(pdf_content, max_paginas=None):
+    """Texto completo con PyPDF2 (alternativa cuando pdfplumber falla)"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(abrir_pdf(pdf_content))
+    texto_completo = ""
+    for page in reader.pages[:max_paginas]:
+        texto_completo += page.extract_text() + "\n"
+    return texto_completo
+
+
+def es_xml_cfdi(contenido):
+    """True si los bytes parecen un CFDI (Comprobante con el namespace del SAT), sin parsearlos"""
+    inicio = contenido[:8192].lstrip(b'\xef\xbb\xbf \t\r\n')
+    return inicio.startswith(b'<') and b'Comprobante' in inicio and b'www.sat.gob.mx/cfd/' in inicio
+
+
+def _objeto(valor):
+    """Resuelve las referencias indirectas de PyPDF2"""
+    return valor.get_object() if hasattr(valor, 'get_object') else valor
+
+
+def xmls_adjuntos_pdf(pdf_content):
+    """
+    XMLs de CFDI adjuntos al PDF (árbol /EmbeddedFiles del catálogo): [(nombre, contenido), ...]
+    Solo lee la estructura del PDF, no el contenido de las páginas
+    """
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(abrir_pdf(pdf_content))
+    nombres = _objeto(_objeto(reader.trailer['/Root']).get('/Names'))
+    arbol = _objeto(nombres.get('/EmbeddedFiles')) if nombres else None
+
+    adjuntos = []
+    pendientes = [arbol] if arbol else []
+    while pendientes:
+        nodo = _objeto(pendientes.pop())
+        pendientes.extend(_objeto(nodo.get('/Kids', [])))
+
+        hojas = _objeto(nodo.get('/Names', []))
+        for nombre, especificacion in zip(hojas[::2], hojas[1::2]):
+            especificacion = _objeto(especificacion)
+            archivos = _objeto(especificacion.get('/EF', {}))
+            archivo = archivos.get('/UF') or archivos.get('/F')
+            if archivo is None:
+                continue
+
+            contenido = _objeto(archivo).get_data()
+            if es_xml_cfdi(contenido):
+                adjuntos.append((str(especificacion.get('/UF', nombre)), contenido))
+
+    return adjuntos
+
+
+# Nivel que resolvió cada PDF, en el orden en que se intentan
+NIVEL_XML = 'XML adjunto al PDF'
+NIVEL_TEXTO = 'capa de texto (PyPDF2)'
+NIVEL_TABLAS = 'texto y tablas (pdfplumber)'
+NIVEL_INCOMPLETO = 'sin descripción o folio'
+NIVEL_TIEMPO_EXCEDIDO = 'tiempo excedido'
+
+
+class EstadisticasNivelesPDF:
+    """Cuántos PDFs resolvió cada nivel de lectura y cuánto tiempo tomó"""
+
+    def __init__(self):
+        self.conteos = {}
+        self.segundos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nivel, segundos):
+        with self._lock:
+            self.conteos[nivel] = self.conteos.get(nivel, 0) + 1
+            self.segundos[nivel] = self.segundos.get(nivel, 0.0) + segundos
+
+    def resumen(self):
+        """Texto con el conteo, porcentaje y tiempo promedio de cada nivel"""
+        total = sum(self.conteos.values())
+        if total == 0:
+            return "   - Sin PDFs leídos"
+
+        lineas = []
+        for nivel in (NIVEL_XML, NIVEL_TEXTO, NIVEL_TABLAS, NIVEL_INCOMPLETO, NIVEL_TIEMPO_EXCEDIDO):
+            conteo = self.conteos.get(nivel, 0)
+            if conteo:
+                promedio = self.segundos[nivel] / conteo
+                lineas.append(f"   - {nivel}: {conteo} ({conteo / total * 100:.1f}%), {promedio:.2f} s promedio")
+        return "\n".join(lineas)
+
+
+class TiempoExcedidoPDF(Exception):
+    """El PDF tardó más que el tiempo máximo por documento"""
+
+
+class LecturaLocalPDF:
+    """
+    Misma interfaz que DocumentoPDF, pero lee en el hilo que llama (sin pool ni tiempo máximo)
+    """
+
+    def __init__(self, max_paginas=None):
+        self.max_paginas = max_paginas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def ejecutar(self, funcion, *args):
+        return funcion(*args)
+
+    def paginas(self, pdf_content):
+        return iterar_paginas_pdf(pdf_content, max_paginas=self.max_paginas)
+
+
+class DocumentoPDF:
+    """
+    Lectura de un documento en el pool, en todos sus niveles (XML adjunto, capa de texto,
+    páginas): ocupa un proceso de principio a fin y todas las llamadas comparten un solo
+    tiempo máximo, así un PDF problemático no puede tardar más que timeout en total
+    Se usa como `with pool.documento() as documento:`
+    """
+
+    def __init__(self, pool, max_paginas=None):
+        self.pool = pool
+        self.max_paginas = max_paginas
+        self.limite = None
+
+    def __enter__(self):
+        # El tiempo máximo empieza cuando hay un proceso libre, no incluye la espera en la cola
+        self.pool._cupos.acquire()
+        self.limite = time.monotonic() + self.pool.timeout
+        return self
+
+    def __exit__(self, *exc):
+        self.pool._cupos.release()
+        return False
+
+    def ejecutar(self, funcion, *args):
+        """Ejecuta funcion(*args) en el pool con el tiempo que le queda al documento"""
+        return self.pool._ejecutar(funcion, args, self.limite)
+
+    def paginas(self, pdf_content):
+        """
+        Genera (texto, tablas) página por página; las páginas se leen en el pool por lotes que
+        duplican su tamaño (1, 2, 4...), así un PDF de N páginas se envía y se abre unas log2(N)
+        veces y quien itera casi nunca hace leer páginas que no necesita
+        """
+        desde = 0
+        tamano_lote = 1
+
+        while self.max_paginas is None or desde < self.max_paginas:
+            hasta = desde + tamano_lote
+            if self.max_paginas is not None:
+                hasta = min(hasta, self.max_paginas)
+
+            paginas = self.ejecutar(extraer_paginas_pdf, pdf_content, desde, hasta)
+            yield from paginas
+
+            if len(paginas) < hasta - desde:
+                return
+            desde = hasta
+            tamano_lote *= 2
+
+
+class PoolPDF:
+    """
+    Pool de procesos para leer PDFs fuera de los hilos de descarga
+    Cada documento tiene un tiempo máximo: si se excede, se matan los procesos del pool y se
+    crea uno nuevo (los documentos que estaban en curso en otros procesos se reintentan)
+    """
+
+    def __init__(self, procesos=2, timeout=60):
+        self.procesos = max(1, procesos)
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._generacion = 0
+
+        # Solo se envía un documento cuando hay un proceso libre, así el tiempo máximo
+        # no incluye la espera en la cola
+        self._cupos = threading.BoundedSemaphore(self.procesos)
+
+    def _pool_actual(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: los procesos no heredan los hilos ni los locks del proceso principal
+                contexto = multiprocessing.get_context('spawn')
+                self._pool = contexto.Pool(self.procesos)
+            return self._pool, self._generacion
+
+    def _reiniciar(self, generacion):
+        """Mata los procesos del pool (si nadie lo reinició ya); el siguiente uso crea otro"""
+        with self._lock:
+            if self._generacion != generacion or self._pool is None:
+                return
+            self._pool.terminate()
+            self._pool = None
+            self._generacion += 1
+
+    def documento(self, max_paginas=None):
+        """Contexto para leer un documento con un solo tiempo máximo (ver DocumentoPDF)"""
+        return DocumentoPDF(self, max_paginas)
+
+    def _ejecutar(self, funcion, args, limite):
+        """
+        Ejecuta funcion(*args) en el pool (quien llama ya tiene un cupo) y devuelve su resultado
+        Lanza TiempoExcedidoPDF si no termina antes de limite (time.monotonic)
+        """
+        for _ in range(2):
+            if limite - time.monotonic() <= 0:
+                raise TiempoExcedidoPDF(f"más de {self.timeout} s")
+
+            pool, generacion = self._pool_actual()
+            try:
+                pendiente = pool.apply_async(funcion, args)
+            except ValueError:
+                # Otro documento reinició el pool entre _pool_actual y el envío: se reintenta en el nuevo
+                if self._generacion == generacion:
+                    raise
+                continue
+
+            while True:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._reiniciar(generacion)
+                    raise TiempoExcedidoPDF(f"más de {self.timeout} s")
+
+                try:
+                    return pendiente.get(timeout=min(restante, 0.5))
+                except multiprocessing.TimeoutError:
+                    # Otro documento reinició el pool: este se perdió y se reintenta
+                    if self._generacion != generacion:
+                        break
+
+        raise TiempoExcedidoPDF("el pool se reinició durante el proceso")
+
+    def ejecutar(self, funcion, *args):
+        """
+        Ejecuta funcion(*args) en el pool como un documento de una sola llamada
+        Lanza TiempoExcedidoPDF si tarda más que el tiempo máximo del pool
+        """
+        with self.documento() as documento:
+            return documento.ejecutar(funcion, *args)
+
+    def paginas(self, pdf_content, max_paginas=None):
+        """
+        Genera (texto, tablas) página por página, leyendo cada una en el pool solo cuando se pide
+        El tiempo máximo cuenta para el documento completo, no por página
+        """
+        with self.documento(max_paginas) as documento:
+            yield from documento.paginas(pdf_content)
+
+    def cerrar(self):
+        """Termina los procesos del pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None